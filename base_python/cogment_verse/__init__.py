@@ -13,5 +13,7 @@
 # limitations under the License.
 
 from cogment_verse.agent_adapter import AgentAdapter
+from cogment_verse.flat_tensors import is_flat_tensors, load_flat_tensors, save_flat_tensors
 from cogment_verse.mlflow_experiment_tracker import MlflowExperimentTracker
 from cogment_verse.run import RunContext
+from cogment_verse.run import TrialConfigTemplate
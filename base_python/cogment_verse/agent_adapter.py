@@ -13,9 +13,13 @@
 # limitations under the License.
 
 import abc
+import asyncio
+import copy
+import io
 import logging
 
-from cogment_verse.utils import LRU, get_full_class_name
+from cogment_verse.model_version_codec import compress, decompress, delta_decode, delta_encode
+from cogment_verse.utils import Cache, get_full_class_name
 
 log = logging.getLogger(__name__)
 
@@ -23,12 +27,34 @@ log = logging.getLogger(__name__)
 class AgentAdapter(abc.ABC):
     MODEL_USER_DATA_ADAPTER_CLASS_NAME_KEY = "_source_adapter_class_name"
     VERSION_USER_DATA_MODEL_CLASS_NAME_KEY = "_model_class_name"
+    VERSION_USER_DATA_CODEC_KEY = "_codec"
+    VERSION_USER_DATA_DELTA_BASE_VERSION_NUMBER_KEY = "_delta_base_version_number"
 
-    def __init__(self):
+    def __init__(
+        self, max_in_flight_publications=1, version_codec=None, delta_keyframe_interval=0, cache_max_bytes=1024**3
+    ):
         """
         Create an agent adapter
+        Parameters:
+            max_in_flight_publications (int - default is 1): Maximum number of versions published in the background at
+                the same time, cf. `publish_version_in_background`
+            version_codec (string - optional): Compression codec of the published versions, "zlib", "zstd" or "lz4",
+                cf. `model_version_codec.py`
+            delta_keyframe_interval (int - default is 0): If positive, published versions are delta-encoded against
+                the last full version ("keyframe") published by this adapter, a new keyframe being published every
+                `delta_keyframe_interval` versions. Keyframes are always archived
+            cache_max_bytes (int - default is 1GB): Memory budget of the models and of the keyframes cached by the
+                adapter, each
         """
-        self._model_cache = LRU()
+        self._model_cache = Cache("agent_adapter_models", max_bytes=cache_max_bytes)
+        self._max_in_flight_publications = max_in_flight_publications
+        self._in_flight_publications = set()
+        self._version_codec = version_codec
+        self._delta_keyframe_interval = delta_keyframe_interval
+        # Last published keyframe of each model: [version_number, data, number of versions published since]
+        self._delta_keyframes = {}
+        # Decoded data of the keyframes needed to load delta-encoded versions
+        self._keyframe_data_cache = Cache("agent_adapter_keyframes", max_bytes=cache_max_bytes)
         self._adapter_class_name = get_full_class_name(self)
 
         def default_get_model_registry_client():
@@ -105,6 +131,61 @@ class AgentAdapter(abc.ABC):
 
         return version_user_data
 
+    def __encode_and_save(self, model_id, encoding, model, model_user_data, model_data_f, **kwargs):
+        if self._version_codec is None and self._delta_keyframe_interval <= 0:
+            return self.__save(model, model_user_data, model_data_f, **kwargs)
+
+        with io.BytesIO() as raw_model_data_f:
+            version_user_data = self.__save(model, model_user_data, raw_model_data_f, **kwargs)
+            data = raw_model_data_f.getvalue()
+        encoding["data"] = data
+
+        if encoding["delta"]:
+            keyframe = self._delta_keyframes[model_id]
+            data = delta_encode(data, keyframe[1])
+            version_user_data[self.VERSION_USER_DATA_DELTA_BASE_VERSION_NUMBER_KEY] = keyframe[0]
+        if self._version_codec is not None:
+            data = compress(self._version_codec, data)
+            version_user_data[self.VERSION_USER_DATA_CODEC_KEY] = self._version_codec
+
+        model_data_f.write(data)
+        return version_user_data
+
+    async def __retrieve_keyframe_data(self, model_id, version_number):
+        cache_key = f"{model_id}@v{version_number}"
+        keyframe_data = self._keyframe_data_cache.get(cache_key)
+        if keyframe_data is None:
+            data, version_info = await self.get_model_registry_client().retrieve_version_data(model_id, version_number)
+            codec = version_info["user_data"].get(self.VERSION_USER_DATA_CODEC_KEY)
+            keyframe_data = decompress(codec, data) if codec is not None else bytes(data)
+            self._keyframe_data_cache[cache_key] = keyframe_data
+        return keyframe_data
+
+    async def __decode_and_load(
+        self, model_id, version_number, model_user_data, version_user_data, model_data_f, **kwargs
+    ):
+        codec = version_user_data.get(self.VERSION_USER_DATA_CODEC_KEY)
+        delta_base_version_number = version_user_data.get(self.VERSION_USER_DATA_DELTA_BASE_VERSION_NUMBER_KEY)
+        if codec is not None or delta_base_version_number is not None:
+            data = model_data_f.read()
+            if codec is not None:
+                data = decompress(codec, data)
+            if delta_base_version_number is not None:
+                data = delta_decode(data, await self.__retrieve_keyframe_data(model_id, int(delta_base_version_number)))
+            model_data_f = io.BytesIO(data)
+
+        return self.__load(model_id, version_number, model_user_data, version_user_data, model_data_f, **kwargs)
+
+    def _snapshot(self, model):
+        """
+        Copy a model, the copy being unaffected by further training of the model
+        Args:
+            model: a model, as returned by the _create method of this class
+        Returns:
+            model: the copy of the model, to be saved in the background
+        """
+        return copy.deepcopy(model)
+
     async def create_and_publish_initial_version(self, model_id, **kwargs):
         """
         Create and publish to the model registry a model instance
@@ -135,21 +216,81 @@ class AgentAdapter(abc.ABC):
         Returns:
             version_info: information for the initial published version
         """
-        return await self.get_model_registry_client().publish_version(
-            model_id=model_id, model=model, save_model=self.__save, archived=archived, **kwargs
+        keyframe = self._delta_keyframes.get(model_id)
+        encoding = {
+            "delta": (
+                self._delta_keyframe_interval > 0
+                and keyframe is not None
+                and keyframe[2] < self._delta_keyframe_interval
+            )
+        }
+        if self._delta_keyframe_interval > 0 and not encoding["delta"]:
+            # Keyframes are archived, non-archived versions can be evicted by the registry and the delta-encoded
+            # versions would then be impossible to load
+            archived = True
+
+        def save_model(model, model_user_data, model_data_f, **kwargs):
+            return self.__encode_and_save(model_id, encoding, model, model_user_data, model_data_f, **kwargs)
+
+        version_info = await self.get_model_registry_client().publish_version(
+            model_id=model_id, model=model, save_model=save_model, archived=archived, **kwargs
+        )
+
+        if self._delta_keyframe_interval > 0:
+            if encoding["delta"]:
+                self._delta_keyframes[model_id][2] += 1
+            else:
+                self._delta_keyframes[model_id] = [version_info["version_number"], encoding["data"], 0]
+                self._keyframe_data_cache[f"{model_id}@v{version_info['version_number']}"] = encoding["data"]
+
+        return version_info
+
+    async def publish_version_in_background(self, model_id, model, archived=False, **kwargs):
+        """
+        Publish to the model registry a new version of a model, in the background, letting the training continue
+        Parameters:
+            model_id (string): unique identifier for the model
+            model: a model, as returned by method of this class, a snapshot of it is published
+            archive (bool - default is False): If true, the model version will be archived (i.e. stored in permanent storage)
+        Returns:
+            publication (asyncio.Task): the publication, resolving to the information of the published version
+        """
+        # Waiting for previous publications to keep the number of snapshots bounded
+        while len(self._in_flight_publications) >= self._max_in_flight_publications:
+            await asyncio.wait(list(self._in_flight_publications), return_when=asyncio.FIRST_COMPLETED)
+
+        publication = asyncio.create_task(
+            self.publish_version(model_id, self._snapshot(model), archived=archived, **kwargs)
         )
+        self._in_flight_publications.add(publication)
+        publication.add_done_callback(self._in_flight_publications.discard)
+        return publication
 
-    async def retrieve_version(self, model_id, version_number=-1, **kwargs):
+    async def wait_for_publications(self):
+        """
+        Wait for the in-flight background publications to be done
+        """
+        if self._in_flight_publications:
+            await asyncio.wait(list(self._in_flight_publications))
+
+    async def retrieve_version(self, model_id, version_number=-1, subscribe=False, **kwargs):
         """
         Publish to the model registry a new version of a model
         Parameters:
             model_id (string): Unique id of the model
             version_number (int - default is -1): The version number (-1 for the latest)
+            subscribe (bool - default is False): If true and retrieving the latest version, the latest version is
+                prefetched in the background from then on and resolved without requests to the model registry
         Returns:
             model, model_info, version_info: A tuple containing the model, the model info and the model version info
         """
-        return await self.get_model_registry_client().retrieve_version(
-            model_id=model_id, load_model=self.__load, version_number=version_number, **kwargs
+        model_registry_client = self.get_model_registry_client()
+        if subscribe and version_number == -1:
+            model_registry_client.subscribe_to_latest_version(
+                model_id=model_id, load_model=self.__decode_and_load, **kwargs
+            )
+        return await model_registry_client.retrieve_version(
+            model_id=model_id, load_model=self.__decode_and_load, version_number=version_number, **kwargs
         )
 
     @abc.abstractmethod
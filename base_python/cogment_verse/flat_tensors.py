@@ -0,0 +1,123 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import mmap
+import struct
+
+import numpy as np
+
+# Flat tensors container layout:
+# - the magic bytes,
+# - the byte size of the header, as a little endian uint64,
+# - the utf-8 encoded JSON header, describing the tensors and holding free form metadata,
+# - the raw tensors, in C order, each aligned on `FLAT_TENSORS_ALIGNMENT` bytes from the start of the container.
+# Raw tensors can be used in place, e.g. from a memory map of the container shared by several processes.
+FLAT_TENSORS_MAGIC = b"CVFLTNS1"
+FLAT_TENSORS_ALIGNMENT = 64
+
+_HEADER_SIZE_STRUCT = struct.Struct("<Q")
+
+
+def _align(offset):
+    return -(-offset // FLAT_TENSORS_ALIGNMENT) * FLAT_TENSORS_ALIGNMENT
+
+
+def _get_buffer(model_data_f):
+    # Memory maps and in-memory files are viewed in place, other files are read
+    if isinstance(model_data_f, mmap.mmap):
+        return memoryview(model_data_f)[model_data_f.tell() :]
+    if hasattr(model_data_f, "getbuffer"):
+        return model_data_f.getbuffer()[model_data_f.tell() :]
+    return memoryview(model_data_f.read())
+
+
+def save_flat_tensors(tensors, model_data_f, metadata=None):
+    """
+    Save named tensors in the flat tensors container format
+
+    Parameters:
+        tensors (dict[str, numpy.ndarray]): The named tensors
+        model_data_f: The file object the container is written to
+        metadata (dict - optional): JSON serializable metadata saved alongside the tensors
+    """
+    arrays = {name: np.ascontiguousarray(tensor) for name, tensor in tensors.items()}
+
+    tensors_header = {}
+    tensors_size = 0
+    for name, array in arrays.items():
+        offset = _align(tensors_size)
+        tensors_header[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        tensors_size = offset + array.nbytes
+
+    header = json.dumps({"tensors": tensors_header, "metadata": metadata or {}}).encode("utf-8")
+    data_offset = _align(len(FLAT_TENSORS_MAGIC) + _HEADER_SIZE_STRUCT.size + len(header))
+
+    model_data_f.write(FLAT_TENSORS_MAGIC)
+    model_data_f.write(_HEADER_SIZE_STRUCT.pack(len(header)))
+    model_data_f.write(header)
+    position = len(FLAT_TENSORS_MAGIC) + _HEADER_SIZE_STRUCT.size + len(header)
+    for name, array in arrays.items():
+        offset = data_offset + tensors_header[name]["offset"]
+        model_data_f.write(bytes(offset - position))
+        model_data_f.write(array.reshape(-1).view(np.uint8).data)
+        position = offset + array.nbytes
+
+
+def is_flat_tensors(model_data_f):
+    """
+    Check, without consuming it, if a file object holds a flat tensors container
+
+    Parameters:
+        model_data_f: A seekable file object
+    Returns:
+        is_flat_tensors (bool): True if the file object starts with the flat tensors magic bytes
+    """
+    position = model_data_f.tell()
+    magic = model_data_f.read(len(FLAT_TENSORS_MAGIC))
+    model_data_f.seek(position)
+    return magic == FLAT_TENSORS_MAGIC
+
+
+def load_flat_tensors(model_data_f):
+    """
+    Load named tensors from a flat tensors container
+
+    When `model_data_f` is a memory map or an in-memory file, the returned arrays are views on its data, no copy is made.
+    Arrays viewing a read-only memory map are read-only.
+
+    Parameters:
+        model_data_f: The file object the container is read from
+    Returns:
+        tensors (dict[str, numpy.ndarray]): The named tensors
+        metadata (dict): The metadata saved alongside the tensors
+    """
+    buffer = _get_buffer(model_data_f)
+
+    if bytes(buffer[: len(FLAT_TENSORS_MAGIC)]) != FLAT_TENSORS_MAGIC:
+        raise ValueError("Not a flat tensors container")
+    header_offset = len(FLAT_TENSORS_MAGIC) + _HEADER_SIZE_STRUCT.size
+    (header_size,) = _HEADER_SIZE_STRUCT.unpack(buffer[len(FLAT_TENSORS_MAGIC) : header_offset])
+    header = json.loads(bytes(buffer[header_offset : header_offset + header_size]).decode("utf-8"))
+    data_offset = _align(header_offset + header_size)
+
+    tensors = {}
+    for name, tensor_header in header["tensors"].items():
+        dtype = np.dtype(tensor_header["dtype"])
+        shape = tuple(tensor_header["shape"])
+        tensors[name] = np.frombuffer(
+            buffer, dtype=dtype, count=int(np.prod(shape)), offset=data_offset + tensor_header["offset"]
+        ).reshape(shape)
+
+    return tensors, header["metadata"]
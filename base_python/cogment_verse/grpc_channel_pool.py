@@ -0,0 +1,90 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+
+import grpc.aio
+from prometheus_client import Counter
+
+GRPC_CHANNEL_POOL_CHANNELS_COUNTER = Counter(
+    "grpc_channel_pool_channels", "Counter of the channels created by the gRPC channel pools", ["endpoint"]
+)
+
+log = logging.getLogger(__name__)
+
+
+class GrpcChannelPool:
+    """
+    Long-lived gRPC channels, one per endpoint, shared by the clients of the services.
+
+    gRPC channels multiplex concurrent calls over a single HTTP/2 connection and reconnect transparently, reusing them
+    avoids paying for a connection setup on every client creation.
+    """
+
+    def __init__(
+        self,
+        keepalive_time_ms=None,
+        keepalive_timeout_ms=20000,
+        keepalive_permit_without_calls=False,
+        max_message_length=None,
+    ):
+        """
+        Parameters:
+            keepalive_time_ms (int - optional): Period of the keepalive pings sent on the channels, by default no pings
+                are sent. The servers must allow pings at this rate, gRPC servers answer pings more frequent than every
+                5 minutes with a GOAWAY by default
+            keepalive_timeout_ms (int - default is 20s): Delay after which a connection is closed if a keepalive ping
+                is not acknowledged
+            keepalive_permit_without_calls (bool - default is False): If true, keepalive pings are also sent when there
+                are no calls in progress, the servers must allow it
+            max_message_length (int - optional): Maximum size of the sent and received messages, by default gRPC's
+        """
+        self._options = []
+        if keepalive_time_ms is not None:
+            self._options.extend(
+                [
+                    ("grpc.keepalive_time_ms", keepalive_time_ms),
+                    ("grpc.keepalive_timeout_ms", keepalive_timeout_ms),
+                    ("grpc.keepalive_permit_without_calls", int(keepalive_permit_without_calls)),
+                ]
+            )
+        if max_message_length is not None:
+            self._options.extend(
+                [
+                    ("grpc.max_send_message_length", max_message_length),
+                    ("grpc.max_receive_message_length", max_message_length),
+                ]
+            )
+        self._channels = {}
+
+    def get(self, endpoint):
+        """
+        Parameters:
+            endpoint (string): The endpoint of the service, e.g. "localhost:9002"
+        Returns:
+            channel (grpc.aio.Channel): The channel to the endpoint, created on the first call
+        """
+        channel = self._channels.get(endpoint)
+        if channel is None:
+            log.debug(f"Creating a gRPC channel to [{endpoint}]")
+            GRPC_CHANNEL_POOL_CHANNELS_COUNTER.labels(endpoint=endpoint).inc()
+            channel = grpc.aio.insecure_channel(endpoint, options=self._options)
+            self._channels[endpoint] = channel
+        return channel
+
+    async def close(self):
+        channels = list(self._channels.values())
+        self._channels = {}
+        for channel in channels:
+            await channel.close()
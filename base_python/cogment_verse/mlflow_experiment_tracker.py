@@ -16,6 +16,7 @@ import asyncio
 import logging
 import numbers
 import os
+import threading
 
 from google.protobuf.json_format import MessageToDict
 from google.protobuf.message import Message
@@ -33,8 +34,12 @@ EXPERIMENT_TRACKER_LOG_METRICS_TIME = Summary(
 EXPERIMENT_TRACKER_METRICS_LOGGED_COUNTER = Counter(
     "experiment_tracker_metrics_logged", "Counter of individual logged metrics"
 )
+EXPERIMENT_TRACKER_METRICS_DROPPED_COUNTER = Counter(
+    "experiment_tracker_metrics_dropped", "Counter of logged metrics dropped because the buffer was full"
+)
 
 MAX_METRICS_BATCH_SIZE = 1000  # MLFlow only accepts at most 1000 metrics per batch
+DEFAULT_MAX_BUFFERED_METRICS = 100000
 
 MLFLOW_TRACKING_URI = os.getenv("MLFLOW_TRACKING_URI")
 
@@ -59,15 +64,59 @@ def make_dict(ignore_non_numbers, *args, **kwargs):
 
 
 class MlflowExperimentTracker:
-    def __init__(self, experiment_id, run_id, flush_frequency=5):
+    """
+    Log the params and metrics of a run to mlflow.
+
+    Logged params and metrics are buffered and uploaded by a background thread every `flush_frequency` seconds, only
+    the termination of the run, which is awaitable, waits for the last upload.
+
+    High-frequency metrics, e.g. per-trial rewards, can be aggregated: each upload then includes, for every such
+    metric `key` logged since the previous one, its mean as `key` along with `key_min`, `key_max` and `key_count`, at
+    the last step it was logged. The cost of their tracking is thus independent of the rate at which they are logged.
+    """
+
+    def __init__(
+        self,
+        experiment_id,
+        run_id,
+        flush_frequency=5,
+        aggregated_metrics=(),
+        max_buffered_metrics=DEFAULT_MAX_BUFFERED_METRICS,
+        terminate_timeout=30,
+    ):
+        """
+        Parameters:
+            experiment_id (string): Name of the mlflow experiment
+            run_id (string): Name of the mlflow run
+            flush_frequency (float - default is 5): Period, in seconds, of the uploads to mlflow
+            aggregated_metrics (list[str] - default is empty): Keys of the metrics aggregated between uploads, the other
+                metrics are uploaded as logged
+            max_buffered_metrics (int - default is 100000): Maximum number of logged metrics waiting to be uploaded,
+                the oldest ones are dropped when it is reached, e.g. while mlflow is unreachable
+            terminate_timeout (float - default is 30): Maximum time, in seconds, the termination of the run waits for
+                the last upload
+        """
         self._experiment_id = experiment_id
         self._run_id = run_id
         self._mlflow_exp_id = None
         self._mlflow_run_id = None
-        self._metrics_buffer = []
         self._flush_metrics_worker_frequency = flush_frequency
+        self._aggregated_metrics = frozenset(aggregated_metrics)
+        self._max_buffered_metrics = max_buffered_metrics
+        self._terminate_timeout = terminate_timeout
+
+        # Shared with the worker thread, guarded by `_lock`
+        self._lock = threading.Lock()
+        self._metrics_buffer = []
+        self._params_buffer = []
+        self._terminated_status = None
+        self._flush_requested = threading.Event()
         self._flush_metrics_worker = None
 
+        # Owned by the worker thread
+        self._unsent_params = []
+        self._unsent_metrics = []
+
     def _get_mlflow_client(self):
         # This is automagically configured by the environment variable MLFLOW_TRACKING_URI
         client = MlflowClient()
@@ -86,67 +135,133 @@ class MlflowExperimentTracker:
 
         return client
 
+    @staticmethod
+    def _aggregate(metrics):
+        # key => [sum, min, max, count, last timestamp, last step]
+        aggregates = {}
+        for metric in metrics:
+            aggregate = aggregates.get(metric.key)
+            if aggregate is None:
+                aggregates[metric.key] = [metric.value, metric.value, metric.value, 1, metric.timestamp, metric.step]
+                continue
+            aggregate[0] += metric.value
+            aggregate[1] = min(aggregate[1], metric.value)
+            aggregate[2] = max(aggregate[2], metric.value)
+            aggregate[3] += 1
+            if metric.step >= aggregate[5]:
+                aggregate[4] = metric.timestamp
+                aggregate[5] = metric.step
+
+        aggregated_metrics = []
+        for key, (total, minimum, maximum, count, timestamp, step) in aggregates.items():
+            aggregated_metrics.extend(
+                [
+                    Metric(key, total / count, timestamp, step),
+                    Metric(f"{key}_min", minimum, timestamp, step),
+                    Metric(f"{key}_max", maximum, timestamp, step),
+                    Metric(f"{key}_count", count, timestamp, step),
+                ]
+            )
+        return aggregated_metrics
+
     def _flush_metrics(self):
+        # Called from the worker thread, which owns the unsent params and metrics
+        with self._lock:
+            metrics = self._metrics_buffer
+            self._metrics_buffer = []
+            params = self._params_buffer
+            self._params_buffer = []
+
+        self._unsent_params.extend(params)
+        if self._aggregated_metrics:
+            self._unsent_metrics.extend(metric for metric in metrics if metric.key not in self._aggregated_metrics)
+            self._unsent_metrics.extend(
+                self._aggregate(metric for metric in metrics if metric.key in self._aggregated_metrics)
+            )
+        else:
+            self._unsent_metrics.extend(metrics)
+        dropped_count = len(self._unsent_metrics) - self._max_buffered_metrics
+        if dropped_count > 0:
+            EXPERIMENT_TRACKER_METRICS_DROPPED_COUNTER.inc(dropped_count)
+            self._unsent_metrics = self._unsent_metrics[dropped_count:]
+
         client = self._get_mlflow_client()
-        while len(self._metrics_buffer) > 0:
-            metrics_batch = self._metrics_buffer[:MAX_METRICS_BATCH_SIZE]
+        if len(self._unsent_params) > 0:
+            client.log_batch(run_id=self._mlflow_run_id, params=self._unsent_params)
+            self._unsent_params = []
+        while len(self._unsent_metrics) > 0:
+            metrics_batch = self._unsent_metrics[:MAX_METRICS_BATCH_SIZE]
             with EXPERIMENT_TRACKER_LOG_METRICS_TIME.time():
                 client.log_batch(
                     run_id=self._mlflow_run_id,
                     metrics=metrics_batch,
                 )
-            self._metrics_buffer = self._metrics_buffer[MAX_METRICS_BATCH_SIZE:]
+            self._unsent_metrics = self._unsent_metrics[MAX_METRICS_BATCH_SIZE:]
 
-    def _start_flush_metrics_worker(self):
-        if self._flush_metrics_worker is not None:
-            return
-
-        async def worker():
-            while True:
-                try:
-                    self._flush_metrics()
-                except asyncio.CancelledError as cancelled_error:
-                    # Raising cancellation
-                    raise cancelled_error
-                except Exception as err:
-                    log.warning(
-                        f"Error while sending metrics to mlflow server {MLFLOW_TRACKING_URI}. Will retry later in {self._flush_metrics_worker_frequency}s.",
-                        err,
+    def _flush_metrics_worker_loop(self):
+        while True:
+            self._flush_requested.wait(self._flush_metrics_worker_frequency)
+            self._flush_requested.clear()
+            with self._lock:
+                terminated_status = self._terminated_status
+            try:
+                self._flush_metrics()
+                if terminated_status is not None:
+                    self._get_mlflow_client().set_terminated(
+                        run_id=self._mlflow_run_id, status=RunStatus.to_string(terminated_status)
                     )
-                await asyncio.sleep(self._flush_metrics_worker_frequency)
-
-        self._flush_metrics_worker = asyncio.create_task(worker())
+                    return
+            except Exception as err:
+                log.warning(
+                    f"Error while sending metrics to mlflow server {MLFLOW_TRACKING_URI}. Will retry later in {self._flush_metrics_worker_frequency}s: {err}"
+                )
 
-    def _stop_flush_metrics_worker(self):
-        if self._flush_metrics_worker is not None:
-            self._flush_metrics_worker.cancel()
-            # We don't really need to await for the termination here
-            self._flush_metrics_worker = None
+    def _start_flush_metrics_worker(self):
+        with self._lock:
+            if self._flush_metrics_worker is not None:
+                return
+            # Daemon thread, the termination of the run waits for the last upload
+            self._flush_metrics_worker = threading.Thread(
+                target=self._flush_metrics_worker_loop, name=f"mlflow_experiment_tracker_{self._run_id}", daemon=True
+            )
+            self._flush_metrics_worker.start()
 
     def log_params(self, *args, **kwargs):
-
-        self._get_mlflow_client().log_batch(
-            run_id=self._mlflow_run_id,
-            params=[Param(key, str(value)) for key, value in make_dict(False, *args, **kwargs).items()],
-        )
+        params = [Param(key, str(value)) for key, value in make_dict(False, *args, **kwargs).items()]
+        with self._lock:
+            self._params_buffer.extend(params)
+        self._start_flush_metrics_worker()
+        self._flush_requested.set()
 
     def log_metrics(self, step_timestamp, step_idx, *args, **kwargs):
         EXPERIMENT_TRACKER_METRICS_LOGGED_COUNTER.inc(len(kwargs))
-        self._metrics_buffer.extend(
-            [Metric(key, value, step_timestamp, step_idx) for key, value in make_dict(True, *args, **kwargs).items()]
-        )
+        metrics = [
+            Metric(key, value, step_timestamp, step_idx) for key, value in make_dict(True, *args, **kwargs).items()
+        ]
+        with self._lock:
+            self._metrics_buffer.extend(metrics)
+            # Dropping the oldest metrics if the worker can't keep up
+            dropped_count = len(self._metrics_buffer) - self._max_buffered_metrics
+            if dropped_count > 0:
+                EXPERIMENT_TRACKER_METRICS_DROPPED_COUNTER.inc(dropped_count)
+                del self._metrics_buffer[:dropped_count]
         self._start_flush_metrics_worker()
 
-    def terminate_failure(self):
-        self._stop_flush_metrics_worker()
-        self._flush_metrics()
-        self._get_mlflow_client().set_terminated(
-            run_id=self._mlflow_run_id, status=RunStatus.to_string(RunStatus.FAILED)
-        )
-
-    def terminate_success(self):
-        self._stop_flush_metrics_worker()
-        self._flush_metrics()
-        self._get_mlflow_client().set_terminated(
-            run_id=self._mlflow_run_id, status=RunStatus.to_string(RunStatus.FINISHED)
-        )
+    async def _terminate(self, status):
+        # The last params and metrics are uploaded before the run is terminated
+        with self._lock:
+            self._terminated_status = status
+        self._start_flush_metrics_worker()
+        self._flush_requested.set()
+        # Waiting for the worker without blocking the event loop
+        await asyncio.get_running_loop().run_in_executor(None, self._flush_metrics_worker.join, self._terminate_timeout)
+        if self._flush_metrics_worker.is_alive():
+            log.warning(
+                f"Unable to terminate the run in mlflow server {MLFLOW_TRACKING_URI} in {self._terminate_timeout}s, last metrics might be lost"
+            )
+
+    async def terminate_failure(self):
+        await self._terminate(RunStatus.FAILED)
+
+    async def terminate_success(self):
+        await self._terminate(RunStatus.FINISHED)
@@ -13,8 +13,10 @@
 # limitations under the License.
 
 import asyncio
+import inspect
 import io
 import logging
+import mmap
 import time
 
 import grpc.aio
@@ -29,7 +31,7 @@ from cogment.api.model_registry_pb2 import (
     RetrieveVersionInfosRequest,
 )
 from cogment.api.model_registry_pb2_grpc import ModelRegistrySPStub
-from cogment_verse.utils import LRU
+from cogment_verse.utils import Cache, SingleFlight
 from prometheus_client import Summary
 
 
@@ -46,14 +48,113 @@ MODEL_REGISTRY_RETRIEVE_VERSION_TIME = Summary(
 
 log = logging.getLogger(__name__)
 
+# 2MB to keep under well under the GRPC 4MB, like the registry's
+# COGMENT_MODEL_REGISTRY_SENT_MODEL_VERSION_DATA_CHUNK_SIZE
+DEFAULT_VERSION_DATA_CHUNK_SIZE = 2 * 1024 * 1024
+DEFAULT_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+
+class LatestModelVersions:
+    """
+    Latest version of the subscribed models, polled in the background.
+
+    New versions are retrieved, and cached, before being known as the latest, to be shared along with the cache.
+    Subscriptions expire when the latest version of the model wasn't requested for `expiry_sec`.
+    """
+
+    def __init__(self, poll_period_sec=1.0, expiry_sec=300.0):
+        self._poll_period_sec = poll_period_sec
+        self._expiry_sec = expiry_sec
+        self._version_infos = {}
+        self._last_access_times = {}
+        self._poll_tasks = {}
+
+    def get(self, model_id):
+        version_info = self._version_infos.get(model_id)
+        if version_info is not None:
+            self._last_access_times[model_id] = time.time()
+        return version_info
+
+    def update(self, model_id, version_info):
+        # Only subscribed models are tracked, and versions are never rolled back
+        if model_id in self._poll_tasks and int(version_info["version_number"]) >= int(
+            self._version_infos.get(model_id, {}).get("version_number", -1)
+        ):
+            self._version_infos[model_id] = version_info
+
+    def subscribe(self, model_id, retrieve_latest_version):
+        """
+        Parameters:
+            model_id (string): Unique id of the model
+            retrieve_latest_version (f() -> dict): Retrieves and caches the latest version, returning its version info
+        """
+        self._last_access_times[model_id] = time.time()
+        if model_id in self._poll_tasks:
+            return
+        self._poll_tasks[model_id] = asyncio.create_task(self._poll(model_id, retrieve_latest_version))
+
+    async def _poll(self, model_id, retrieve_latest_version):
+        try:
+            while time.time() - self._last_access_times[model_id] < self._expiry_sec:
+                try:
+                    self.update(model_id, await retrieve_latest_version())
+                except asyncio.CancelledError:
+                    raise
+                except Exception as error:
+                    log.warning(f"Unable to retrieve the latest version of model [{model_id}]: {error}")
+                await asyncio.sleep(self._poll_period_sec)
+        finally:
+            self._unsubscribe(model_id)
+
+    def _unsubscribe(self, model_id):
+        self._poll_tasks.pop(model_id, None)
+        self._version_infos.pop(model_id, None)
+        self._last_access_times.pop(model_id, None)
+
+    async def close(self):
+        poll_tasks = list(self._poll_tasks.values())
+        for poll_task in poll_tasks:
+            poll_task.cancel()
+        await asyncio.gather(*poll_tasks, return_exceptions=True)
+
 
 class ModelRegistryClient:
-    def __init__(self, endpoint, cache=LRU()):
+    def __init__(
+        self,
+        endpoint,
+        cache=None,
+        version_data_chunk_size=DEFAULT_VERSION_DATA_CHUNK_SIZE,
+        single_flight=None,
+        latest_versions=None,
+        serialization_executor=None,
+        disk_cache=None,
+        channel=None,
+    ):
+        """
+        Parameters:
+            endpoint (string): The endpoint of the model registry
+            cache (Cache - optional): Cache of the model infos and of the deserialized model versions
+            version_data_chunk_size (int - optional): Size of the chunks of published version data
+            single_flight (SingleFlight - optional): Coalesces concurrent retrievals, to be shared along with the cache
+            latest_versions (LatestModelVersions - optional): Latest version of the subscribed models, to be shared
+                along with the cache
+            serialization_executor (concurrent.futures.Executor - optional): Executor in which the published models
+                are serialized, by default the event loop's default thread pool
+            disk_cache (ModelVersionDiskCache - optional): Persistent cache of the raw version data
+            channel (grpc.aio.Channel - optional): Channel to the model registry, e.g. from a `GrpcChannelPool`, by
+                default a new channel to `endpoint`
+        """
 
-        channel = grpc.aio.insecure_channel(endpoint)
+        if channel is None:
+            channel = grpc.aio.insecure_channel(endpoint)
         self._stub = ModelRegistrySPStub(channel)
 
-        self._cache = cache
+        self._cache = cache if cache is not None else Cache("model_registry", max_bytes=DEFAULT_CACHE_MAX_BYTES)
+        self._version_data_chunk_size = version_data_chunk_size
+        self._single_flight = single_flight if single_flight is not None else SingleFlight()
+        self._latest_versions = latest_versions if latest_versions is not None else LatestModelVersions()
+        self._serialization_executor = serialization_executor
+        self._disk_cache = disk_cache
 
     @staticmethod
     def _build_model_version_data_cache_key(data_hash):
@@ -94,20 +195,28 @@ class ModelRegistryClient:
         """
         cache_key = self._build_model_info_cache_key(model_id)
 
-        if cache_key not in self._cache:
-            req = RetrieveModelsRequest(model_ids=[model_id])
-            rep = await self._stub.RetrieveModels(req)
+        model_info = self._cache.get(cache_key)
+        if model_info is None:
+
+            async def retrieve():
+                req = RetrieveModelsRequest(model_ids=[model_id])
+                rep = await self._stub.RetrieveModels(req)
+
+                model_info = rep.model_infos[0]
 
-            model_info = rep.model_infos[0]
+                self._cache[cache_key] = model_info
+                return model_info
 
-            self._cache[cache_key] = model_info
+            model_info, _ = await self._single_flight.run(cache_key, retrieve)
 
-        return MessageToDict(self._cache[cache_key], preserving_proto_field_name=True)
+        return MessageToDict(model_info, preserving_proto_field_name=True)
 
     async def publish_version(self, model_id, model, save_model, archived=False, **kwargs):
         """
         Publish a new version of the model
 
+        The model is serialized in `serialization_executor`, it must not be modified until the publication is done.
+
         Parameters:
             model_id (string): Unique id of the model
             model (ModelT): The model
@@ -121,35 +230,67 @@ class ModelRegistryClient:
         model_info = await self.retrieve_model_info(model_id)
         model_user_data = model_info["user_data"]
 
-        def generate_chunks():
-            try:
-                with io.BytesIO() as model_data_io:
-                    version_user_data = save_model(model, model_user_data, model_data_io, **kwargs)
-                    version_data = model_data_io.getvalue()
-
-                version_info = ModelVersionInfo(model_id=model_id, archived=archived, data_size=len(version_data))
-                for key, value in version_user_data.items():
-                    version_info.user_data[key] = str(value)
+        def save_version():
+            model_data_io = io.BytesIO()
+            version_user_data = save_model(model, model_user_data, model_data_io, **kwargs)
+            return version_user_data, model_data_io
 
-                yield CreateVersionRequestChunk(header=CreateVersionRequestChunk.Header(version_info=version_info))
-
-                chunksize = 2 * 1024 * 1024  # 2MB to keep under well under the GRPC 4MB
-                while version_data:
-                    yield CreateVersionRequestChunk(
-                        body=CreateVersionRequestChunk.Body(data_chunk=version_data[:chunksize])
-                    )
-                    version_data = version_data[chunksize:]
+        def generate_chunks(version_user_data, model_data_io):
+            try:
+                # Chunks are sliced from a view of the serialized model, only copying each chunk once
+                with model_data_io.getbuffer() as version_data:
+                    version_info = ModelVersionInfo(model_id=model_id, archived=archived, data_size=len(version_data))
+                    for key, value in version_user_data.items():
+                        version_info.user_data[key] = str(value)
+
+                    yield CreateVersionRequestChunk(header=CreateVersionRequestChunk.Header(version_info=version_info))
+
+                    for offset in range(0, len(version_data), self._version_data_chunk_size):
+                        yield CreateVersionRequestChunk(
+                            body=CreateVersionRequestChunk.Body(
+                                data_chunk=bytes(version_data[offset : offset + self._version_data_chunk_size])
+                            )
+                        )
             except Exception as error:
                 log.error("Error while generating model version chunk", exc_info=error)
                 raise error
 
         with MODEL_REGISTRY_PUBLISH_VERSION_TIME.labels(model_id=model_id).time():
-            rep = await self._stub.CreateVersion(generate_chunks())
+            # The model is serialized in the executor to keep the event loop responsive
+            version_user_data, model_data_io = await asyncio.get_running_loop().run_in_executor(
+                self._serialization_executor, save_version
+            )
+            rep = await self._stub.CreateVersion(generate_chunks(version_user_data, model_data_io))
+
+        if self._disk_cache is not None:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._disk_cache.put, rep.version_info.data_hash, model_data_io.getbuffer()
+            )
 
         cache_key = self._build_model_version_data_cache_key(rep.version_info.data_hash)
         self._cache[cache_key] = model
 
-        return MessageToDict(rep.version_info, preserving_proto_field_name=True)
+        version_info = MessageToDict(rep.version_info, preserving_proto_field_name=True)
+        self._latest_versions.update(model_id, version_info)
+        return version_info
+
+    def subscribe_to_latest_version(self, model_id, load_model, **kwargs):
+        """
+        Keep track of the latest version of the model in the background, prefetching new versions in the cache.
+
+        Once the latest version is known, `retrieve_version(model_id, load_model, -1)` resolves it locally.
+
+        Parameters:
+            model_id (string): Unique id of the model
+            load_model (f(string, int, dict[str, str], dict[str, str], BinaryIO)): A function able to load the model
+            kwargs: any number of key/values parameters, forwarded to `load_model`
+        """
+
+        async def retrieve_latest_version():
+            _model, _model_info, version_info = await self._retrieve_version(model_id, load_model, -1, **kwargs)
+            return version_info
+
+        self._latest_versions.subscribe(model_id, retrieve_latest_version)
 
     async def retrieve_version(self, model_id, load_model, version_number=-1, **kwargs):
         """
@@ -157,41 +298,123 @@ class ModelRegistryClient:
 
         Parameters:
             model_id (string): Unique id of the model
-            load_model (f(string, int, dict[str, str], dict[str, str], BinaryIO)): A function able to load the model
+            load_model (f(string, int, dict[str, str], dict[str, str], BinaryIO)): A function, or coroutine function, able to load the model
             version_number (int - default is -1): The version number (-1 for the latest)
             kwargs: any number of key/values parameters, forwarded to `load_model`
         Returns
             model, model_info, version_info (ModelT, dict[str, str], dict[str, str]): A tuple containing the model version data, the model info and the model version info
         """
-        start_time = time.time()
+        if version_number == -1:
+            version_info = self._latest_versions.get(model_id)
+            if version_info is not None:
+                start_time = time.time()
+                cache_key = self._build_model_version_data_cache_key(version_info["data_hash"])
+                model_info_cache_key = self._build_model_info_cache_key(model_id)
+                model = self._cache.get(cache_key)
+                model_info = self._cache.get(model_info_cache_key)
+                if model is not None and model_info is not None:
+                    model_info = MessageToDict(model_info, preserving_proto_field_name=True)
+                    MODEL_REGISTRY_RETRIEVE_VERSION_TIME.labels(model_id=model_id, cached="subscribed").observe(
+                        time.time() - start_time
+                    )
+                    return model, model_info, version_info
 
-        # First retrieve the model info and model version info
-        async def retrieve_version_info(model_id, version_number):
+        return await self._retrieve_version(model_id, load_model, version_number, **kwargs)
+
+    async def _retrieve_version_info(self, model_id, version_number):
+        async def retrieve_version_info():
             req = RetrieveVersionInfosRequest(model_id=model_id, version_numbers=[version_number])
             rep = await self._stub.RetrieveVersionInfos(req)
             version_info_pb = rep.version_infos[0]
             version_info = MessageToDict(version_info_pb, preserving_proto_field_name=True)
             return version_info
 
+        # Concurrent retrievals of the same version, e.g. by actors of trials starting together, are coalesced
+        version_info, _ = await self._single_flight.run(
+            f"model_version_info_{model_id}_{version_number}", retrieve_version_info
+        )
+        return version_info
+
+    async def _retrieve_version_data(self, model_id, version_info):
+        req = RetrieveVersionDataRequest(model_id=model_id, version_number=version_info["version_number"])
+        # Chunks are reassembled in a buffer preallocated from the expected size
+        data = bytearray(int(version_info.get("data_size", 0)))
+        data_size = 0
+        async for chunk in self._stub.RetrieveVersionData(req):
+            data[data_size : data_size + len(chunk.data_chunk)] = chunk.data_chunk
+            data_size += len(chunk.data_chunk)
+        del data[data_size:]
+        return data
+
+    async def _retrieve_cached_version_data(self, model_id, version_info):
+        if self._disk_cache is not None:
+            data = self._disk_cache.get(version_info["data_hash"])
+            if data is not None:
+                return data
+
+        data = await self._retrieve_version_data(model_id, version_info)
+        if self._disk_cache is not None:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._disk_cache.put, version_info["data_hash"], data
+            )
+        return data
+
+    async def retrieve_version_data(self, model_id, version_number=-1):
+        """
+        Retrieve the raw data of a version of the model, without deserializing it
+
+        Parameters:
+            model_id (string): Unique id of the model
+            version_number (int - default is -1): The version number (-1 for the latest)
+        Returns
+            data, version_info (bytes-like, dict[str, str]): A tuple containing the model version data and the model version info
+        """
+        version_info = await self._retrieve_version_info(model_id, version_number)
+        return await self._retrieve_cached_version_data(model_id, version_info), version_info
+
+    async def _retrieve_version(self, model_id, load_model, version_number, **kwargs):
+        start_time = time.time()
+
+        # First retrieve the model info and model version info
         [model_info, version_info] = await asyncio.gather(
-            self.retrieve_model_info(model_id), retrieve_version_info(model_id, version_number)
+            self.retrieve_model_info(model_id), self._retrieve_version_info(model_id, version_number)
         )
 
         cache_key = self._build_model_version_data_cache_key(version_info["data_hash"])
-        cached = cache_key in self._cache
+        model = self._cache.get(cache_key)
+        cached = model is not None
 
         # Check if the model version data is already in memory, if not retrieve
         if not cached:
-            req = RetrieveVersionDataRequest(model_id=model_id, version_number=version_info["version_number"])
-            data = b""
-            async for chunk in self._stub.RetrieveVersionData(req):
-                data += chunk.data_chunk
 
-            model = load_model(
-                model_id, version_number, model_info["user_data"], version_info["user_data"], io.BytesIO(data), **kwargs
-            )
-            self._cache[cache_key] = model
+            async def retrieve_model():
+                data = await self._retrieve_cached_version_data(model_id, version_info)
+                # Memory maps from the disk cache are file-like
+                model_data_f = data if isinstance(data, mmap.mmap) else io.BytesIO(data)
+
+                model = load_model(
+                    model_id,
+                    version_number,
+                    model_info["user_data"],
+                    version_info["user_data"],
+                    model_data_f,
+                    **kwargs,
+                )
+                # Loading may need to retrieve other versions, e.g. for delta-encoded versions
+                if inspect.isawaitable(model):
+                    model = await model
+                try:
+                    model_data_f.close()
+                except BufferError:
+                    # The loaded model still references the data, it is released along with the model
+                    pass
+                self._cache[cache_key] = model
+                return model
+
+            model, coalesced = await self._single_flight.run(cache_key, retrieve_model)
+            if coalesced:
+                cached = "coalesced"
 
         MODEL_REGISTRY_RETRIEVE_VERSION_TIME.labels(model_id=model_id, cached=cached).observe(time.time() - start_time)
 
-        return self._cache[cache_key], model_info, version_info
+        return model, model_info, version_info
@@ -0,0 +1,90 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import zlib
+
+import numpy as np
+
+# `zstandard` and `lz4` are optional dependencies, cf. the `zstd` and `lz4` extras of the package. They are only
+# imported when their codec is used
+
+
+def _zstd():
+    try:
+        import zstandard  # pylint: disable=import-outside-toplevel
+    except ImportError as error:
+        raise RuntimeError("The 'zstd' codec requires the 'zstandard' package") from error
+    return zstandard
+
+
+def _lz4():
+    try:
+        import lz4.frame  # pylint: disable=import-outside-toplevel
+    except ImportError as error:
+        raise RuntimeError("The 'lz4' codec requires the 'lz4' package") from error
+    return lz4.frame
+
+
+COMPRESSION_CODECS = {
+    "zlib": (lambda data: zlib.compress(data, 1), zlib.decompress),
+    "zstd": (
+        lambda data: _zstd().ZstdCompressor(level=3).compress(data),
+        lambda data: _zstd().ZstdDecompressor().decompress(data),
+    ),
+    "lz4": (lambda data: _lz4().compress(data), lambda data: _lz4().decompress(data)),
+}
+
+
+def compress(codec, data):
+    """
+    Compress model version data
+
+    Parameters:
+        codec (string): The compression codec, one of `COMPRESSION_CODECS`
+        data (bytes-like): The data to compress
+    Returns:
+        compressed_data (bytes): The compressed data
+    """
+    if codec not in COMPRESSION_CODECS:
+        raise ValueError(f"Unknown compression codec [{codec}], expected one of {sorted(COMPRESSION_CODECS.keys())}")
+    return COMPRESSION_CODECS[codec][0](data)
+
+
+def decompress(codec, compressed_data):
+    if codec not in COMPRESSION_CODECS:
+        raise ValueError(f"Unknown compression codec [{codec}], expected one of {sorted(COMPRESSION_CODECS.keys())}")
+    return COMPRESSION_CODECS[codec][1](compressed_data)
+
+
+def delta_encode(data, base_data):
+    """
+    Encode model version data as its bytewise XOR with the data of a base version.
+
+    Bytes left unchanged since the base version are encoded as zeros, which compress well. The encoding is its own
+    inverse: `delta_encode(delta_encode(data, base_data), base_data) == data`.
+
+    Parameters:
+        data (bytes-like): The data to encode
+        base_data (bytes-like): The data of the base version
+    Returns:
+        delta (bytearray): The encoded data, having the size of `data`
+    """
+    delta = bytearray(data)
+    common_size = min(len(delta), len(base_data))
+    delta_array = np.frombuffer(delta, dtype=np.uint8, count=common_size)
+    np.bitwise_xor(delta_array, np.frombuffer(base_data, dtype=np.uint8, count=common_size), out=delta_array)
+    return delta
+
+
+delta_decode = delta_encode
@@ -0,0 +1,140 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import logging
+import mmap
+import os
+import tempfile
+import time
+
+from prometheus_client import Counter, Gauge
+
+log = logging.getLogger(__name__)
+
+MODEL_VERSION_DISK_CACHE_HITS_COUNTER = Counter(
+    "model_version_disk_cache_hits", "Counter of the model versions read from the disk cache"
+)
+MODEL_VERSION_DISK_CACHE_MISSES_COUNTER = Counter(
+    "model_version_disk_cache_misses", "Counter of the model versions not found in the disk cache"
+)
+MODEL_VERSION_DISK_CACHE_BYTES = Gauge("model_version_disk_cache_bytes", "Size of the model versions in the disk cache")
+
+MODEL_VERSION_FILE_SUFFIX = ".version"
+TEMP_FILE_SUFFIX = ".tmp"
+
+
+class ModelVersionDiskCache:
+    """
+    Size-capped cache of the raw data of model versions on the local disk, keyed by data hash.
+
+    Entries are written atomically and read through read-only memory maps, several processes can share the same
+    directory. The least recently read entries are evicted, based on the modification time of the files which is
+    refreshed when they are read. Temporary files left by crashed writers are removed once stale.
+    """
+
+    def __init__(self, cache_dir, max_bytes=10 * 1024**3, stale_temp_file_age_sec=300.0):
+        """
+        Parameters:
+            cache_dir (string): The cache directory, created if needed
+            max_bytes (int - default is 10GB): The maximum total size of the cached versions
+            stale_temp_file_age_sec (float - default is 5min): Age after which a temporary file is considered left by
+                a crashed writer and removed
+        """
+        self._cache_dir = cache_dir
+        self._max_bytes = max_bytes
+        self._stale_temp_file_age_sec = stale_temp_file_age_sec
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _get_path(self, data_hash):
+        # Data hashes aren't guaranteed to be valid file names
+        return os.path.join(
+            self._cache_dir, hashlib.sha256(data_hash.encode("utf-8")).hexdigest() + MODEL_VERSION_FILE_SUFFIX
+        )
+
+    def get(self, data_hash):
+        """
+        Parameters:
+            data_hash (string): The data hash of the version
+        Returns:
+            data (mmap.mmap or None): A read-only memory map of the version data, to be closed by the caller, or None
+        """
+        path = self._get_path(data_hash)
+        try:
+            with open(path, "rb") as data_f:
+                os.utime(path)
+                data = mmap.mmap(data_f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            # ValueError is raised when mapping empty files
+            MODEL_VERSION_DISK_CACHE_MISSES_COUNTER.inc()
+            return None
+        MODEL_VERSION_DISK_CACHE_HITS_COUNTER.inc()
+        return data
+
+    def put(self, data_hash, data):
+        """
+        Parameters:
+            data_hash (string): The data hash of the version
+            data (bytes-like): The version data
+        """
+        path = self._get_path(data_hash)
+        if os.path.exists(path):
+            os.utime(path)
+            return
+
+        # Written to a temporary file in the same directory then renamed, readers never see partial files
+        temp_fd, temp_path = tempfile.mkstemp(dir=self._cache_dir, suffix=TEMP_FILE_SUFFIX)
+        try:
+            with os.fdopen(temp_fd, "wb") as temp_f:
+                temp_f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        # Size of the temporary files being written, counted but not evictable
+        temp_bytes = 0
+        now = time.time()
+        for entry in os.scandir(self._cache_dir):
+            is_temp_file = entry.name.endswith(TEMP_FILE_SUFFIX)
+            if not is_temp_file and not entry.name.endswith(MODEL_VERSION_FILE_SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+                if is_temp_file and now - stat.st_mtime > self._stale_temp_file_age_sec:
+                    log.debug(f"Removing the stale temporary file [{entry.path}]")
+                    os.unlink(entry.path)
+                    continue
+            except FileNotFoundError:
+                continue
+            if is_temp_file:
+                temp_bytes += stat.st_size
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_bytes = temp_bytes + sum(size for _mtime, size, _path in entries)
+        # Least recently used first, the most recent entry is always kept
+        for _mtime, size, path in sorted(entries)[:-1]:
+            if total_bytes <= self._max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+        MODEL_VERSION_DISK_CACHE_BYTES.set(total_bytes)
@@ -13,3 +13,4 @@
 # limitations under the License.
 
 from cogment_verse.run.run_context import RunContext
+from cogment_verse.run.trial_config_template import TrialConfigTemplate
@@ -0,0 +1,231 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import collections
+import logging
+import random
+import time
+import urllib.request
+
+from prometheus_client import Gauge
+from prometheus_client.parser import text_string_to_metric_families
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MISSED_END_TTL_SEC = 600.0
+
+ENDPOINT_SELECTOR_OUTSTANDING_TRIALS = Gauge(
+    "endpoint_selector_outstanding_trials", "Number of running trials using an endpoint", ["endpoint"]
+)
+ENDPOINT_SELECTOR_WEIGHT = Gauge(
+    "endpoint_selector_weight", "Weight of an endpoint, derived from its metrics", ["endpoint"]
+)
+
+
+class EndpointSelector:
+    """
+    Select the endpoint of a service among its replicas.
+
+    The number of outstanding trials of each endpoint is tracked from the moment it is selected for a trial, in the
+    pre-trial hook, to the end of the trial. Each selection is counted as it is made, the actors of a trial sharing an
+    implementation are therefore spread across its replicas. The base implementation selects replicas randomly.
+
+    When end events may have been missed, e.g. while the stream of ended trials was down, the trials outstanding at
+    that time are forgotten if they didn't end after `missed_end_ttl_sec`, so that the counts don't drift.
+    """
+
+    def __init__(self, missed_end_ttl_sec=DEFAULT_MISSED_END_TTL_SEC):
+        self._missed_end_ttl_sec = missed_end_ttl_sec
+        self._outstanding_trials = collections.Counter()
+        self._trial_endpoints = {}
+        # Trial => time after which it is forgotten, for the trials whose end may have been missed
+        self._trial_deadlines = {}
+
+    def count_outstanding_trials(self, endpoint):
+        self._expire()
+        return self._outstanding_trials[endpoint]
+
+    def _add_outstanding_trial(self, trial_id, endpoint):
+        self._trial_endpoints.setdefault(trial_id, []).append(endpoint)
+        self._outstanding_trials[endpoint] += 1
+        ENDPOINT_SELECTOR_OUTSTANDING_TRIALS.labels(endpoint=endpoint).set(self._outstanding_trials[endpoint])
+
+    def _expire(self):
+        if not self._trial_deadlines:
+            return
+        now = time.monotonic()
+        for trial_id in [trial_id for trial_id, deadline in self._trial_deadlines.items() if deadline <= now]:
+            log.debug(f"Forgetting trial [{trial_id}] whose end may have been missed")
+            self.on_trial_ended(trial_id)
+
+    def _select(self, endpoints):
+        return random.choice(endpoints)
+
+    def select(self, endpoints, trial_id=None):
+        """
+        Select an endpoint
+
+        Parameters:
+            endpoints (list[string]): The endpoints of the replicas of a service
+            trial_id (string - optional): The trial the endpoint is selected for, the selection is then counted as an
+                outstanding trial of the endpoint until the trial ends
+        Returns:
+            endpoint (string): The selected endpoint
+        """
+        self._expire()
+        endpoint = endpoints[0] if len(endpoints) == 1 else self._select(endpoints)
+        if trial_id is not None:
+            self._add_outstanding_trial(trial_id, endpoint)
+        return endpoint
+
+    def on_trial_started(self, trial_id, endpoints=()):
+        """
+        Parameters:
+            trial_id (string): The trial
+            endpoints (list[string] - default is empty): The endpoints used by the trial that were not selected for it
+        """
+        for endpoint in endpoints:
+            self._add_outstanding_trial(trial_id, endpoint)
+
+    def on_trial_ended(self, trial_id):
+        """
+        Called when a trial ends, or can't start, releasing the endpoints selected for it.
+        """
+        self._trial_deadlines.pop(trial_id, None)
+        for endpoint in self._trial_endpoints.pop(trial_id, []):
+            self._outstanding_trials[endpoint] -= 1
+            ENDPOINT_SELECTOR_OUTSTANDING_TRIALS.labels(endpoint=endpoint).set(self._outstanding_trials[endpoint])
+
+    def on_trial_ends_missed(self):
+        """
+        Called when the end of the outstanding trials may have been missed.
+        """
+        deadline = time.monotonic() + self._missed_end_ttl_sec
+        for trial_id in self._trial_endpoints:
+            self._trial_deadlines.setdefault(trial_id, deadline)
+
+    def start(self):
+        """
+        Start any background activity of the selector, called from the running asyncio loop.
+        """
+
+    async def stop(self):
+        pass
+
+
+class LeastOutstandingTrialsEndpointSelector(EndpointSelector):
+    """
+    Select the endpoint having the least outstanding trials, ties are broken randomly.
+    """
+
+    def _select(self, endpoints):
+        min_outstanding_trials = min(self._outstanding_trials[endpoint] for endpoint in endpoints)
+        return random.choice(
+            [endpoint for endpoint in endpoints if self._outstanding_trials[endpoint] == min_outstanding_trials]
+        )
+
+
+class PowerOfTwoChoicesEndpointSelector(EndpointSelector):
+    """
+    Select the endpoint having the least outstanding trials among two random ones.
+    """
+
+    def _select(self, endpoints):
+        first_endpoint, second_endpoint = random.sample(endpoints, 2)
+        if self._outstanding_trials[second_endpoint] < self._outstanding_trials[first_endpoint]:
+            return second_endpoint
+        return first_endpoint
+
+
+class MetricsWeightedEndpointSelector(EndpointSelector):
+    """
+    Select endpoints randomly, weighted by a load metric scraped from the Prometheus exporter of each replica.
+
+    The weight of a replica is `1 / ((1 + load) * (1 + outstanding_trials))`, where `load` is the sum of the samples of
+    `metric_name` it exports, e.g. `actor_implementation_compute_next_action_seconds_sum`. Replicas without metrics,
+    or whose metrics can't be retrieved, are only weighted by their outstanding trials.
+    """
+
+    def __init__(
+        self,
+        metrics_urls,
+        metric_name,
+        refresh_period_sec=5.0,
+        scrape_timeout_sec=1.0,
+        missed_end_ttl_sec=DEFAULT_MISSED_END_TTL_SEC,
+    ):
+        """
+        Parameters:
+            metrics_urls (dict[string, string]): The URL of the Prometheus exporter of the replicas, by endpoint
+            metric_name (string): The name of the load metric
+            refresh_period_sec (float - default is 5.0): Period at which the metrics are scraped
+            scrape_timeout_sec (float - default is 1.0): Timeout of a scrape
+            missed_end_ttl_sec (float - default is 600): cf. `EndpointSelector`
+        """
+        super().__init__(missed_end_ttl_sec=missed_end_ttl_sec)
+        self._metrics_urls = metrics_urls
+        self._metric_name = metric_name
+        self._refresh_period_sec = refresh_period_sec
+        self._scrape_timeout_sec = scrape_timeout_sec
+        self._loads = {}
+        self._previous_totals = {}
+        self._refresh_task = None
+
+    def _scrape(self, metrics_url):
+        with urllib.request.urlopen(metrics_url, timeout=self._scrape_timeout_sec) as response:
+            metrics = response.read().decode("utf-8")
+        return sum(
+            sample.value
+            for family in text_string_to_metric_families(metrics)
+            for sample in family.samples
+            if sample.name == self._metric_name
+        )
+
+    async def _refresh(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            for endpoint, metrics_url in self._metrics_urls.items():
+                try:
+                    total = await loop.run_in_executor(None, self._scrape, metrics_url)
+                except Exception as error:
+                    log.debug(f"Unable to scrape the metrics of [{endpoint}] from [{metrics_url}]: {error}")
+                    self._loads.pop(endpoint, None)
+                    continue
+                # Metrics are usually cumulative, the load is their increase over the last period
+                previous_total = self._previous_totals.get(endpoint, total)
+                self._previous_totals[endpoint] = total
+                self._loads[endpoint] = max(0.0, total - previous_total) / self._refresh_period_sec
+            await asyncio.sleep(self._refresh_period_sec)
+
+    def _get_weight(self, endpoint):
+        weight = 1.0 / ((1.0 + self._loads.get(endpoint, 0.0)) * (1 + self._outstanding_trials[endpoint]))
+        ENDPOINT_SELECTOR_WEIGHT.labels(endpoint=endpoint).set(weight)
+        return weight
+
+    def _select(self, endpoints):
+        return random.choices(endpoints, weights=[self._get_weight(endpoint) for endpoint in endpoints])[0]
+
+    def start(self):
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh())
+
+    async def stop(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
@@ -0,0 +1,577 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import collections
+import logging
+import time
+import uuid
+
+import cogment
+from cogment.api.common_pb2 import TrialParams, TrialState
+from cogment.api.trial_datastore_pb2 import StoredTrialSample
+from google.protobuf.any_pb2 import Any
+from prometheus_client import Counter
+
+log = logging.getLogger(__name__)
+
+# pylint: disable=too-many-arguments, too-many-instance-attributes
+
+LOCAL_TRIAL_TICKS_COUNTER = Counter("local_trial_ticks", "Counter of ticks executed by local trials")
+
+ENVIRONMENT_NAME = "env"
+
+ActorInfo = collections.namedtuple("ActorInfo", ["actor_name", "actor_class_name"])
+LocalTrialInfo = collections.namedtuple("LocalTrialInfo", ["trial_id", "state", "params"])
+LocalRecvObservation = collections.namedtuple("LocalRecvObservation", ["tick_id", "timestamp", "snapshot"])
+LocalRecvAction = collections.namedtuple("LocalRecvAction", ["actor_index", "tick_id", "timestamp", "action"])
+LocalRecvReward = collections.namedtuple("LocalRecvReward", ["tick_id", "value", "confidence"])
+LocalRecvMessage = collections.namedtuple("LocalRecvMessage", ["tick_id", "sender_name", "payload"])
+LocalEvent = collections.namedtuple("LocalEvent", ["type", "observation", "actions", "rewards", "messages"])
+
+
+def get_trial_actors(trial_config):
+    """
+    Retrieve the actors of a trial from its configuration
+
+    Parameters:
+        trial_config: The trial configuration, as defined in `data.proto`
+    Returns:
+        actors (list[dict]): The actors name, class, implementation and deserialized configuration
+    """
+    actors = []
+    for actor_idx, actor in enumerate(trial_config.actors):
+        config = getattr(actor, actor.WhichOneof("config_oneof"))
+        config.actor_index = actor_idx
+        actors.append(
+            {
+                "name": actor.name,
+                "actor_class": actor.actor_class,
+                "implementation": "" if actor.implementation == "client" else actor.implementation,
+                "config": config,
+            }
+        )
+    return actors
+
+
+def _get_trial_params(trial_config, actors):
+    trial_params = TrialParams()
+    trial_params.trial_config.content = trial_config.SerializeToString()
+    trial_params.environment.implementation = trial_config.environment.specs.implementation
+    trial_params.environment.config.content = trial_config.environment.config.SerializeToString()
+    for actor in actors:
+        actor_params = trial_params.actors.add(
+            name=actor["name"], actor_class=actor["actor_class"], implementation=actor["implementation"]
+        )
+        actor_params.config.content = actor["config"].SerializeToString()
+    return trial_params
+
+
+def _now():
+    return time.time_ns()
+
+
+def _aggregate_rewards(rewards):
+    total_confidence = sum(reward.confidence for reward in rewards)
+    if total_confidence <= 0:
+        return sum(reward.value for reward in rewards) / len(rewards)
+    return sum(reward.value * reward.confidence for reward in rewards) / total_confidence
+
+
+class LocalEnvironmentSession:
+    """
+    Stand-in for the cogment `EnvironmentSession` given to environment implementations executed by a `LocalTrial`.
+    """
+
+    def __init__(self, trial, impl_name, config):
+        self.impl_name = impl_name
+        self.config = config
+        self._trial = trial
+        self._events = asyncio.Queue()
+
+    def get_trial_id(self):
+        return self._trial.trial_id
+
+    def get_tick_id(self):
+        return self._trial.tick_id
+
+    def get_active_actors(self):
+        return self._trial.actor_infos
+
+    def start(self, observations=None):
+        self._trial.on_observations(observations or [], final=False)
+
+    def produce_observations(self, observations):
+        self._trial.on_observations(observations, final=False)
+
+    def end(self, observations=None):
+        self._trial.on_observations(observations or [], final=True)
+
+    def add_reward(self, value, confidence, to, tick_id=-1, user_data=None):
+        self._trial.add_reward(value, confidence, to)
+
+    def send_message(self, payload, to, to_environment=False):
+        self._trial.send_message(ENVIRONMENT_NAME, payload, to, to_environment)
+
+    def post_event(self, event):
+        self._events.put_nowait(event)
+
+    async def event_loop(self):
+        while True:
+            event = await self._events.get()
+            if event is None:
+                return
+            yield event
+
+
+class LocalActorSession:
+    """
+    Stand-in for the cogment `ActorSession` given to actor implementations executed by a `LocalTrial`.
+    """
+
+    def __init__(self, trial, actor_idx, name, class_name, impl_name, config):
+        self.name = name
+        self.class_name = class_name
+        self.impl_name = impl_name
+        self.config = config
+        self._trial = trial
+        self._actor_idx = actor_idx
+        self._events = asyncio.Queue()
+
+    def get_trial_id(self):
+        return self._trial.trial_id
+
+    def get_tick_id(self):
+        return self._trial.tick_id
+
+    def start(self):
+        pass
+
+    def do_action(self, action):
+        self._trial.on_action(self._actor_idx, action)
+
+    def send_message(self, payload, to, to_environment=False):
+        self._trial.send_message(self.name, payload, to, to_environment)
+
+    def post_event(self, event):
+        self._events.put_nowait(event)
+
+    async def event_loop(self):
+        while True:
+            event = await self._events.get()
+            if event is None:
+                return
+            yield event
+
+
+class LocalTrial:
+    """
+    Execute a trial in process, by driving its environment and actor implementations tick by tick.
+
+    The samples of the trial are built the same way the trial datastore would and are buffered until retrieved with
+    `get_sample`, at most `max_buffered_samples` are buffered before the trial is paused. Messages are delivered with
+    the next event of their recipients, they are not recorded in the samples.
+    """
+
+    def __init__(self, trial_id, user_id, trial_config, environment_impl, actor_impls, max_buffered_samples):
+        self.trial_id = trial_id
+        self.tick_id = 0
+        self.state = TrialState.RUNNING
+        self._user_id = user_id
+
+        actors = get_trial_actors(trial_config)
+        self.params = _get_trial_params(trial_config, actors)
+        self.actor_infos = [ActorInfo(actor["name"], actor["actor_class"]) for actor in actors]
+
+        self._environment_session = LocalEnvironmentSession(
+            self, trial_config.environment.specs.implementation, trial_config.environment.config
+        )
+        self._environment_impl = environment_impl
+        self._actor_sessions = [
+            LocalActorSession(
+                self, actor_idx, actor["name"], actor["actor_class"], actor["implementation"], actor["config"]
+            )
+            for actor_idx, actor in enumerate(actors)
+        ]
+        self._actor_impls = actor_impls
+
+        self._impl_tasks = []
+        self._observations_future = None
+        self._actions_future = None
+        self._observations = None
+        self._final = False
+        self._actions = {}
+        self._rewards = collections.defaultdict(list)
+        self._environment_messages = []
+        self._actor_messages = collections.defaultdict(list)
+
+        self._samples = asyncio.Queue()
+        self._buffered_samples = asyncio.Semaphore(max_buffered_samples)
+
+    def get_info(self):
+        return LocalTrialInfo(self.trial_id, self.state, self.params)
+
+    def _get_actor_indices(self, destination):
+        if destination == "*":
+            return range(len(self.actor_infos))
+        if destination.endswith(".*"):
+            actor_class = destination[:-2]
+            return [idx for idx, info in enumerate(self.actor_infos) if info.actor_class_name == actor_class]
+        return [idx for idx, info in enumerate(self.actor_infos) if info.actor_name == destination]
+
+    def on_observations(self, observations, final):
+        if self._observations_future is None or self._observations_future.done():
+            raise RuntimeError(f"[{self.trial_id}] Unexpected observations at tick [{self.tick_id}]")
+        actor_observations = [None] * len(self.actor_infos)
+        for destination, observation in observations:
+            for actor_idx in self._get_actor_indices(destination):
+                actor_observations[actor_idx] = observation
+        self._observations_future.set_result((actor_observations, final))
+
+    def on_action(self, actor_idx, action):
+        if self._actions_future is None or self._actions_future.done():
+            # Actions done once the trial is ending are ignored
+            return
+        self._actions[actor_idx] = action
+        if len(self._actions) == len(self._actor_sessions):
+            self._actions_future.set_result(None)
+
+    def add_reward(self, value, confidence, to):
+        reward = LocalRecvReward(self.tick_id, value, confidence)
+        for destination in to:
+            for actor_idx in self._get_actor_indices(destination):
+                self._rewards[actor_idx].append(reward)
+
+    def send_message(self, sender_name, payload, to, to_environment):
+        message = LocalRecvMessage(self.tick_id, sender_name, Any())
+        message.payload.Pack(payload)
+        for destination in to:
+            for actor_idx in self._get_actor_indices(destination):
+                self._actor_messages[actor_idx].append(message)
+        if to_environment:
+            self._environment_messages.append(message)
+
+    def _pop_actor_messages(self, actor_idx):
+        return self._actor_messages.pop(actor_idx, [])
+
+    def _pop_environment_messages(self):
+        messages = self._environment_messages
+        self._environment_messages = []
+        return messages
+
+    async def _wait(self, future):
+        await asyncio.wait([future, *self._impl_tasks], return_when=asyncio.FIRST_COMPLETED)
+        if future.done():
+            return future.result()
+        for task in self._impl_tasks:
+            if task.done() and not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+        raise RuntimeError(f"[{self.trial_id}] An implementation returned before the end of the trial")
+
+    async def _wait_for_observations(self):
+        self._observations_future = asyncio.get_running_loop().create_future()
+        self._observations, self._final = await self._wait(self._observations_future)
+
+    def _build_sample(self, observations, actions, rewards):
+        sample = StoredTrialSample(
+            user_id=self._user_id,
+            trial_id=self.trial_id,
+            tick_id=self.tick_id,
+            timestamp=_now(),
+            state=self.state,
+        )
+        # Observations shared between actors are only serialized once
+        payload_indices = {}
+
+        def add_payload(message):
+            payload_idx = payload_indices.get(id(message))
+            if payload_idx is None:
+                payload_idx = len(sample.payloads)
+                payload_indices[id(message)] = payload_idx
+                sample.payloads.append(message.SerializeToString())
+            return payload_idx
+
+        for actor_idx in range(len(self.actor_infos)):
+            actor_sample = sample.actor_samples.add(actor=actor_idx)
+            observation = observations[actor_idx]
+            if observation is not None:
+                actor_sample.observation = add_payload(observation)
+            if actor_idx in actions:
+                actor_sample.action = add_payload(actions[actor_idx])
+            if rewards.get(actor_idx):
+                actor_sample.reward = _aggregate_rewards(rewards[actor_idx])
+        return sample
+
+    async def _produce_sample(self, sample):
+        await self._buffered_samples.acquire()
+        self._samples.put_nowait(sample)
+
+    async def get_sample(self):
+        """
+        Retrieve the next sample of the trial, None once the trial has ended and every sample was retrieved.
+        """
+        sample = await self._samples.get()
+        if sample is not None:
+            self._buffered_samples.release()
+        return sample
+
+    def _post_actor_events(self, event_type, rewards):
+        for actor_idx, actor_session in enumerate(self._actor_sessions):
+            observation = self._observations[actor_idx]
+            actor_session.post_event(
+                LocalEvent(
+                    type=event_type,
+                    observation=(
+                        LocalRecvObservation(self.tick_id, _now(), observation) if observation is not None else None
+                    ),
+                    actions=[],
+                    rewards=rewards.get(actor_idx, []),
+                    messages=self._pop_actor_messages(actor_idx),
+                )
+            )
+
+    async def run(self):
+        self._impl_tasks = [asyncio.create_task(self._environment_impl(self._environment_session))]
+        self._impl_tasks.extend(
+            asyncio.create_task(actor_impl(actor_session))
+            for actor_impl, actor_session in zip(self._actor_impls, self._actor_sessions)
+        )
+        try:
+            await self._wait_for_observations()
+            rewards = {}
+            while not self._final:
+                self._actions = {}
+                self._actions_future = asyncio.get_running_loop().create_future()
+                self._post_actor_events(cogment.EventType.ACTIVE, rewards)
+                await self._wait(self._actions_future)
+
+                timestamp = _now()
+                actions = self._actions
+                self._environment_session.post_event(
+                    LocalEvent(
+                        type=cogment.EventType.ACTIVE,
+                        observation=None,
+                        actions=[
+                            LocalRecvAction(actor_idx, self.tick_id, timestamp, actions[actor_idx])
+                            for actor_idx in range(len(self._actor_sessions))
+                        ],
+                        rewards=[],
+                        messages=self._pop_environment_messages(),
+                    )
+                )
+
+                # The sample of a tick holds the rewards sent by the environment when it produces the next observations
+                observations = self._observations
+                await self._wait_for_observations()
+                rewards = self._rewards
+                self._rewards = collections.defaultdict(list)
+                await self._produce_sample(self._build_sample(observations, actions, rewards))
+
+                self.tick_id += 1
+                LOCAL_TRIAL_TICKS_COUNTER.inc()
+
+            self.state = TrialState.ENDED
+            self._post_actor_events(cogment.EventType.ENDING, rewards)
+            await self._produce_sample(self._build_sample(self._observations, {}, {}))
+
+            self._environment_session.post_event(
+                LocalEvent(
+                    type=cogment.EventType.FINAL,
+                    observation=None,
+                    actions=[],
+                    rewards=[],
+                    messages=self._pop_environment_messages(),
+                )
+            )
+            for actor_idx, actor_session in enumerate(self._actor_sessions):
+                actor_session.post_event(
+                    LocalEvent(
+                        type=cogment.EventType.FINAL,
+                        observation=None,
+                        actions=[],
+                        rewards=[],
+                        messages=self._pop_actor_messages(actor_idx),
+                    )
+                )
+            for session in [self._environment_session, *self._actor_sessions]:
+                session.post_event(None)
+            await asyncio.gather(*self._impl_tasks)
+        finally:
+            self.state = TrialState.ENDED
+            for task in self._impl_tasks:
+                task.cancel()
+            await asyncio.gather(*self._impl_tasks, return_exceptions=True)
+            self._samples.put_nowait(None)
+
+
+class LocalTrialRunner:
+    """
+    Execute trials in process, without the orchestrator nor the trial datastore.
+
+    It exposes the subset of the cogment `Controller` and of the `TrialDatastoreClient` interfaces used by
+    `RunSession`, trials are executed by the environment and actor implementations registered locally.
+    """
+
+    def __init__(self, user_id, environment_impls, actor_impls, max_buffered_samples=100):
+        """
+        Parameters:
+            user_id (string): The user id of the started trials
+            environment_impls (dict[string, Callable]): The available environment implementations, by name
+            actor_impls (dict[string, Callable]): The available actor implementations, by name
+            max_buffered_samples (int - default is 100): The number of samples of a trial buffered before it is paused
+        """
+        self._user_id = user_id
+        self._environment_impls = environment_impls
+        self._actor_impls = actor_impls
+        self._max_buffered_samples = max_buffered_samples
+
+        self._trials = {}
+        self._trial_tasks = {}
+        # Watcher queue => watched trial states, every state if empty
+        self._trial_watchers = {}
+
+    def _get_impl(self, impls, impl_name, kind):
+        if impl_name not in impls:
+            raise RuntimeError(f"Unknown {kind} implementation [{impl_name}], is it registered in this context?")
+        return impls[impl_name]
+
+    def _create_trial(self, trial_id, trial_config):
+        for actor in trial_config.actors:
+            if actor.implementation == "client":
+                raise RuntimeError(f"Client actor [{actor.name}] can't take part in a local trial")
+        return LocalTrial(
+            trial_id=trial_id,
+            user_id=self._user_id,
+            trial_config=trial_config,
+            environment_impl=self._get_impl(
+                self._environment_impls, trial_config.environment.specs.implementation, "environment"
+            ),
+            actor_impls=[
+                self._get_impl(self._actor_impls, actor.implementation, "actor") for actor in trial_config.actors
+            ],
+            max_buffered_samples=self._max_buffered_samples,
+        )
+
+    async def start_trial(self, trial_config, trial_id_requested=None):
+        trial_id = trial_id_requested if trial_id_requested is not None else str(uuid.uuid4())
+        trial = self._create_trial(trial_id, trial_config)
+        self._trials[trial_id] = trial
+        task = asyncio.create_task(trial.run())
+        task.add_done_callback(lambda task: self._on_trial_done(trial, task))
+        self._trial_tasks[trial_id] = task
+        self._notify_watchers(trial, cogment.TrialState.RUNNING)
+        return trial_id
+
+    def _notify_watchers(self, trial, trial_state):
+        for watcher, trial_state_filters in self._trial_watchers.items():
+            if not trial_state_filters or trial_state in trial_state_filters:
+                watcher.put_nowait(trial.get_info())
+
+    def _on_trial_done(self, trial, task):
+        del self._trial_tasks[trial.trial_id]
+        if not task.cancelled() and task.exception() is not None:
+            log.error(f"[{trial.trial_id}] Uncaught error occured during the local trial", exc_info=task.exception())
+        self._notify_watchers(trial, cogment.TrialState.ENDED)
+
+    async def watch_trials(self, trial_state_filters=()):
+        """
+        Notify the trials started afterward when they reach one of the given states.
+
+        Local trials are RUNNING once started and ENDED once done, they never go through the other states.
+
+        Parameters:
+            trial_state_filters (list[cogment.TrialState] - default is empty): The notified states, every state if empty
+        """
+        watcher = asyncio.Queue()
+        self._trial_watchers[watcher] = frozenset(trial_state_filters)
+        try:
+            while True:
+                yield await watcher.get()
+        finally:
+            del self._trial_watchers[watcher]
+
+    async def terminate_trial(self, trial_id):
+        task = self._trial_tasks.get(trial_id)
+        if task is not None:
+            task.cancel()
+
+    def subscribe(self, on_trials_started, on_sample, on_trials_ended, **_kwargs):
+        return LocalTrialSubscription(self, on_trials_started, on_sample, on_trials_ended)
+
+    def pop_trial(self, trial_id):
+        return self._trials.pop(trial_id)
+
+    async def close(self):
+        for task in self._trial_tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._trial_tasks.values(), return_exceptions=True)
+
+
+class LocalTrialSubscription:
+    """
+    Counterpart of `TrialDatastoreSubscription` for the trials of a `LocalTrialRunner`.
+    """
+
+    def __init__(self, runner, on_trials_started, on_sample, on_trials_ended):
+        self._runner = runner
+        self._on_trials_started = on_trials_started
+        self._on_sample = on_sample
+        self._on_trials_ended = on_trials_ended
+
+        self._pending_trial_ids = collections.deque()
+        self._closed = False
+        self._changed = asyncio.Event()
+
+    def add_trials(self, trial_ids):
+        self._pending_trial_ids.extend(trial_ids)
+        self._changed.set()
+
+    def close(self):
+        self._closed = True
+        self._changed.set()
+
+    async def _stream_samples(self, trial):
+        while True:
+            sample = await trial.get_sample()
+            if sample is None:
+                break
+            await self._on_sample(sample)
+        await self._on_trials_ended([trial.trial_id])
+
+    async def run(self):
+        stream_tasks = set()
+        try:
+            while True:
+                trials = [self._runner.pop_trial(trial_id) for trial_id in self._pending_trial_ids]
+                self._pending_trial_ids.clear()
+                if trials:
+                    self._on_trials_started([trial.get_info() for trial in trials])
+                    stream_tasks.update(asyncio.create_task(self._stream_samples(trial)) for trial in trials)
+
+                if self._closed:
+                    break
+
+                changed_task = asyncio.create_task(self._changed.wait())
+                done, _ = await asyncio.wait([changed_task, *stream_tasks], return_when=asyncio.FIRST_COMPLETED)
+                changed_task.cancel()
+                self._changed.clear()
+                for task in done - {changed_task}:
+                    stream_tasks.discard(task)
+                    task.result()
+
+            await asyncio.gather(*stream_tasks)
+        finally:
+            for task in stream_tasks:
+                task.cancel()
+            await asyncio.gather(*stream_tasks, return_exceptions=True)
@@ -0,0 +1,160 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import math
+import time
+
+from prometheus_client import Counter, Gauge
+
+log = logging.getLogger(__name__)
+
+# pylint: disable=too-many-arguments, too-many-instance-attributes
+
+AUTOSCALER_MAX_PARALLEL_TRIALS = Gauge(
+    "autoscaler_max_parallel_trials", "Maximum number of parallel trials decided by the autoscaler", ["run_id"]
+)
+AUTOSCALER_LEARNER_IDLE_RATIO = Gauge(
+    "autoscaler_learner_idle_ratio", "Ratio of time the learner spent waiting for samples", ["run_id"]
+)
+AUTOSCALER_DECISIONS_COUNTER = Counter(
+    "autoscaler_decisions", "Counter of the autoscaler decisions", ["run_id", "decision"]
+)
+
+
+class ParallelTrialsAutoscaler:
+    """
+    Adjust the number of parallel trials of a run to keep the learner busy without flooding the sample queue.
+
+    It can be given as `max_parallel_trials` to `RunSession.start_trials_and_wait_for_batches`. Every `period_sec`:
+    - if the sample queue is over its high-water mark or over `target_queue_len`, the limit is multiplied by
+    `decrease_factor`;
+    - otherwise, if the learner spent more than `max_learner_idle_ratio` of its time waiting for samples while every
+    trial slot was taken, the limit is increased in proportion of the idle time. Once increased, the limit is not
+    increased again until newly started trials had the time to produce samples, i.e. half the average trial duration.
+    """
+
+    def __init__(
+        self,
+        initial_parallel_trials=4,
+        min_parallel_trials=1,
+        max_parallel_trials=64,
+        target_queue_len=1000,
+        max_learner_idle_ratio=0.1,
+        decrease_factor=0.75,
+        period_sec=1.0,
+        max_cooldown_sec=30.0,
+    ):
+        self.max_parallel_trials = initial_parallel_trials
+        self.period_sec = period_sec
+        self._min_parallel_trials = min_parallel_trials
+        self._max_parallel_trials = max_parallel_trials
+        self._target_queue_len = target_queue_len
+        self._max_learner_idle_ratio = max_learner_idle_ratio
+        self._decrease_factor = decrease_factor
+        self._max_cooldown_sec = max_cooldown_sec
+
+        self._run_id = None
+        self._last_update_time = None
+        self._last_increase_time = None
+        self._learner_idle_time = 0.0
+        self._running_trials_count = 0
+        self._saturated_time = 0.0
+        self._last_running_change_time = None
+        self._average_trial_duration = None
+
+    def start(self, run_id):
+        self._run_id = run_id
+        self._last_update_time = time.time()
+        self._last_running_change_time = self._last_update_time
+        AUTOSCALER_MAX_PARALLEL_TRIALS.labels(run_id=run_id).set(self.max_parallel_trials)
+
+    def _track_saturation(self, now):
+        # Time during which every trial slot was taken
+        if self._running_trials_count >= self.max_parallel_trials:
+            self._saturated_time += now - self._last_running_change_time
+        self._last_running_change_time = now
+
+    def on_trial_started(self):
+        self._track_saturation(time.time())
+        self._running_trials_count += 1
+
+    def on_trial_ended(self, trial_duration):
+        self._track_saturation(time.time())
+        self._running_trials_count -= 1
+        if self._average_trial_duration is None:
+            self._average_trial_duration = trial_duration
+        else:
+            # Exponential moving average
+            self._average_trial_duration += 0.1 * (trial_duration - self._average_trial_duration)
+
+    def on_learner_idle(self, idle_time):
+        self._learner_idle_time += idle_time
+
+    def _get_cooldown(self):
+        if self._average_trial_duration is None:
+            return self.period_sec
+        return min(max(self.period_sec, self._average_trial_duration / 2), self._max_cooldown_sec)
+
+    def update(self, sample_queue):
+        """
+        Decide the number of parallel trials for the next period.
+
+        Parameters:
+            sample_queue (SampleQueue): The sample queue consumed by the learner
+        Returns:
+            max_parallel_trials (int): The new maximum number of parallel trials
+        """
+        now = time.time()
+        self._track_saturation(now)
+        elapsed_time = max(now - self._last_update_time, 1e-6)
+        learner_idle_ratio = min(self._learner_idle_time / elapsed_time, 1.0)
+        saturated = self._saturated_time > 0.5 * elapsed_time
+        self._last_update_time = now
+        self._learner_idle_time = 0.0
+        self._saturated_time = 0.0
+        AUTOSCALER_LEARNER_IDLE_RATIO.labels(run_id=self._run_id).set(learner_idle_ratio)
+
+        previous_max_parallel_trials = self.max_parallel_trials
+        if sample_queue.is_paused() or sample_queue.qsize() > self._target_queue_len:
+            decision = "decrease"
+            self.max_parallel_trials = max(
+                self._min_parallel_trials,
+                min(self.max_parallel_trials - 1, math.floor(self.max_parallel_trials * self._decrease_factor)),
+            )
+        elif (
+            learner_idle_ratio > self._max_learner_idle_ratio
+            and saturated
+            and (self._last_increase_time is None or now - self._last_increase_time >= self._get_cooldown())
+        ):
+            decision = "increase"
+            self._last_increase_time = now
+            self.max_parallel_trials = min(
+                self._max_parallel_trials,
+                self.max_parallel_trials + max(1, round(self.max_parallel_trials * learner_idle_ratio)),
+            )
+        else:
+            decision = "hold"
+
+        if self.max_parallel_trials != previous_max_parallel_trials:
+            log.debug(
+                f"[{self._run_id}] Autoscaler {decision}s the maximum number of parallel trials from "
+                + f"{previous_max_parallel_trials} to {self.max_parallel_trials} "
+                + f"(learner idle ratio is {learner_idle_ratio:.2f}, sample queue length is {sample_queue.qsize()})"
+            )
+        else:
+            decision = "hold"
+        AUTOSCALER_DECISIONS_COUNTER.labels(run_id=self._run_id, decision=decision).inc()
+        AUTOSCALER_MAX_PARALLEL_TRIALS.labels(run_id=self._run_id).set(self.max_parallel_trials)
+        return self.max_parallel_trials
@@ -15,16 +15,20 @@
 import asyncio
 import copy
 import logging
-import random
 
 import cogment
 from cogment_verse.api.run_api_pb2 import DESCRIPTOR as RUN_DESCRIPTOR
 from cogment_verse.api.run_api_pb2_grpc import add_RunServicer_to_server
-from cogment_verse.model_registry_client import ModelRegistryClient
+from cogment_verse.grpc_channel_pool import GrpcChannelPool
+from cogment_verse.model_registry_client import DEFAULT_CACHE_MAX_BYTES, LatestModelVersions, ModelRegistryClient
+from cogment_verse.model_version_disk_cache import ModelVersionDiskCache
+from cogment_verse.run.endpoint_selector import LeastOutstandingTrialsEndpointSelector
+from cogment_verse.run.local_trial_runner import LocalTrialRunner, get_trial_actors
 from cogment_verse.run.run_servicer import RunServicer
 from cogment_verse.run.run_session import RunSession
+from cogment_verse.run.trial_end_dispatcher import TrialEndDispatcher
 from cogment_verse.trial_datastore_client import TrialDatastoreClient
-from cogment_verse.utils import LRU
+from cogment_verse.utils import Cache, SingleFlight
 from grpc_reflection.v1alpha import reflection
 from prometheus_client.core import REGISTRY
 
@@ -33,11 +37,6 @@ log = logging.getLogger(__name__)
 # pylint: disable=too-many-arguments
 
 
-def set_config_index(config, actor_idx):
-    config.actor_index = actor_idx
-    return config
-
-
 # RunContext holds the context information to exectute runs
 class RunContext(cogment.Context):
     def __init__(
@@ -47,7 +46,31 @@ class RunContext(cogment.Context):
         services_endpoints,
         asyncio_loop=None,
         prometheus_registry=REGISTRY,
+        local_trials=False,
+        endpoint_selector=None,
+        model_registry_cache_max_bytes=DEFAULT_CACHE_MAX_BYTES,
+        model_registry_disk_cache_dir=None,
+        model_registry_disk_cache_max_bytes=10 * 1024**3,
+        grpc_keepalive_time_ms=None,
+        grpc_keepalive_timeout_ms=20000,
+        grpc_max_message_length=None,
     ):
+        """
+        Parameters:
+            local_trials (bool - default is False): If true, the trials of the runs are executed in process by the
+                environment and actor implementations registered in this context, cf. `LocalTrialRunner`
+            endpoint_selector (EndpointSelector - optional): Selects the endpoint of services having several replicas,
+                by default the one having the least outstanding trials, cf. `endpoint_selector.py`
+            model_registry_cache_max_bytes (int - default is 1GB): Memory budget of the model registry cache
+            model_registry_disk_cache_dir (string - optional): If defined, the retrieved model versions are also
+                cached in this directory, which can be shared by several services on the same host
+            model_registry_disk_cache_max_bytes (int - default is 10GB): Disk budget of the model registry cache
+            grpc_keepalive_time_ms (int - optional): Period of the keepalive pings on the channels to the model
+                registry and the trial datastore, by default no pings are sent, cf. `GrpcChannelPool`
+            grpc_keepalive_timeout_ms (int - default is 20s): Delay after which an unresponsive connection is closed
+            grpc_max_message_length (int - optional): Maximum size of the messages sent to and received from the
+                model registry and the trial datastore
+        """
         super().__init__(
             user_id,
             cog_settings,
@@ -57,41 +80,73 @@ class RunContext(cogment.Context):
 
         self._cog_settings = cog_settings
         self._services_endpoints = services_endpoints
+        self._user_id = user_id
+        self._local_trials = local_trials
+        self._environment_impls = {}
+        self._actor_impls = {}
+        self._endpoint_selector = (
+            endpoint_selector if endpoint_selector is not None else LeastOutstandingTrialsEndpointSelector()
+        )
+        self._endpoint_selector_started = False
+        # Single stream of trial end events shared by the endpoint selector and the runs
+        self._trial_end_dispatcher = TrialEndDispatcher(self._get_controller)
 
         # Pre trial hook => actor/environment config + services urls resolution
         async def pre_trial_hook(pre_trial_hook_session):
-            log.debug(f"[pre_trial_hook] Configuring trial {pre_trial_hook_session.get_trial_id()}")
-
-            environment_params = pre_trial_hook_session.trial_config.environment
-            pre_trial_hook_session.environment_config = environment_params.config
-            pre_trial_hook_session.environment_implementation = environment_params.specs.implementation
-            pre_trial_hook_session.environment_endpoint = "grpc://" + self._get_service_endpoint(
-                pre_trial_hook_session.environment_implementation
-            )
-            pre_trial_hook_session.datalog_endpoint = "grpc://" + services_endpoints["trial_datastore"]
-            pre_trial_hook_session.actors = [
-                {
-                    "name": actor.name,
-                    "actor_class": actor.actor_class,
-                    "endpoint": "client"
-                    if actor.implementation == "client"
-                    else ("grpc://" + self._get_service_endpoint(actor.implementation)),
-                    "implementation": "" if actor.implementation == "client" else actor.implementation,
-                    "config": set_config_index(getattr(actor, actor.WhichOneof("config_oneof")), actor_idx),
-                }
-                for actor_idx, actor in enumerate(pre_trial_hook_session.trial_config.actors)
-            ]
-
-            pre_trial_hook_session.validate()
+            trial_id = pre_trial_hook_session.get_trial_id()
+            log.debug(f"[pre_trial_hook] Configuring trial {trial_id}")
+            self._start_endpoint_selector()
+
+            # Each selected endpoint is counted for the trial right away, until the trial ends
+            try:
+                environment_params = pre_trial_hook_session.trial_config.environment
+                pre_trial_hook_session.environment_config = environment_params.config
+                pre_trial_hook_session.environment_implementation = environment_params.specs.implementation
+                pre_trial_hook_session.environment_endpoint = "grpc://" + self._get_service_endpoint(
+                    pre_trial_hook_session.environment_implementation, trial_id
+                )
+                pre_trial_hook_session.datalog_endpoint = "grpc://" + services_endpoints["trial_datastore"]
+                pre_trial_hook_session.actors = [
+                    {
+                        **actor,
+                        "endpoint": (
+                            "client"
+                            if actor["implementation"] == ""
+                            else ("grpc://" + self._get_service_endpoint(actor["implementation"], trial_id))
+                        ),
+                    }
+                    for actor in get_trial_actors(pre_trial_hook_session.trial_config)
+                ]
+
+                pre_trial_hook_session.validate()
+            except Exception:
+                # The trial won't start
+                self._endpoint_selector.on_trial_ended(trial_id)
+                raise
 
         self.register_pre_trial_hook(pre_trial_hook)
 
         self._run_impls = {}
 
         # Cache used by the model registry
-        self._model_registry_cache = LRU()
+        self._model_registry_cache = Cache("model_registry", max_bytes=model_registry_cache_max_bytes)
+        # Coalesces the concurrent retrievals of the model registry clients sharing the cache
+        self._model_registry_single_flight = SingleFlight()
+        # Latest version of the models actors subscribed to
+        self._model_registry_latest_versions = LatestModelVersions()
+        # Channels shared by the model registry and trial datastore clients
+        self._grpc_channel_pool = GrpcChannelPool(
+            keepalive_time_ms=grpc_keepalive_time_ms,
+            keepalive_timeout_ms=grpc_keepalive_timeout_ms,
+            max_message_length=grpc_max_message_length,
+        )
+        self._model_registry_disk_cache = (
+            ModelVersionDiskCache(model_registry_disk_cache_dir, max_bytes=model_registry_disk_cache_max_bytes)
+            if model_registry_disk_cache_dir is not None
+            else None
+        )
 
-    def _get_service_endpoint(self, services_name):
+    def _get_service_endpoint(self, services_name, trial_id=None):
         if services_name not in self._services_endpoints:
             raise Exception(f"unknown service [{services_name}]")
 
@@ -100,9 +155,28 @@ class RunContext(cogment.Context):
         if not desired_service_endpoints:
             raise Exception(f"no endpoint defined for service [{services_name}]")
 
-        if isinstance(desired_service_endpoints, list):
-            return random.choice(desired_service_endpoints)
-        return desired_service_endpoints
+        if not isinstance(desired_service_endpoints, list):
+            desired_service_endpoints = [desired_service_endpoints]
+        return self._endpoint_selector.select(desired_service_endpoints, trial_id=trial_id)
+
+    def _start_endpoint_selector(self):
+        if self._endpoint_selector_started:
+            return
+        self._endpoint_selector_started = True
+
+        self._endpoint_selector.start()
+        self._trial_end_dispatcher.add_listener(
+            lambda trial_info: self._endpoint_selector.on_trial_ended(trial_info.trial_id),
+            on_events_missed=self._endpoint_selector.on_trial_ends_missed,
+        )
+
+    def register_environment(self, impl, impl_name="default", **kwargs):
+        self._environment_impls[impl_name] = impl
+        super().register_environment(impl=impl, impl_name=impl_name, **kwargs)
+
+    def register_actor(self, impl, impl_name, actor_classes=None, **kwargs):
+        self._actor_impls[impl_name] = impl
+        super().register_actor(impl=impl, impl_name=impl_name, actor_classes=actor_classes or [], **kwargs)
 
     def register_run(self, run_impl, run_sample_producer_impl, impl_name, default_config):
         if self._grpc_server is not None:
@@ -119,12 +193,27 @@ class RunContext(cogment.Context):
         return self.get_controller(endpoint=cogment.Endpoint(self._get_service_endpoint("orchestrator")))
 
     def _get_trial_datastore_client(self):
-        return TrialDatastoreClient(endpoint=self._get_service_endpoint("trial_datastore"))
+        endpoint = self._get_service_endpoint("trial_datastore")
+        return TrialDatastoreClient(endpoint=endpoint, channel=self._grpc_channel_pool.get(endpoint))
+
+    def _get_trials_runners(self):
+        if self._local_trials:
+            # The local runner both starts the trials and provides their samples, the run session closes it
+            local_trial_runner = LocalTrialRunner(
+                user_id=self._user_id, environment_impls=self._environment_impls, actor_impls=self._actor_impls
+            )
+            return local_trial_runner, local_trial_runner, None, local_trial_runner
+        return self._get_controller(), self._get_trial_datastore_client(), self._trial_end_dispatcher, None
 
     def get_model_registry_client(self):
+        endpoint = self._get_service_endpoint("model_registry")
         return ModelRegistryClient(
-            endpoint=self._get_service_endpoint("model_registry"),
+            endpoint=endpoint,
             cache=self._model_registry_cache,
+            single_flight=self._model_registry_single_flight,
+            latest_versions=self._model_registry_latest_versions,
+            disk_cache=self._model_registry_disk_cache,
+            channel=self._grpc_channel_pool.get(endpoint),
         )
 
     def _create_run_session(self, run_params_name, run_implementation, serialized_config, run_id=None):
@@ -137,16 +226,19 @@ class RunContext(cogment.Context):
         if serialized_config is not None:
             merged_config.MergeFromString(serialized_config)
 
+        controller, trial_datastore_client, trial_end_dispatcher, trials_runner = self._get_trials_runners()
         return RunSession(
             cog_settings=self._cog_settings,
-            controller=self._get_controller(),
-            trial_datastore_client=self._get_trial_datastore_client(),
+            controller=controller,
+            trial_datastore_client=trial_datastore_client,
             config=merged_config,
             run_sample_producer_impl=run_sample_producer_impl,
             impl_name=run_implementation,
             run_impl=run_impl,
             params_name=run_params_name,
             run_id=run_id,
+            trial_end_dispatcher=trial_end_dispatcher,
+            trials_runner=trials_runner,
         )
 
     async def exec_run(self, impl_name, config=None, run_id=None):
@@ -159,16 +251,19 @@ class RunContext(cogment.Context):
         if config is not None:
             merged_config.MergeFrom(config)
 
+        controller, trial_datastore_client, trial_end_dispatcher, trials_runner = self._get_trials_runners()
         run_session = RunSession(
             cog_settings=self._cog_settings,
-            controller=self._get_controller(),
-            trial_datastore_client=self._get_trial_datastore_client(),
+            controller=controller,
+            trial_datastore_client=trial_datastore_client,
             config=merged_config,
             run_sample_producer_impl=run_sample_producer_impl,
             impl_name=impl_name,
             run_impl=run_impl,
             params_name="manual_run",
             run_id=run_id,
+            trial_end_dispatcher=trial_end_dispatcher,
+            trials_runner=trials_runner,
         )
 
         await run_session.exec()
@@ -202,3 +297,8 @@ class RunContext(cogment.Context):
             serve_all_registered_task.cancel()
             await serve_all_registered_task
             raise error
+        finally:
+            await self._trial_end_dispatcher.close()
+            await self._model_registry_latest_versions.close()
+            await self._endpoint_selector.stop()
+            await self._grpc_channel_pool.close()
@@ -0,0 +1,337 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+
+from cogment_verse.run.run_sample_producer_session import RunSampleProducerSession
+from prometheus_client import Counter
+
+log = logging.getLogger(__name__)
+
+SAMPLE_PRODUCER_POOL_MESSAGES_COUNTER = Counter(
+    "sample_producer_pool_messages", "Counter of message batches received from the sample producer workers"
+)
+SAMPLE_PRODUCER_POOL_WORKER_DEATHS_COUNTER = Counter(
+    "sample_producer_pool_worker_deaths", "Counter of sample producer workers that died unexpectedly"
+)
+
+WORKER_LIVENESS_CHECK_PERIOD = 1.0
+WORKER_STOP_TIMEOUT = 10.0
+DEFAULT_MAX_WORKER_RESTARTS = 10
+
+
+def _run_worker(cog_settings_module_name, run_id, run_config, run_sample_producer_impl, inbox, outbox):
+    cog_settings = importlib.import_module(cog_settings_module_name)
+
+    async def worker_loop():
+        loop = asyncio.get_running_loop()
+        sessions = {}
+        pending_messages = []
+
+        def flush():
+            outbox.put(list(pending_messages))
+            pending_messages.clear()
+
+        def send(message):
+            if not pending_messages:
+                # All the messages sent during this loop iteration are flushed together
+                loop.call_soon(flush)
+            pending_messages.append(message)
+
+        def create_session(trial_id, trial_params):
+            session = RunSampleProducerSession(
+                cog_settings=cog_settings,
+                run_id=run_id,
+                trial_id=trial_id,
+                trial_params=trial_params,
+                produce_training_sample=lambda trial_id, tick_id, sample: send(("produced", trial_id, tick_id, sample)),
+                run_config=run_config,
+                run_sample_producer_impl=run_sample_producer_impl,
+            )
+            session.set_on_sample_consumed(lambda: send(("consumed", trial_id)))
+
+            def on_done(task):
+                del sessions[trial_id]
+                error = None
+                if task.cancelled():
+                    error = "cancelled"
+                elif task.exception() is not None:
+                    error = repr(task.exception())
+                send(("finished", trial_id, error))
+
+            task = session.exec()
+            task.add_done_callback(on_done)
+            sessions[trial_id] = (session, task)
+
+        while True:
+            messages = await loop.run_in_executor(None, inbox.get)
+            if messages is None:
+                break
+            for message in messages:
+                kind, trial_id = message[0], message[1]
+                if kind == "start":
+                    create_session(trial_id, message[2])
+                elif trial_id not in sessions:
+                    # The sample producer already finished
+                    continue
+                elif kind == "sample":
+                    await sessions[trial_id][0].on_trial_sample(message[2])
+                elif kind == "done":
+                    await sessions[trial_id][0].on_trial_done()
+                elif kind == "cancel":
+                    sessions[trial_id][1].cancel()
+
+        for _, task in sessions.values():
+            task.cancel()
+        await asyncio.gather(*[task for _, task in sessions.values()], return_exceptions=True)
+
+    asyncio.run(worker_loop())
+
+
+class RemoteRunSampleProducerSession:
+    """
+    Stand-in for a `RunSampleProducerSession` executed by a worker process of a `RunSampleProducerPool`.
+    """
+
+    def __init__(self, pool, worker_idx, trial_id, trial_params, produce_training_sample):
+        self.trial_id = trial_id
+        self._pool = pool
+        self.worker_idx = worker_idx
+        self._trial_params = trial_params
+        self._produce_training_sample = produce_training_sample
+        self._on_sample_consumed = None
+        self._finished = None
+        self._task = None
+
+    def set_on_sample_consumed(self, on_sample_consumed):
+        self._on_sample_consumed = on_sample_consumed
+
+    def exec(self):
+        self._finished = asyncio.get_running_loop().create_future()
+        self._pool.send(self.worker_idx, ("start", self.trial_id, self._trial_params))
+
+        async def exec_run():
+            try:
+                await self._finished
+            except asyncio.CancelledError:
+                self._pool.send(self.worker_idx, ("cancel", self.trial_id))
+                raise
+
+        self._task = asyncio.create_task(exec_run())
+        return self._task
+
+    async def on_trial_sample(self, sample):
+        self._pool.send(self.worker_idx, ("sample", self.trial_id, sample))
+
+    async def on_trial_done(self):
+        self._pool.send(self.worker_idx, ("done", self.trial_id))
+
+    def handle_produced(self, tick_id, sample):
+        self._produce_training_sample(self.trial_id, tick_id, sample)
+
+    def handle_consumed(self):
+        if self._on_sample_consumed is not None:
+            self._on_sample_consumed()
+
+    def handle_finished(self, error):
+        if self._finished.done():
+            return
+        if error is None:
+            self._finished.set_result(None)
+        else:
+            self._finished.set_exception(
+                RuntimeError(f"Uncaught error occured during the sample production of trial [{self.trial_id}]: {error}")
+            )
+
+
+class RunSampleProducerPool:
+    """
+    Pool of worker processes executing sample producers, out of the asyncio loop of the learner.
+
+    Trial samples are sent to the worker executing the trial's sample producer, the produced training samples are sent
+    back and forwarded to `produce_training_sample` in the parent process. Since the worker processes are spawned,
+    the sample producer implementation and the run config need to be picklable, `cog_settings` needs to be an
+    importable module. In the worker processes, `produce_training_sample` returns None instead of the step.
+
+    When a worker dies unexpectedly, only the sample producers it was executing fail and the worker is restarted. Once
+    the workers died more than `max_worker_restarts` times, the pool is broken and creating a new session fails.
+    """
+
+    def __init__(
+        self,
+        cog_settings,
+        run_id,
+        run_config,
+        run_sample_producer_impl,
+        workers_count,
+        mp_context_method="spawn",
+        max_worker_restarts=DEFAULT_MAX_WORKER_RESTARTS,
+    ):
+        self._cog_settings_module_name = cog_settings.__name__
+        self._run_id = run_id
+        self._run_config = run_config
+        self._run_sample_producer_impl = run_sample_producer_impl
+        self._workers_count = workers_count
+        self._mp_context = multiprocessing.get_context(mp_context_method)
+        self._max_worker_restarts = max_worker_restarts
+
+        self._loop = None
+        self._workers = [None] * workers_count
+        self._inboxes = [None] * workers_count
+        self._outbox = None
+        self._reader_thread = None
+        self._stopping = False
+        self._worker_restarts_count = 0
+        self._broken = False
+        self._sessions = {}
+        self._worker_loads = [0] * workers_count
+        self._pending_messages = [[] for _ in range(workers_count)]
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._outbox = self._mp_context.Queue()
+        for worker_idx in range(self._workers_count):
+            self._start_worker(worker_idx)
+
+        self._reader_thread = threading.Thread(target=self._read_outbox, daemon=True)
+        self._reader_thread.start()
+        log.info(f"[{self._run_id}] Started {self._workers_count} sample producer workers")
+
+    def _start_worker(self, worker_idx):
+        inbox = self._mp_context.Queue()
+        worker = self._mp_context.Process(
+            target=_run_worker,
+            args=(
+                self._cog_settings_module_name,
+                self._run_id,
+                self._run_config,
+                self._run_sample_producer_impl,
+                inbox,
+                self._outbox,
+            ),
+            daemon=True,
+        )
+        worker.start()
+        self._inboxes[worker_idx] = inbox
+        self._workers[worker_idx] = worker
+
+    async def stop(self):
+        self._stopping = True
+        for inbox in self._inboxes:
+            inbox.put(None)
+        await self._loop.run_in_executor(None, self._join_workers)
+        self._outbox.put(None)
+        await self._loop.run_in_executor(None, self._reader_thread.join)
+
+    def _join_workers(self):
+        for worker in self._workers:
+            worker.join(timeout=WORKER_STOP_TIMEOUT)
+            if worker.is_alive():
+                log.warning(f"[{self._run_id}] Sample producer worker didn't stop in time, terminating it")
+                worker.terminate()
+
+    def create_session(self, trial_id, trial_params, produce_training_sample):
+        if self._broken:
+            raise RuntimeError(
+                f"[{self._run_id}] Sample producer workers died more than {self._max_worker_restarts} times, unable to execute the sample producer of trial [{trial_id}]"
+            )
+        worker_idx = min(range(self._workers_count), key=lambda idx: self._worker_loads[idx])
+        self._worker_loads[worker_idx] += 1
+        session = RemoteRunSampleProducerSession(self, worker_idx, trial_id, trial_params, produce_training_sample)
+        self._sessions[trial_id] = session
+        return session
+
+    def send(self, worker_idx, message):
+        pending_messages = self._pending_messages[worker_idx]
+        if not pending_messages:
+            # All the messages sent during this loop iteration are flushed together
+            self._loop.call_soon(self._flush, worker_idx)
+        pending_messages.append(message)
+
+    def _flush(self, worker_idx):
+        self._inboxes[worker_idx].put(list(self._pending_messages[worker_idx]))
+        self._pending_messages[worker_idx].clear()
+
+    def _check_workers_liveness(self, reported_dead_workers):
+        for worker_idx, worker in enumerate(self._workers):
+            if worker.is_alive() or worker in reported_dead_workers:
+                continue
+            reported_dead_workers.add(worker)
+            self._loop.call_soon_threadsafe(self._on_worker_died, worker_idx, worker)
+
+    def _read_outbox(self):
+        reported_dead_workers = set()
+        next_liveness_check = time.monotonic() + WORKER_LIVENESS_CHECK_PERIOD
+        while True:
+            try:
+                messages = self._outbox.get(timeout=WORKER_LIVENESS_CHECK_PERIOD)
+            except queue.Empty:
+                messages = []
+            if messages is None:
+                return
+            if messages:
+                SAMPLE_PRODUCER_POOL_MESSAGES_COUNTER.inc()
+                self._loop.call_soon_threadsafe(self._dispatch, messages)
+            # Checking periodically, even while the other workers keep sending messages
+            if not self._stopping and time.monotonic() >= next_liveness_check:
+                self._check_workers_liveness(reported_dead_workers)
+                next_liveness_check = time.monotonic() + WORKER_LIVENESS_CHECK_PERIOD
+
+    def _dispatch(self, messages):
+        for message in messages:
+            kind, trial_id = message[0], message[1]
+            session = self._sessions.get(trial_id)
+            if session is None:
+                # The session already failed because its worker died
+                continue
+            if kind == "produced":
+                session.handle_produced(message[2], message[3])
+            elif kind == "consumed":
+                session.handle_consumed()
+            elif kind == "finished":
+                del self._sessions[trial_id]
+                self._worker_loads[session.worker_idx] -= 1
+                session.handle_finished(message[2])
+
+    def _on_worker_died(self, worker_idx, worker):
+        if self._stopping or self._workers[worker_idx] is not worker:
+            return
+        SAMPLE_PRODUCER_POOL_WORKER_DEATHS_COUNTER.inc()
+        log.error(
+            f"[{self._run_id}] Sample producer worker #{worker_idx} died unexpectedly with exit code [{worker.exitcode}]"
+        )
+
+        # Only the sessions executed by the dead worker fail
+        dead_sessions = [session for session in self._sessions.values() if session.worker_idx == worker_idx]
+        for session in dead_sessions:
+            del self._sessions[session.trial_id]
+            session.handle_finished(f"sample producer worker #{worker_idx} died")
+        self._worker_loads[worker_idx] = 0
+        self._pending_messages[worker_idx].clear()
+
+        if self._worker_restarts_count >= self._max_worker_restarts:
+            log.error(f"[{self._run_id}] Sample producer workers died more than {self._max_worker_restarts} times")
+            # The sessions executed by the other workers are left to complete
+            self._broken = True
+            return
+
+        self._worker_restarts_count += 1
+        self._start_worker(worker_idx)
+        log.info(f"[{self._run_id}] Restarted sample producer worker #{worker_idx}")
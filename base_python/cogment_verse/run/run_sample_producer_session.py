@@ -22,18 +22,25 @@ class TrialSample:
     def __init__(self, sample_pb, actor_classes):
         self._sample_pb = sample_pb
         self._actor_classes = actor_classes
+        # Parsed payloads, keyed by payload index and message class.
+        # Actors observing the same thing share the same payload, it is only parsed once.
+        self._parsed_payloads = {}
 
-    def _get_payload(self, payload_idx, pb_message_class=None, default=None):
+    def _get_payload(self, payload_idx, pb_message_class=None, default=None, as_memoryview=False):
         if payload_idx is None:
             return default
 
         payload = self._sample_pb.payloads[payload_idx]
 
         if pb_message_class is None:
-            return payload
-
-        message = pb_message_class()
-        message.ParseFromString(payload)
+            return memoryview(payload) if as_memoryview else payload
+
+        cache_key = (payload_idx, pb_message_class)
+        message = self._parsed_payloads.get(cache_key)
+        if message is None:
+            message = pb_message_class()
+            message.ParseFromString(payload)
+            self._parsed_payloads[cache_key] = message
         return message
 
     def get_trial_id(self):
@@ -60,20 +67,34 @@ class TrialSample:
     def count_actors(self):
         return len(self._sample_pb.actor_samples)
 
-    def get_actor_observation(self, actor_idx, deserialize=True, default=None):
+    def get_actor_observation(self, actor_idx, deserialize=True, default=None, as_memoryview=False):
+        """
+        Retrieve the observation received by an actor.
+
+        Deserialized observations are parsed once and shared between calls, they must not be modified.
+        If `deserialize` is false, the raw payload is returned without copy, as a `memoryview` if requested.
+        """
         actor = self._get_actor(actor_idx)
         return self._get_payload(
             actor.observation,
             pb_message_class=self._actor_classes[actor_idx].observation_space if deserialize else None,
             default=default,
+            as_memoryview=as_memoryview,
         )
 
-    def get_actor_action(self, actor_idx, deserialize=True, default=None):
+    def get_actor_action(self, actor_idx, deserialize=True, default=None, as_memoryview=False):
+        """
+        Retrieve the action done by an actor.
+
+        Deserialized actions are parsed once and shared between calls, they must not be modified.
+        If `deserialize` is false, the raw payload is returned without copy, as a `memoryview` if requested.
+        """
         actor = self._get_actor(actor_idx)
         return self._get_payload(
             actor.action,
             pb_message_class=self._actor_classes[actor_idx].action_space if deserialize else None,
             default=default,
+            as_memoryview=as_memoryview,
         )
 
     def get_actor_reward(self, actor_idx, default=None):
@@ -131,7 +152,9 @@ class RunSampleProducerSession:
 
         self.run_config = run_config
 
-        self._queue = asyncio.Queue(maxsize=10)
+        # Bounding the buffered samples is the responsibility of the caller, cf. `TrialSampleDemultiplexer`
+        self._queue = asyncio.Queue()
+        self._on_sample_consumed = None
 
     # TODO Expose further helper functions to avoid the need to access directly _trial_params as needed
     def count_actors(self):
@@ -171,6 +194,9 @@ class RunSampleProducerSession:
         self._task = asyncio.create_task(exec_run())
         return self._task
 
+    def set_on_sample_consumed(self, on_sample_consumed):
+        self._on_sample_consumed = on_sample_consumed
+
     async def on_trial_sample(self, sample):
         await self._queue.put(sample)
 
@@ -183,6 +209,8 @@ class RunSampleProducerSession:
             if enqeued_item is True:
                 # Trial done
                 return
+            if self._on_sample_consumed is not None:
+                self._on_sample_consumed()
             trial_sample = TrialSample(enqeued_item, self._actor_classes)
             self._current_tick_id = trial_sample.get_tick_id()
             log.debug(f"[{self.run_id}] retrieving a trial sample for trial={self.trial_id}@{self._current_tick_id}")
@@ -13,16 +13,22 @@
 # limitations under the License.
 
 import asyncio
+import collections
 import logging
 import time
 from datetime import datetime
 from enum import Enum, auto
 
-import cogment
+from cogment_verse.run.parallel_trials_autoscaler import ParallelTrialsAutoscaler
+from cogment_verse.run.run_sample_producer_pool import RunSampleProducerPool
 from cogment_verse.run.run_sample_producer_session import RunSampleProducerSession
 from cogment_verse.run.run_stepper import RunStepper
+from cogment_verse.run.sample_queue import SampleQueue
+from cogment_verse.run.trial_end_dispatcher import TrialEndDispatcher
+from cogment_verse.run.trial_sample_demultiplexer import TrialSampleDemultiplexer
+from cogment_verse.run.trial_sample_recording import TrialSampleRecorder, read_recorded_trials
 from names_generator import generate_name
-from prometheus_client import Counter, Gauge, Summary
+from prometheus_client import Counter, Gauge, Histogram, Summary
 
 log = logging.getLogger(__name__)
 
@@ -31,20 +37,43 @@ log = logging.getLogger(__name__)
 TRIALLAUNCHER_TRIAL_RUNNING_LEN = Gauge("triallauncher_trial_running_len", "Length of the running trials")
 TRIALLAUNCHER_SAMPLE_CONSUMED_COUNTER = Counter("triallauncher_sample_consumed", "Counter of consumed samples")
 TRIALLAUNCHER_SAMPLE_QUEUE_LEN = Gauge("triallauncher_sample_queue_len", "Length of the sample queue")
+TRIALLAUNCHER_SAMPLE_QUEUE_BYTES = Gauge(
+    "triallauncher_sample_queue_bytes", "Estimated size of the samples held in memory by the sample queue"
+)
+TRIALLAUNCHER_SAMPLE_QUEUE_SPILLED_BYTES = Gauge(
+    "triallauncher_sample_queue_spilled_bytes", "Size of the samples spilled to disk by the sample queue"
+)
+TRIALLAUNCHER_BACKPRESSURE_TIME = Summary(
+    "triallauncher_backpressure_seconds", "Time spent waiting for the sample queue to drain below its high-water mark"
+)
 TRIALLAUNCHER_SAMPLE_PRODUCED_COUNTER = Counter("triallauncher_sample_produced", "Counter of produced samples")
 TRIALLAUNCHER_TRIAL_TIME = Summary("triallauncher_trial_seconds", "Time spent running trials")
 TRIALLAUNCHER_TRIAL_STARTED_COUNTER = Counter("triallauncher_trial_started", "Counter of started trials")
 TRIALLAUNCHER_START_TRIAL_TIME = Summary("triallauncher_start_trial_seconds", "Time spent starting trials")
+TRIALLAUNCHER_TRIAL_LAUNCH_LATENCY = Histogram(
+    "triallauncher_trial_launch_latency_seconds",
+    "Time between a trial slot being taken and the trial being handed to the observer",
+)
+TRIALLAUNCHER_TRIAL_SLOT_IDLE_TIME = Histogram(
+    "triallauncher_trial_slot_idle_seconds", "Time a trial slot stays free before a new trial is launched"
+)
+TRIALLAUNCHER_SAMPLE_BATCH_SIZE = Summary("triallauncher_sample_batch_size", "Size of the consumed sample batches")
 
-PRIO_QUEUE_HIGH_PRIO = 0
-PRIO_QUEUE_LOW_PRIO = 1
-PRIO_QUEUE_END_PRIO = 2
+# When consuming samples one by one we still drain everything that's already available in one go
+UNBATCHED_MAX_BATCH = 1024
 
 
 def default_on_progress(_launched_trials_count, _finished_trials_count):
     pass
 
 
+async def _wait_for_sample_queue_capacity(sample_queue):
+    if not sample_queue.is_paused():
+        return
+    with TRIALLAUNCHER_BACKPRESSURE_TIME.time():
+        await sample_queue.wait_for_capacity()
+
+
 class RunSessionStatus(Enum):
     CREATED = auto()
     RUNNING = auto()
@@ -66,7 +95,16 @@ class RunSession:
         run_impl,
         params_name,
         run_id=None,
+        trial_end_dispatcher=None,
+        trials_runner=None,
     ):
+        """
+        Parameters:
+            trial_end_dispatcher (TrialEndDispatcher - optional): Shared dispatcher of the trial end events, by default
+                the run watches the ended trials on its own
+            trials_runner (LocalTrialRunner - optional): Runner executing the trials of this run only, it is closed,
+                terminating its trials, once the run is done
+        """
         super().__init__()
 
         self.run_id = run_id if run_id is not None else generate_name()
@@ -79,7 +117,11 @@ class RunSession:
         self._run_sample_producer_impl = run_sample_producer_impl
         self._controller = controller
         self._trial_datastore_client = trial_datastore_client
+        self._trial_end_dispatcher = (
+            trial_end_dispatcher if trial_end_dispatcher is not None else TrialEndDispatcher(lambda: self._controller)
+        )
         self._stepper = RunStepper()
+        self._trials_runner = trials_runner
 
         self._run_impl = run_impl
         self._task = None
@@ -126,6 +168,9 @@ class RunSession:
                     exc_info=error,
                 )
                 raise error
+            finally:
+                if self._trials_runner is not None:
+                    await self._trials_runner.close()
 
         self._task = asyncio.create_task(exec_run())
         return self._task
@@ -137,6 +182,10 @@ class RunSession:
         self._task.cancel()
         try:
             await self._task
+        except asyncio.CancelledError:
+            # Only the cancellation of the run is expected, not the one of the caller
+            if not self._task.cancelled():
+                raise
         except Exception:
             # We don't want terminate to fail, exception handling is dealt with in get_status().
             pass
@@ -148,8 +197,13 @@ class RunSession:
 
     @staticmethod
     async def _do_enqueue_trial_configs(trial_config_queue_out, trial_configs):
-        for trial_config in trial_configs:
-            await trial_config_queue_out.put(trial_config)
+        # The queue is bounded, trial configs are only pulled from the iterable when a trial is about to start
+        if hasattr(trial_configs, "__aiter__"):
+            async for trial_config in trial_configs:
+                await trial_config_queue_out.put(trial_config)
+        else:
+            for trial_config in trial_configs:
+                await trial_config_queue_out.put(trial_config)
 
         # Making sure the consumer knowns that it's finished
         await trial_config_queue_out.put(None)
@@ -157,222 +211,564 @@ class RunSession:
     async def _do_start_trials(
         self,
         trial_configs_queue_in,
-        trial_ids_chunk_prio_queue_out,
+        trial_ids_queue_out,
+        sample_queue,
         max_parallel_trials,
         on_progress,
-        start_trial_throttle_timeout,
     ):
         launched_trials_count = 0
         finished_trials_count = 0
 
-        running_trial_ids = set()
+        autoscaler = max_parallel_trials if isinstance(max_parallel_trials, ParallelTrialsAutoscaler) else None
+
+        # Start time of the running trials
+        running_trials = {}
+        starting_trials_count = 0
+        # Timestamps at which trial slots were freed, used to measure how long they stay idle
+        freed_slots_timestamps = collections.deque()
+        # Set whenever a trial slot is freed or a subtask finishes
+        trials_changed = asyncio.Event()
 
         async def monitor_ended_trials():
             nonlocal finished_trials_count
-            async for ended_trial_info in self._controller.watch_trials(trial_state_filters=[cogment.TrialState.ENDED]):
-                if ended_trial_info.trial_id in running_trial_ids:
-                    log.debug(f"[{self.run_id}] Trial [{ended_trial_info.trial_id}] ended")
-                    running_trial_ids.discard(ended_trial_info.trial_id)
-                    finished_trials_count += 1
+            try:
+                async for ended_trial_info in trial_end_subscription.watch_ended_trials():
+                    if ended_trial_info.trial_id in running_trials:
+                        log.debug(f"[{self.run_id}] Trial [{ended_trial_info.trial_id}] ended")
+                        trial_start_time = running_trials.pop(ended_trial_info.trial_id)
+                        if autoscaler is not None:
+                            autoscaler.on_trial_ended(time.time() - trial_start_time)
+                        finished_trials_count += 1
+                        freed_slots_timestamps.append(time.time())
+                        trials_changed.set()
+            finally:
+                trials_changed.set()
+
+        async def start_trial(trial_config):
+            nonlocal launched_trials_count, starting_trials_count
+            start_time = time.time()
+            try:
+                with TRIALLAUNCHER_START_TRIAL_TIME.time():
+                    trial_id = await self._controller.start_trial(trial_config=trial_config)
+            finally:
+                starting_trials_count -= 1
+                trials_changed.set()
 
-        try:
-            monitor_ended_trials_task = asyncio.create_task(monitor_ended_trials())
+            log.debug(f"[{self.run_id}] Trial [{trial_id}] started")
 
+            launched_trials_count += 1
+            running_trials[trial_id] = start_time
+            trial_end_subscription.add_trial(trial_id)
+            # The trial is observed as soon as it is started, without waiting for the others
+            await trial_ids_queue_out.put([trial_id])
+            trial_configs_queue_in.task_done()
+
+            TRIALLAUNCHER_TRIAL_LAUNCH_LATENCY.observe(time.time() - start_time)
+
+        async def autoscale():
             while True:
-                if monitor_ended_trials_task.cancelled():
+                await asyncio.sleep(autoscaler.period_sec)
+                autoscaler.update(sample_queue)
+                trials_changed.set()
+
+        def get_max_parallel_trials():
+            if autoscaler is not None:
+                return autoscaler.max_parallel_trials
+            return max_parallel_trials
+
+        def check_subtasks():
+            if monitor_ended_trials_task.cancelled():
+                raise asyncio.CancelledError()
+            if monitor_ended_trials_task.done():
+                # The only way `monitor_ended_trials_task` finishes is if an error occured
+                raise RuntimeError(
+                    "An error occured while monitoring the trials"
+                ) from monitor_ended_trials_task.exception()
+
+            done_start_trial_tasks = {t for t in start_trial_tasks if t.done()}
+            start_trial_tasks.difference_update(done_start_trial_tasks)
+            for done_start_trial_task in done_start_trial_tasks:
+                if done_start_trial_task.cancelled():
                     raise asyncio.CancelledError()
-                if monitor_ended_trials_task.done():
-                    # The only way `monitor_ended_trials_task` finishes is if an error occured
-                    raise RuntimeError(
-                        "An error occured while monitoring the trials"
-                    ) from monitor_ended_trials_task.exception()
+                if done_start_trial_task.exception() is not None:
+                    raise RuntimeError("An error occured while starting a trial") from done_start_trial_task.exception()
 
-                trial_slots_count = max_parallel_trials - len(running_trial_ids)
-                on_progress(launched_trials_count, finished_trials_count)
+        # Resolved as soon as a subtask fails, so that the failure isn't only noticed at the next iteration
+        subtask_failed = asyncio.get_running_loop().create_future()
 
-                if trial_slots_count > 0:
-                    to_start_trial_configs = []
-                    done = False
-                    while len(to_start_trial_configs) < trial_slots_count:
-                        trial_config = await trial_configs_queue_in.get()
-                        if trial_config is None:
-                            done = True
-                            break
-                        to_start_trial_configs.append(trial_config)
-
-                    if len(to_start_trial_configs) > 0:
-                        log.debug(f"[{self.run_id}] Starting {len(to_start_trial_configs)} trials")
-
-                        with TRIALLAUNCHER_START_TRIAL_TIME.time():
-                            done_start_trial_tasks, _ = await asyncio.wait(
-                                [
-                                    self._controller.start_trial(trial_config=trial_config)
-                                    for trial_config in to_start_trial_configs
-                                ]
-                            )
-                            started_trial_ids = {r.result() for r in done_start_trial_tasks}
-
-                        log.debug(f"[{self.run_id}] Trials [{', '.join(started_trial_ids)}] started")
-
-                        launched_trials_count += len(started_trial_ids)
-                        running_trial_ids.update(started_trial_ids)
-                        await trial_ids_chunk_prio_queue_out.put((PRIO_QUEUE_LOW_PRIO, started_trial_ids))
-
-                        for trial_config in to_start_trial_configs:
-                            trial_configs_queue_in.task_done()
-
-                    if done:
-                        # Making sure the consumer knowns that it's finished
-                        await trial_ids_chunk_prio_queue_out.put((PRIO_QUEUE_END_PRIO, None))
-                        break
-
-                else:
-                    # at least `max_parallel_trials` currently running, let's wait a little bit before checking again
-                    timeout_seconds = start_trial_throttle_timeout * (1 / 1000.0)
-                    log.debug(
-                        f"[{self.run_id}] Waiting {timeout_seconds:.1f} seconds before checking if trials need to be restarted"
-                    )
-                    await asyncio.sleep(timeout_seconds)
-
-        except asyncio.CancelledError:
-            # Cancelling subtasks
-            monitor_ended_trials_task.cancel()
-            await monitor_ended_trials_task
+        def on_subtask_done(task):
+            if subtask_failed.done():
+                return
+            if task is monitor_ended_trials_task or task.cancelled() or task.exception() is not None:
+                subtask_failed.set_result(None)
+
+        async def wait_unless_subtask_failed(awaitable):
+            task = asyncio.ensure_future(awaitable)
+            await asyncio.wait({task, subtask_failed}, return_when=asyncio.FIRST_COMPLETED)
+            if not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                check_subtasks()
+            return task.result()
+
+        start_trial_tasks = set()
+        trial_end_subscription = self._trial_end_dispatcher.subscribe()
+        monitor_ended_trials_task = asyncio.create_task(monitor_ended_trials())
+        monitor_ended_trials_task.add_done_callback(on_subtask_done)
+        autoscale_task = None
+        if autoscaler is not None:
+            autoscaler.start(self.run_id)
+            autoscale_task = asyncio.create_task(autoscale())
+        try:
+            while True:
+                check_subtasks()
+                on_progress(launched_trials_count, finished_trials_count)
 
-    async def _do_observe_trials(self, trial_ids_chunk_prio_queue_in, sample_queue_out, trial_datastore_timeout):
-        def produce_training_sample(trial_id, tick_id, sample):
-            step_id, step_timestamp = self._stepper.step(trial_id, tick_id)
-            sample_queue_out.put_nowait((step_id, step_timestamp, trial_id, tick_id, sample))
+                if get_max_parallel_trials() - len(running_trials) - starting_trials_count <= 0:
+                    # at least `max_parallel_trials` currently running, waiting for one to end
+                    await trials_changed.wait()
+                    trials_changed.clear()
+                    continue
 
-            TRIALLAUNCHER_SAMPLE_PRODUCED_COUNTER.inc()
+                await wait_unless_subtask_failed(_wait_for_sample_queue_capacity(sample_queue))
 
-            return step_id, step_timestamp
+                trial_config = await wait_unless_subtask_failed(trial_configs_queue_in.get())
+                if trial_config is None:
+                    break
 
-        async def observe_trial_ids_chunk(trial_ids):
-            # Retrieve trial infos from the trial datastore
-            trial_infos = await self._trial_datastore_client.retrieve_trials(trial_ids, trial_datastore_timeout)
-            # `trial_infos` only contains info related to the trials already known to the trial datastore
-            known_trial_ids = {trial_info.trial_id for trial_info in trial_infos}
-            unknown_trials_ids = set(trial_ids).difference(known_trial_ids)
+                if freed_slots_timestamps:
+                    TRIALLAUNCHER_TRIAL_SLOT_IDLE_TIME.observe(time.time() - freed_slots_timestamps.popleft())
 
-            if len(unknown_trials_ids) > 0:
-                log.info(
-                    f"[{self.run_id}] Trials [{', '.join(unknown_trials_ids)}] didn't start generating data under {trial_datastore_timeout}ms, retrying"
-                )
-                trial_ids_chunk_prio_queue_in.put_nowait((PRIO_QUEUE_HIGH_PRIO, unknown_trials_ids))
+                starting_trials_count += 1
+                if autoscaler is not None:
+                    autoscaler.on_trial_started()
+                start_trial_task = asyncio.create_task(start_trial(trial_config))
+                start_trial_task.add_done_callback(on_subtask_done)
+                start_trial_tasks.add(start_trial_task)
 
-            if len(known_trial_ids) == 0:
-                return
+            if start_trial_tasks:
+                await asyncio.wait(start_trial_tasks, return_when=asyncio.FIRST_EXCEPTION)
+            check_subtasks()
 
-            run_sample_producer_sessions = {
-                trial_info.trial_id: RunSampleProducerSession(
-                    cog_settings=self._cog_settings,
-                    run_id=self.run_id,
-                    trial_id=trial_info.trial_id,
-                    trial_params=trial_info.params,
-                    produce_training_sample=produce_training_sample,
-                    run_config=self.config,
-                    run_sample_producer_impl=self._run_sample_producer_impl,
-                )
-                for trial_info in trial_infos
-            }
-
-            run_sample_producer_tasks = [session.exec() for session in run_sample_producer_sessions.values()]
-            TRIALLAUNCHER_TRIAL_STARTED_COUNTER.inc(len(run_sample_producer_tasks))
+            # Making sure the consumer knowns that it's finished
+            await trial_ids_queue_out.put(None)
+        finally:
+            # Cancelling subtasks
+            subtasks = [monitor_ended_trials_task, *start_trial_tasks]
+            if autoscale_task is not None:
+                subtasks.append(autoscale_task)
+            for task in subtasks:
+                task.cancel()
+            await asyncio.gather(*subtasks, return_exceptions=True)
+            trial_end_subscription.close()
+
+    async def _do_observe_trials(self, trial_ids_queue_in, trials_observer, trial_datastore_timeout):
+        subscription = self._trial_datastore_client.subscribe(
+            on_trials_started=trials_observer.on_trials_started,
+            on_sample=trials_observer.on_sample,
+            on_trials_ended=trials_observer.on_trials_ended,
+            retrieve_trials_timeout=trial_datastore_timeout,
+        )
 
-            trial_start_time = time.time()
-            sample_generator = await self._trial_datastore_client.retrieve_samples(known_trial_ids)
-            async for sample in sample_generator():
-                await run_sample_producer_sessions[sample.trial_id].on_trial_sample(sample)
+        async def subscribe_to_started_trials():
+            while True:
+                trial_ids = await trial_ids_queue_in.get()
+                if trial_ids is None:
+                    subscription.close()
+                    return
+                subscription.add_trials(trial_ids)
 
-            for session in run_sample_producer_sessions.values():
-                await session.on_trial_done()
+        subscription_task = asyncio.create_task(subscription.run())
+        subscribe_task = asyncio.create_task(subscribe_to_started_trials())
+        try:
+            await asyncio.gather(subscribe_task, subscription_task)
 
-            await asyncio.wait(run_sample_producer_tasks)
+            # Every trial has been observed, waiting for the sample producers to finish
+            await trials_observer.wait_for_sample_producers()
+        finally:
+            # Cancelling subtasks
+            for task in [subscribe_task, subscription_task]:
+                task.cancel()
+            await asyncio.gather(subscribe_task, subscription_task, return_exceptions=True)
+            await trials_observer.close()
 
-            trial_duration_seconds = time.time() - trial_start_time
-            TRIALLAUNCHER_TRIAL_TIME.observe(trial_duration_seconds)
+    async def _do_replay_trials(self, recorded_trials, trials_observer, max_parallel_trials, on_progress):
+        launched_trials_count = 0
+        finished_trials_count = 0
 
-            trial_ids_chunk_prio_queue_in.task_done()
+        async def replay_trial(recorded_trial):
+            nonlocal launched_trials_count, finished_trials_count
+            trials_observer.on_trials_started([recorded_trial])
+            launched_trials_count += 1
+            for sample in recorded_trial.get_samples():
+                await trials_observer.on_sample(sample)
+            await trials_observer.on_trials_ended([recorded_trial.trial_id])
+            finished_trials_count += 1
+
+        async def wait_for_replay_task():
+            # A slot is freed whenever a replay task finishes, failures are surfaced right away
+            done_replay_tasks, _ = await asyncio.wait(replay_tasks, return_when=asyncio.FIRST_COMPLETED)
+            replay_tasks.difference_update(done_replay_tasks)
+            for done_replay_task in done_replay_tasks:
+                if done_replay_task.cancelled():
+                    raise asyncio.CancelledError()
+                if done_replay_task.exception() is not None:
+                    raise RuntimeError("An error occured while replaying a trial") from done_replay_task.exception()
 
-        observe_tasks = []
+        replay_tasks = set()
         try:
-            while True:
-                done_observe_tasks = [t for t in observe_tasks if t.done()]
-                cancelled_observe_tasks = [t for t in done_observe_tasks if t.cancelled()]
-                if len(cancelled_observe_tasks) > 0:
-                    raise asyncio.CancelledError() from cancelled_observe_tasks[0].exception()
-                failed_observe_tasks = [t for t in done_observe_tasks if t.exception() is not None]
-                if len(failed_observe_tasks) > 0:
-                    raise RuntimeError("An error occured while observing the trials log") from failed_observe_tasks[
-                        0
-                    ].exception()
-
-                _, trial_ids = await trial_ids_chunk_prio_queue_in.get()
-                if trial_ids is None:
-                    break
-
-                observe_tasks.append(asyncio.create_task(observe_trial_ids_chunk(trial_ids)))
-        except asyncio.CancelledError:
+            for recorded_trial in recorded_trials:
+                on_progress(launched_trials_count, finished_trials_count)
+                while len(replay_tasks) >= max_parallel_trials:
+                    await wait_for_replay_task()
+                replay_tasks.add(asyncio.create_task(replay_trial(recorded_trial)))
+
+            while replay_tasks:
+                await wait_for_replay_task()
+            on_progress(launched_trials_count, finished_trials_count)
+            await trials_observer.wait_for_sample_producers()
+        finally:
             # Cancelling subtasks
-            observe_tasks_gathering = asyncio.gather(*observe_tasks)
-            observe_tasks_gathering.cancel()
-            await observe_tasks_gathering
+            for task in replay_tasks:
+                task.cancel()
+            await asyncio.gather(*replay_tasks, return_exceptions=True)
+            await trials_observer.close()
 
-    async def start_trials_and_wait_for_termination(
-        self, trial_configs, max_parallel_trials=4, on_progress=default_on_progress
-    ):
-        if self.get_status() is not RunSessionStatus.RUNNING:
-            raise RuntimeError(f"[{self.run_id}] not running")
-
-        trial_config_queue = asyncio.Queue()
-        started_trial_ids_chunk_prio_queue = asyncio.PriorityQueue()
-        sample_queue = asyncio.Queue()
+    def _start_workers(self, trial_configs, max_parallel_trials, on_progress, sample_queue, trials_observer):
+        trial_config_queue = asyncio.Queue(maxsize=1)
+        started_trial_ids_queue = asyncio.Queue()
 
         enqueue_trial_configs = asyncio.create_task(self._do_enqueue_trial_configs(trial_config_queue, trial_configs))
         start_trials = asyncio.create_task(
             self._do_start_trials(
                 trial_config_queue,
-                started_trial_ids_chunk_prio_queue,
+                started_trial_ids_queue,
+                sample_queue,
                 max_parallel_trials,
                 on_progress,
-                start_trial_throttle_timeout=500,
             )
         )
         observe_trials = asyncio.create_task(
-            self._do_observe_trials(started_trial_ids_chunk_prio_queue, sample_queue, trial_datastore_timeout=5000)
+            self._do_observe_trials(started_trial_ids_queue, trials_observer, trial_datastore_timeout=5000)
         )
-        workers = asyncio.gather(enqueue_trial_configs, start_trials, observe_trials)
+        return asyncio.gather(enqueue_trial_configs, start_trials, observe_trials)
 
-        try:
-            # We don't want the workers to be cancelled everytime a sample is retrieved
-            shielded_workers = asyncio.shield(workers)
+    def _check_workers(self, workers):
+        err = workers.exception()
+        if err is None:
+            # Workers have finished, trials were ran and listened to
+            return
+
+        if isinstance(err, asyncio.CancelledError):
+            raise asyncio.CancelledError
+
+        raise RuntimeError(f"[{self.run_id}] error while running and listening for trials") from err
+
+    async def _consume_sample_batches(self, workers, sample_queue, max_batch, max_latency_ms, autoscaler=None):
+        # We don't want the workers to be cancelled everytime a sample is retrieved
+        shielded_workers = asyncio.shield(workers)
+        loop = asyncio.get_running_loop()
+
+        async def wait_for_next_sample(timeout=None):
+            get_next_sample = asyncio.create_task(sample_queue.get())
+            wait_start_time = loop.time()
+            done, _ = await asyncio.wait(
+                {get_next_sample, shielded_workers}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            if autoscaler is not None:
+                # The learner is waiting for samples
+                autoscaler.on_learner_idle(loop.time() - wait_start_time)
+            if shielded_workers in done:
+                self._check_workers(workers)
+            if get_next_sample in done:
+                return get_next_sample.result()
+            get_next_sample.cancel()
+            return None
+
+        while not (sample_queue.empty() and workers.done()):
+            batch = []
+            if sample_queue.empty():
+                sample = await wait_for_next_sample()
+                if sample is None:
+                    # Workers have finished, let's continue as long as there's still samples to emit
+                    continue
+                batch.append(sample)
+
+            deadline = loop.time() + max_latency_ms / 1000.0
+            while len(batch) < max_batch:
+                if not sample_queue.empty():
+                    batch.append(sample_queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0 or workers.done():
+                    break
+                sample = await wait_for_next_sample(timeout)
+                if sample is None:
+                    break
+                batch.append(sample)
+
+            for _ in batch:
+                sample_queue.task_done()
 
-            while not (sample_queue.empty() and workers.done()):
-                get_next_sample = asyncio.create_task(sample_queue.get())
-                done, _ = await asyncio.wait({get_next_sample, shielded_workers}, return_when=asyncio.FIRST_COMPLETED)
+            TRIALLAUNCHER_SAMPLE_CONSUMED_COUNTER.inc(len(batch))
+            TRIALLAUNCHER_SAMPLE_QUEUE_LEN.set(sample_queue.qsize())
+            TRIALLAUNCHER_SAMPLE_QUEUE_BYTES.set(sample_queue.queued_bytes)
+            TRIALLAUNCHER_SAMPLE_QUEUE_SPILLED_BYTES.set(sample_queue.spilled_bytes)
+            TRIALLAUNCHER_SAMPLE_BATCH_SIZE.observe(len(batch))
 
-                if get_next_sample in done:
-                    yield get_next_sample.result()
-                    sample_queue.task_done()
+            yield batch
 
-                    TRIALLAUNCHER_SAMPLE_CONSUMED_COUNTER.inc()
-                    TRIALLAUNCHER_SAMPLE_QUEUE_LEN.set(sample_queue.qsize())
+    def _create_trials_observer(
+        self,
+        sample_queue,
+        max_trial_buffer_len=10,
+        max_overflow_len=1000,
+        sample_producer_workers=0,
+        record_dir=None,
+        spill_dir=None,
+    ):
+        run_sample_producer_pool = None
+        if sample_producer_workers > 0:
+            run_sample_producer_pool = RunSampleProducerPool(
+                cog_settings=self._cog_settings,
+                run_id=self.run_id,
+                run_config=self.config,
+                run_sample_producer_impl=self._run_sample_producer_impl,
+                workers_count=sample_producer_workers,
+            )
+            run_sample_producer_pool.start()
+
+        return _TrialsObserver(
+            cog_settings=self._cog_settings,
+            run_id=self.run_id,
+            run_config=self.config,
+            run_sample_producer_impl=self._run_sample_producer_impl,
+            stepper=self._stepper,
+            sample_queue=sample_queue,
+            demultiplexer=TrialSampleDemultiplexer(
+                self.run_id,
+                max_trial_buffer_len=max_trial_buffer_len,
+                max_overflow_len=max_overflow_len,
+                spill_dir=spill_dir,
+            ),
+            run_sample_producer_pool=run_sample_producer_pool,
+            recorder=TrialSampleRecorder(record_dir) if record_dir is not None else None,
+        )
 
-                if shielded_workers in done:
-                    err = workers.exception()
-                    if err is None:
-                        # Workers have finished, trials were ran and listened to
-                        # Let's continue as long as there's still samples to emit
-                        continue
+    async def _wait_for_batches(self, start_workers, max_batch, max_latency_ms, columnar, autoscaler=None, **kwargs):
+        if self.get_status() is not RunSessionStatus.RUNNING:
+            raise RuntimeError(f"[{self.run_id}] not running")
 
-                    if err is asyncio.CancelledError:
-                        raise asyncio.CancelledError
+        spill_dir = kwargs.pop("sample_spill_dir", None)
+        sample_queue = SampleQueue(
+            max_len=kwargs.pop("max_queued_samples", None),
+            spill_dir=spill_dir,
+            max_spilled_bytes=kwargs.pop("max_spilled_bytes", None),
+        )
+        workers = start_workers(sample_queue, self._create_trials_observer(sample_queue, spill_dir=spill_dir, **kwargs))
 
-                    raise RuntimeError(
-                        f"[{self.run_id}] error while running and listening for trials"
-                    ) from workers.exception()
+        try:
+            async for batch in self._consume_sample_batches(
+                workers, sample_queue, max_batch, max_latency_ms, autoscaler=autoscaler
+            ):
+                yield tuple(zip(*batch)) if columnar else batch
         finally:
             # Watever happens we want to cancel those workers when the function's returns
             workers.cancel()
-            await workers
+            try:
+                await workers
+            finally:
+                sample_queue.close()
+
+    def start_trials_and_wait_for_batches(
+        self,
+        trial_configs,
+        max_batch=256,
+        max_latency_ms=10,
+        max_parallel_trials=4,
+        on_progress=default_on_progress,
+        columnar=False,
+        **kwargs,
+    ):
+        """
+        Start the given trials and yield the produced training samples by batches.
+
+        Parameters:
+            trial_configs (iterable[TrialConfig] or async iterable[TrialConfig]): The configurations of the trials to start, lazily consumed, generators are supported, cf. `TrialConfigTemplate`
+            max_batch (int - default is 256): The maximum number of samples in a batch
+            max_latency_ms (int - default is 10): How long to wait for a batch to fill up once a first sample is available
+            max_parallel_trials (int or ParallelTrialsAutoscaler - default is 4): The maximum number of trials running at the same time, or an autoscaler adjusting it while the trials run
+            on_progress (f(int, int)): Called with the launched and finished trials counts
+            columnar (bool - default is False): If true, batches are yielded as a tuple of columns instead of a list of rows
+            max_queued_samples (int - optional): High-water mark of the sample queue, once reached no new trial is started and trial observation is paused
+            sample_spill_dir (string - optional): If defined, samples above the high-water mark, and trial samples held back for lagging sample producers above their share, are spilled to disk in this directory instead of pausing
+            max_spilled_bytes (int - optional): When spilling, size of the spilled samples above which trial observation is paused
+            max_trial_buffer_len (int - default is 10): Number of trial samples buffered for each sample producer
+            max_overflow_len (int - default is 1000): Number of trial samples held back in memory for lagging sample producers above their limit, shared between the observed trials, cf. `TrialSampleDemultiplexer`
+            sample_producer_workers (int - default is 0): If positive, sample producers are executed by a pool of worker processes, cf. `RunSampleProducerPool`
+            record_dir (string - optional): If defined, the observed trial samples are recorded in this directory, cf. `replay_trials_and_wait_for_batches`
+        Yields:
+            batch: either a list of `(step_id, timestamp, trial_id, tick_id, sample)` or, if `columnar` is true, a `(step_ids, timestamps, trial_ids, tick_ids, samples)` tuple
+        """
+
+        def start_workers(sample_queue, trials_observer):
+            return self._start_workers(trial_configs, max_parallel_trials, on_progress, sample_queue, trials_observer)
+
+        autoscaler = max_parallel_trials if isinstance(max_parallel_trials, ParallelTrialsAutoscaler) else None
+        return self._wait_for_batches(
+            start_workers, max_batch, max_latency_ms, columnar, autoscaler=autoscaler, **kwargs
+        )
+
+    def replay_trials_and_wait_for_batches(
+        self,
+        record_dir,
+        max_batch=256,
+        max_latency_ms=10,
+        max_parallel_trials=4,
+        on_progress=default_on_progress,
+        columnar=False,
+        **kwargs,
+    ):
+        """
+        Replay trials recorded with `record_dir` through the sample producer and yield the produced training samples by batches.
+
+        Neither the orchestrator nor the trial datastore are involved, the run session can be created without them.
+
+        Parameters:
+            record_dir (string): The directory where the trials were recorded
+            max_parallel_trials (int - default is 4): The maximum number of trials replayed at the same time
+            other parameters: see `start_trials_and_wait_for_batches`
+        Yields:
+            batch: see `start_trials_and_wait_for_batches`
+        """
+
+        def start_workers(_sample_queue, trials_observer):
+            return asyncio.ensure_future(
+                self._do_replay_trials(
+                    read_recorded_trials(record_dir), trials_observer, max_parallel_trials, on_progress
+                )
+            )
+
+        return self._wait_for_batches(start_workers, max_batch, max_latency_ms, columnar, **kwargs)
+
+    async def start_trials_and_wait_for_termination(
+        self, trial_configs, max_parallel_trials=4, on_progress=default_on_progress, **kwargs
+    ):
+        """
+        Start the given trials and yield the produced training samples one by one.
+
+        Parameters:
+            trial_configs (iterable[TrialConfig] or async iterable[TrialConfig]): The configurations of the trials to start, lazily consumed
+            max_parallel_trials (int or ParallelTrialsAutoscaler - default is 4): The maximum number of trials running at the same time, or an autoscaler adjusting it
+            on_progress (f(int, int)): Called with the launched and finished trials counts
+            kwargs: buffering, execution and recording parameters, see `start_trials_and_wait_for_batches`
+        Yields:
+            (step_id, timestamp, trial_id, tick_id, sample): The produced training samples
+        """
+        async for batch in self.start_trials_and_wait_for_batches(
+            trial_configs,
+            max_batch=UNBATCHED_MAX_BATCH,
+            max_latency_ms=0,
+            max_parallel_trials=max_parallel_trials,
+            on_progress=on_progress,
+            **kwargs,
+        ):
+            for sample in batch:
+                yield sample
+
+
+class _TrialsObserver:
+    """
+    Create the sample producer sessions of the observed trials and route the trial samples to them.
+    """
+
+    def __init__(
+        self,
+        cog_settings,
+        run_id,
+        run_config,
+        run_sample_producer_impl,
+        stepper,
+        sample_queue,
+        demultiplexer,
+        run_sample_producer_pool,
+        recorder,
+    ):
+        self._cog_settings = cog_settings
+        self._run_id = run_id
+        self._run_config = run_config
+        self._run_sample_producer_impl = run_sample_producer_impl
+        self._stepper = stepper
+        self._sample_queue = sample_queue
+        self._demultiplexer = demultiplexer
+        self._run_sample_producer_pool = run_sample_producer_pool
+        self._recorder = recorder
+        self._run_sample_producer_tasks = set()
+
+    def _produce_training_sample(self, trial_id, tick_id, sample):
+        step_id, step_timestamp = self._stepper.step(trial_id, tick_id)
+        self._sample_queue.put_nowait((step_id, step_timestamp, trial_id, tick_id, sample))
+
+        TRIALLAUNCHER_SAMPLE_PRODUCED_COUNTER.inc()
+
+        return step_id, step_timestamp
+
+    def _create_run_sample_producer_session(self, trial_id, trial_params):
+        if self._run_sample_producer_pool is not None:
+            return self._run_sample_producer_pool.create_session(
+                trial_id=trial_id,
+                trial_params=trial_params,
+                produce_training_sample=self._produce_training_sample,
+            )
+        return RunSampleProducerSession(
+            cog_settings=self._cog_settings,
+            run_id=self._run_id,
+            trial_id=trial_id,
+            trial_params=trial_params,
+            produce_training_sample=self._produce_training_sample,
+            run_config=self._run_config,
+            run_sample_producer_impl=self._run_sample_producer_impl,
+        )
+
+    def on_trials_started(self, trial_infos):
+        trial_start_time = time.time()
+
+        def on_sample_producer_done(_task, trial_id):
+            self._demultiplexer.release_session(trial_id)
+            self._stepper.end_trial(trial_id)
+            TRIALLAUNCHER_TRIAL_TIME.observe(time.time() - trial_start_time)
+
+        for trial_info in trial_infos:
+            if self._recorder is not None:
+                self._recorder.add_trial(trial_info.trial_id, trial_info.params)
+
+            session = self._create_run_sample_producer_session(trial_info.trial_id, trial_info.params)
+            self._demultiplexer.add_session(session)
+            task = session.exec()
+            task.add_done_callback(lambda task, trial_id=session.trial_id: on_sample_producer_done(task, trial_id))
+            self._run_sample_producer_tasks.add(task)
+
+        TRIALLAUNCHER_TRIAL_STARTED_COUNTER.inc(len(trial_infos))
+
+    async def on_sample(self, sample):
+        if self._recorder is not None:
+            self._recorder.record(sample)
+        await _wait_for_sample_queue_capacity(self._sample_queue)
+        await self._demultiplexer.dispatch(sample)
+
+    async def on_trials_ended(self, trial_ids):
+        for trial_id in trial_ids:
+            await self._demultiplexer.remove_session(trial_id)
+
+    async def wait_for_sample_producers(self):
+        if self._run_sample_producer_tasks:
+            await asyncio.wait(self._run_sample_producer_tasks)
+
+    async def close(self):
+        for task in self._run_sample_producer_tasks:
+            task.cancel()
+        await asyncio.gather(*self._run_sample_producer_tasks, return_exceptions=True)
+        if self._run_sample_producer_pool is not None:
+            await self._run_sample_producer_pool.stop()
+        if self._recorder is not None:
+            await self._recorder.close()
@@ -0,0 +1,278 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Hermetic throughput benchmark of the run pipeline.
+
+Synthetic trials are fed to a `RunSession` through fake controller and trial datastore clients, samples go through the
+regular observation, sample production and batching machinery and are consumed with
+`start_trials_and_wait_for_termination`.
+
+Usage: python -m cogment_verse.run.run_session_benchmark --observation atari --trials 16 --trial-length 500
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import logging
+import time
+import types
+
+import numpy as np
+from cogment.api.common_pb2 import TrialParams, TrialState
+from cogment.api.trial_datastore_pb2 import StoredTrialSample
+from cogment_verse.run.local_trial_runner import LocalTrialInfo, LocalTrialRunner
+from cogment_verse.run.parallel_trials_autoscaler import ParallelTrialsAutoscaler
+from cogment_verse.run.run_session import RunSession
+
+log = logging.getLogger(__name__)
+
+# pylint: disable=too-many-arguments, too-many-locals
+
+OBSERVATION_PRESETS = {
+    # 4 float32 values, like CartPole
+    "cartpole": ((4,), np.float32),
+    # 4 stacked 84x84 grayscale frames, like Atari
+    "atari": ((4, 84, 84), np.uint8),
+}
+
+# Samples only carry raw payloads, actor classes are only needed to build the sample producer sessions
+BENCHMARK_ACTOR_CLASS = "agent"
+BENCHMARK_COG_SETTINGS = types.SimpleNamespace(
+    actor_classes={BENCHMARK_ACTOR_CLASS: types.SimpleNamespace(observation_space=None, action_space=None)},
+    trial=types.SimpleNamespace(config_type=None),
+)
+
+
+class StageTimer:
+    """
+    Accumulate the CPU time spent by the main thread in each stage of the pipeline.
+    """
+
+    def __init__(self):
+        self.stages_time = collections.defaultdict(float)
+        self._stage = None
+        self._start_time = None
+
+    def __call__(self, stage):
+        self._stage = stage
+        return self
+
+    def __enter__(self):
+        self._start_time = time.thread_time()
+
+    def __exit__(self, *_args):
+        self.stages_time[self._stage] += time.thread_time() - self._start_time
+
+
+class SyntheticTrial:
+    """
+    Trial emitting samples made of random observations, at the rate allowed by the trial runner.
+    """
+
+    def __init__(self, trial_id, trial_length, observation_shape, observation_dtype, pace, stage_timer):
+        self.trial_id = trial_id
+        self.state = TrialState.RUNNING
+        self.params = TrialParams()
+        self.params.actors.add(name="agent", actor_class=BENCHMARK_ACTOR_CLASS, implementation="synthetic")
+
+        self._trial_length = trial_length
+        self._observation = np.random.randint(0, 255, size=observation_shape).astype(observation_dtype).tobytes()
+        self._pace = pace
+        self._stage_timer = stage_timer
+        self._samples = asyncio.Queue(maxsize=100)
+
+    def get_info(self):
+        return LocalTrialInfo(self.trial_id, self.state, self.params)
+
+    async def get_sample(self):
+        return await self._samples.get()
+
+    async def run(self):
+        for tick_id in range(self._trial_length):
+            await self._pace()
+            with self._stage_timer("trials"):
+                last_tick = tick_id == self._trial_length - 1
+                sample = StoredTrialSample(
+                    trial_id=self.trial_id,
+                    tick_id=tick_id,
+                    timestamp=time.time_ns(),
+                    state=TrialState.ENDED if last_tick else TrialState.RUNNING,
+                    payloads=[self._observation, tick_id.to_bytes(4, "little")],
+                )
+                sample.actor_samples.add(actor=0, observation=0, action=1, reward=1.0)
+            await self._samples.put(sample)
+        self.state = TrialState.ENDED
+        await self._samples.put(None)
+
+
+class SyntheticTrialRunner(LocalTrialRunner):
+    """
+    Fake controller and trial datastore client starting synthetic trials, whatever the given trial configurations.
+    """
+
+    def __init__(self, trial_length, observation_shape, observation_dtype, samples_per_sec, stage_timer):
+        super().__init__(user_id="benchmark", environment_impls={}, actor_impls={})
+        self._trial_length = trial_length
+        self._observation_shape = observation_shape
+        self._observation_dtype = observation_dtype
+        self._sample_period = 1.0 / samples_per_sec if samples_per_sec > 0 else 0.0
+        self._next_sample_time = 0.0
+        self._stage_timer = stage_timer
+
+    async def _pace(self):
+        # Samples of all the trials are evenly spread to match the target rate
+        now = time.perf_counter()
+        sample_time = max(self._next_sample_time, now)
+        self._next_sample_time = sample_time + self._sample_period
+        await asyncio.sleep(sample_time - now)
+
+    def _create_trial(self, trial_id, trial_config):
+        return SyntheticTrial(
+            trial_id,
+            self._trial_length,
+            self._observation_shape,
+            self._observation_dtype,
+            self._pace,
+            self._stage_timer,
+        )
+
+
+async def run_benchmark(
+    trials_count=8,
+    trial_length=1000,
+    observation="cartpole",
+    samples_per_sec=0,
+    max_parallel_trials=4,
+    **run_kwargs,
+):
+    """
+    Run the benchmark and return its measurements
+
+    Parameters:
+        trials_count (int - default is 8): The number of synthetic trials
+        trial_length (int - default is 1000): The number of samples of each trial
+        observation (string - default is "cartpole"): The observation preset, one of `OBSERVATION_PRESETS`
+        samples_per_sec (float - default is 0): The target rate of sample emission, 0 for as fast as possible
+        max_parallel_trials (int or ParallelTrialsAutoscaler - default is 4): The maximum number of parallel trials
+        run_kwargs: forwarded to `start_trials_and_wait_for_termination`
+    Returns:
+        results (dict): samples count, samples/sec, queue latency percentiles and per-stage CPU time
+    """
+    observation_shape, observation_dtype = OBSERVATION_PRESETS[observation]
+    stage_timer = StageTimer()
+    trial_runner = SyntheticTrialRunner(
+        trial_length, observation_shape, observation_dtype, samples_per_sec, stage_timer
+    )
+
+    async def sample_producer_impl(run_sample_producer_session):
+        async for sample in run_sample_producer_session.get_all_samples():
+            with stage_timer("sample_producers"):
+                observation = np.frombuffer(
+                    sample.get_actor_observation(0, deserialize=False, as_memoryview=True), dtype=observation_dtype
+                ).reshape(observation_shape)
+                run_sample_producer_session.produce_training_sample(
+                    (observation, sample.get_actor_reward(0), sample.get_timestamp())
+                )
+
+    latencies = np.zeros(trials_count * trial_length, dtype=np.float64)
+    samples_count = 0
+
+    async def run_impl(run_session):
+        nonlocal samples_count
+        async for (
+            _step_idx,
+            _step_timestamp,
+            _trial_id,
+            _tick_id,
+            sample,
+        ) in run_session.start_trials_and_wait_for_termination(
+            range(trials_count), max_parallel_trials=max_parallel_trials, **run_kwargs
+        ):
+            with stage_timer("learner"):
+                _observation, _reward, emission_timestamp = sample
+                latencies[samples_count] = (time.time_ns() - emission_timestamp) / 1e6
+                samples_count += 1
+
+    run_session = RunSession(
+        cog_settings=BENCHMARK_COG_SETTINGS,
+        controller=trial_runner,
+        trial_datastore_client=trial_runner,
+        config=None,
+        run_sample_producer_impl=sample_producer_impl,
+        impl_name="benchmark",
+        run_impl=run_impl,
+        params_name="benchmark",
+    )
+
+    start_wall_time = time.perf_counter()
+    start_thread_time = time.thread_time()
+    start_process_time = time.process_time()
+    try:
+        await run_session.exec()
+    finally:
+        await trial_runner.close()
+    wall_time = time.perf_counter() - start_wall_time
+    thread_time = time.thread_time() - start_thread_time
+    process_time = time.process_time() - start_process_time
+
+    stages_time = dict(stage_timer.stages_time)
+    stages_time["run_session"] = thread_time - sum(stages_time.values())
+    stages_time["other_threads"] = max(0.0, process_time - thread_time)
+
+    latencies = latencies[:samples_count]
+    return {
+        "samples_count": samples_count,
+        "wall_time_sec": wall_time,
+        "samples_per_sec": samples_count / wall_time,
+        "queue_latency_ms": {
+            f"p{percentile}": float(np.percentile(latencies, percentile)) if samples_count else None
+            for percentile in [50, 90, 99]
+        },
+        "stages_cpu_sec": stages_time,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hermetic throughput benchmark of the run pipeline")
+    parser.add_argument("--trials", type=int, default=8, help="number of synthetic trials")
+    parser.add_argument("--trial-length", type=int, default=1000, help="number of samples of each trial")
+    parser.add_argument("--observation", choices=sorted(OBSERVATION_PRESETS.keys()), default="cartpole")
+    parser.add_argument("--samples-per-sec", type=float, default=0, help="target emission rate, 0 for unbounded")
+    parser.add_argument("--parallel-trials", type=int, default=4, help="maximum number of parallel trials")
+    parser.add_argument("--autoscale", action="store_true", help="adjust the number of parallel trials at runtime")
+    parser.add_argument("--max-queued-samples", type=int, default=None, help="high-water mark of the sample queue")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    results = asyncio.run(
+        run_benchmark(
+            trials_count=args.trials,
+            trial_length=args.trial_length,
+            observation=args.observation,
+            samples_per_sec=args.samples_per_sec,
+            max_parallel_trials=(
+                ParallelTrialsAutoscaler(initial_parallel_trials=args.parallel_trials)
+                if args.autoscale
+                else args.parallel_trials
+            ),
+            max_queued_samples=args.max_queued_samples,
+        )
+    )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
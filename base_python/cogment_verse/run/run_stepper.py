@@ -14,36 +14,90 @@
 
 import time
 
-from cogment_verse.utils import LRU
+import numpy as np
 
-
-def compute_full_tick_id(trial_id, tick_id):
-    return f"{trial_id}-#{tick_id}"
+# Step ids start at 1, 0 marks ticks without a step
+NO_STEP = 0
 
 
 class RunStepper:
-    def __init__(self):
+    """
+    Attribute consecutive step ids and timestamps to the ticks of the trials of a run.
+
+    Each live trial is interned to a slot holding an array of `(step_id, timestamp)` indexed by tick, relative to its
+    first stepped tick. Slots are recycled once trials are ended.
+    """
+
+    def __init__(self, initial_ticks_capacity=1024):
         self._steps_count = 0
-        self._step_from_full_tick_id = LRU(100000)
+        self._initial_ticks_capacity = initial_ticks_capacity
+
+        self._slot_from_trial_id = {}
+        self._free_slots = []
+        self._tick_offsets = np.zeros(16, dtype=np.int64)
+        self._steps = []
 
     def count_steps(self):
         return self._steps_count
 
+    def count_live_trials(self):
+        return len(self._slot_from_trial_id)
+
+    def _allocate_slot(self, trial_id, tick_id):
+        if self._free_slots:
+            slot = self._free_slots.pop()
+            self._steps[slot].fill(NO_STEP)
+        else:
+            slot = len(self._steps)
+            self._steps.append(np.zeros((self._initial_ticks_capacity, 2), dtype=np.int64))
+            if slot >= len(self._tick_offsets):
+                self._tick_offsets = np.concatenate([self._tick_offsets, np.zeros_like(self._tick_offsets)])
+
+        self._tick_offsets[slot] = tick_id
+        self._slot_from_trial_id[trial_id] = slot
+        return slot
+
+    def _get_trial_steps(self, trial_id, tick_id):
+        slot = self._slot_from_trial_id.get(trial_id)
+        if slot is None:
+            return None, -1
+        return self._steps[slot], tick_id - self._tick_offsets[slot]
+
     def get_step(self, trial_id, tick_id):
-        full_tick_id = compute_full_tick_id(trial_id, tick_id)
-        if full_tick_id not in self._step_from_full_tick_id:
-            # The step has not been "started" yet, or is no longer in cache
+        trial_steps, tick_idx = self._get_trial_steps(trial_id, tick_id)
+        if trial_steps is None or tick_idx < 0 or tick_idx >= len(trial_steps) or trial_steps[tick_idx, 0] == NO_STEP:
+            # The step has not been "started" yet, or the trial has ended
             raise Exception(f"Unknown step for trial [{trial_id}] at tick [{tick_id}]")
-        return self._step_from_full_tick_id[full_tick_id]
+        return int(trial_steps[tick_idx, 0]), int(trial_steps[tick_idx, 1])
 
     def step(self, trial_id, tick_id):
-        full_tick_id = compute_full_tick_id(trial_id, tick_id)
-        if full_tick_id in self._step_from_full_tick_id:
+        trial_steps, tick_idx = self._get_trial_steps(trial_id, tick_id)
+        if trial_steps is None:
+            slot = self._allocate_slot(trial_id, tick_id)
+            trial_steps, tick_idx = self._steps[slot], 0
+        elif tick_idx < 0:
+            raise Exception(f"Step for trial [{trial_id}] at tick [{tick_id}] before its first step")
+        elif tick_idx >= len(trial_steps):
+            slot = self._slot_from_trial_id[trial_id]
+            capacity = len(trial_steps)
+            while capacity <= tick_idx:
+                capacity *= 2
+            trial_steps = np.concatenate([trial_steps, np.zeros((capacity - len(trial_steps), 2), dtype=np.int64)])
+            self._steps[slot] = trial_steps
+        elif trial_steps[tick_idx, 0] != NO_STEP:
             # The step has already been "started"
             raise Exception(f"Existing step for trial [{trial_id}] at tick [{tick_id}]")
 
         self._steps_count += 1
         step = (self._steps_count, int(time.time() * 1000))
-        self._step_from_full_tick_id[full_tick_id] = step
+        trial_steps[tick_idx] = step
 
         return step
+
+    def end_trial(self, trial_id):
+        """
+        Release the memory used to store the steps of an ended trial.
+        """
+        slot = self._slot_from_trial_id.pop(trial_id, None)
+        if slot is not None:
+            self._free_slots.append(slot)
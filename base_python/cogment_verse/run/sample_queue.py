@@ -0,0 +1,146 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import collections
+import pickle
+import tempfile
+
+from cogment_verse.utils.estimate_size import estimate_size
+
+
+class SpillSegment:
+    """
+    Append-only FIFO of pickled items stored in an anonymous temporary file.
+    """
+
+    def __init__(self, spill_dir):
+        self._file = tempfile.TemporaryFile(dir=spill_dir)
+        self._entries = collections.deque()
+        self._write_offset = 0
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def append(self, item):
+        data = pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)
+        self._file.seek(self._write_offset)
+        self._file.write(data)
+        self._entries.append((self._write_offset, len(data)))
+        self._write_offset += len(data)
+        self.nbytes += len(data)
+
+    def popleft(self):
+        offset, size = self._entries.popleft()
+        self._file.seek(offset)
+        item = pickle.loads(self._file.read(size))
+        self.nbytes -= size
+        if not self._entries:
+            # Everything has been read back, reclaiming the disk space
+            self._file.truncate(0)
+            self._write_offset = 0
+        return item
+
+    def close(self):
+        self._file.close()
+
+
+class SampleQueue(asyncio.Queue):
+    """
+    Unbounded queue of training samples with a high-water mark.
+
+    Putting never blocks, instead producers are expected to `await wait_for_capacity()` before producing more
+    samples. Once `max_len` samples are held in memory, new items are either kept in memory or, if `spill_dir` is
+    defined, appended to an overflow segment on disk, in which case producers are only paused once `max_spilled_bytes`
+    is reached. Items are always retrieved in FIFO order.
+    """
+
+    def __init__(self, max_len=None, spill_dir=None, max_spilled_bytes=None, estimate_item_size=estimate_size):
+        self._max_len = max_len
+        self._spill_dir = spill_dir
+        self._max_spilled_bytes = max_spilled_bytes
+        self._estimate_item_size = estimate_item_size
+        self._has_capacity = asyncio.Event()
+        self._has_capacity.set()
+        super().__init__()
+
+    def _init(self, maxsize):
+        self._queue = collections.deque()
+        self._spill = None
+        self.queued_bytes = 0
+
+    def _put(self, item):
+        if self._spill_dir is not None and self._max_len is not None:
+            if len(self._queue) >= self._max_len or (self._spill is not None and len(self._spill) > 0):
+                if self._spill is None:
+                    self._spill = SpillSegment(self._spill_dir)
+                self._spill.append(item)
+                self._update_capacity()
+                return
+
+        size = self._estimate_item_size(item)
+        self._queue.append((item, size))
+        self.queued_bytes += size
+        self._update_capacity()
+
+    def _get(self):
+        if not self._queue:
+            self._refill_from_spill()
+        item, size = self._queue.popleft()
+        self.queued_bytes -= size
+        if not self._queue:
+            self._refill_from_spill()
+        self._update_capacity()
+        return item
+
+    def _refill_from_spill(self):
+        while self._spill is not None and len(self._spill) > 0 and len(self._queue) < self._max_len:
+            item = self._spill.popleft()
+            size = self._estimate_item_size(item)
+            self._queue.append((item, size))
+            self.queued_bytes += size
+
+    def _update_capacity(self):
+        if self._max_len is None:
+            return
+        if self._spill_dir is not None:
+            full = self._max_spilled_bytes is not None and self.spilled_bytes >= self._max_spilled_bytes
+        else:
+            full = len(self._queue) >= self._max_len
+        if full:
+            self._has_capacity.clear()
+        else:
+            self._has_capacity.set()
+
+    @property
+    def spilled_bytes(self):
+        return self._spill.nbytes if self._spill is not None else 0
+
+    def qsize(self):
+        return len(self._queue) + (len(self._spill) if self._spill is not None else 0)
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def is_paused(self):
+        return not self._has_capacity.is_set()
+
+    async def wait_for_capacity(self):
+        await self._has_capacity.wait()
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
@@ -0,0 +1,58 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+class TrialConfigTemplate:
+    """
+    Create trial configurations sharing most of their content.
+
+    The shared part is serialized once, each created trial configuration is parsed from it and the per-trial patch is
+    merged on top, which is much cheaper than deep copies. Merging follows the protobuf semantics: singular fields set
+    in the patch override the template's, repeated fields are appended. Fields set to their default value in the patch
+    are not serialized, per-trial fields should be left to their default value in the template.
+    """
+
+    def __init__(self, trial_config):
+        """
+        Parameters:
+            trial_config: The shared part of the trial configurations
+        """
+        self._trial_config_class = type(trial_config)
+        self._serialized_trial_config = trial_config.SerializeToString()
+
+    def create(self, patch=None):
+        """
+        Create a trial configuration
+
+        Parameters:
+            patch (optional): A partial trial configuration with the per-trial fields
+        Returns:
+            trial_config: The created trial configuration
+        """
+        if patch is None:
+            return self._trial_config_class.FromString(self._serialized_trial_config)
+        return self._trial_config_class.FromString(self._serialized_trial_config + patch.SerializeToString())
+
+    def generate(self, count, create_patch=None):
+        """
+        Lazily create trial configurations, to be given to `RunSession.start_trials_and_wait_for_termination`.
+
+        Parameters:
+            count (int): The number of trial configurations to create
+            create_patch (f(int) - optional): Create the patch of a trial from its index
+        Yields:
+            trial_config: The created trial configurations
+        """
+        for trial_idx in range(count):
+            yield self.create(create_patch(trial_idx) if create_patch is not None else None)
@@ -0,0 +1,175 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import collections
+import logging
+
+import cogment
+from prometheus_client import Counter
+
+log = logging.getLogger(__name__)
+
+TRIAL_END_DISPATCHER_EVENTS_COUNTER = Counter(
+    "trial_end_dispatcher_events", "Counter of the trial end events received by the dispatcher", ["dispatched"]
+)
+
+# Number of ended trials remembered when nobody owns them yet, in case their owner registers them late
+MAX_UNCLAIMED_ENDED_TRIALS = 10000
+WATCH_RETRY_DELAY_SEC = 1.0
+
+
+class TrialEndSubscription:
+    """
+    Receive the end events of the trials added to it, cf. `TrialEndDispatcher.subscribe`.
+    """
+
+    def __init__(self, dispatcher):
+        self._dispatcher = dispatcher
+        self._queue = asyncio.Queue()
+
+    def add_trial(self, trial_id):
+        self._dispatcher.add_trial(self, trial_id)
+
+    def on_trial_ended(self, trial_info):
+        self._queue.put_nowait(trial_info)
+
+    def on_error(self, error):
+        self._queue.put_nowait(error)
+
+    def close(self):
+        self._dispatcher.unsubscribe(self)
+
+    async def watch_ended_trials(self):
+        """
+        Yields:
+            trial_info: The information of the ended trials
+        """
+        while True:
+            item = await self._queue.get()
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+class TrialEndDispatcher:
+    """
+    Watch the ended trials through a single stream and dispatch each end event to the subscription owning the trial.
+
+    Listeners receive every end event. The stream is opened when needed and closed when there are no more
+    subscriptions nor listeners.
+    """
+
+    def __init__(self, get_controller):
+        """
+        Parameters:
+            get_controller (f()): Returns the cogment controller used to watch the trials
+        """
+        self._get_controller = get_controller
+        self._subscription_from_trial_id = {}
+        self._subscriptions = set()
+        self._listeners = []
+        self._missed_events_listeners = []
+        self._unclaimed_ended_trials = collections.OrderedDict()
+        self._watch_task = None
+
+    def subscribe(self):
+        subscription = TrialEndSubscription(self)
+        self._subscriptions.add(subscription)
+        self._ensure_watching()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._subscriptions.discard(subscription)
+        for trial_id in [
+            trial_id for trial_id, owner in self._subscription_from_trial_id.items() if owner is subscription
+        ]:
+            del self._subscription_from_trial_id[trial_id]
+        self._stop_watching_if_unused()
+
+    def add_listener(self, listener, on_events_missed=None):
+        """
+        Parameters:
+            listener (f(trial_info)): Called for every ended trial
+            on_events_missed (f() - optional): Called when end events may have been missed, the stream of ended trials
+                being interrupted
+        """
+        self._listeners.append(listener)
+        if on_events_missed is not None:
+            self._missed_events_listeners.append(on_events_missed)
+        self._ensure_watching()
+
+    def add_trial(self, subscription, trial_id):
+        trial_info = self._unclaimed_ended_trials.pop(trial_id, None)
+        if trial_info is not None:
+            # The trial ended before being added
+            subscription.on_trial_ended(trial_info)
+            return
+        self._subscription_from_trial_id[trial_id] = subscription
+
+    def _dispatch(self, trial_info):
+        for listener in self._listeners:
+            listener(trial_info)
+
+        subscription = self._subscription_from_trial_id.pop(trial_info.trial_id, None)
+        TRIAL_END_DISPATCHER_EVENTS_COUNTER.labels(dispatched=subscription is not None).inc()
+        if subscription is not None:
+            subscription.on_trial_ended(trial_info)
+            return
+
+        if self._subscriptions:
+            self._unclaimed_ended_trials[trial_info.trial_id] = trial_info
+            while len(self._unclaimed_ended_trials) > MAX_UNCLAIMED_ENDED_TRIALS:
+                self._unclaimed_ended_trials.popitem(last=False)
+
+    async def _watch(self):
+        while True:
+            try:
+                async for trial_info in self._get_controller().watch_trials(
+                    trial_state_filters=[cogment.TrialState.ENDED]
+                ):
+                    self._dispatch(trial_info)
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                # End events may have been missed, the current subscriptions can't be trusted anymore
+                log.warning(f"Error while watching the ended trials: {error}")
+                for subscription in list(self._subscriptions):
+                    subscription.on_error(RuntimeError("An error occured while monitoring the trials"))
+                    self.unsubscribe(subscription)
+                for on_events_missed in self._missed_events_listeners:
+                    on_events_missed()
+                if not self._listeners:
+                    return
+                await asyncio.sleep(WATCH_RETRY_DELAY_SEC)
+
+    def _ensure_watching(self):
+        if self._watch_task is None or self._watch_task.done():
+            self._watch_task = asyncio.create_task(self._watch())
+
+    def _stop_watching_if_unused(self):
+        if not self._subscriptions and not self._listeners and self._watch_task is not None:
+            self._watch_task.cancel()
+            self._watch_task = None
+            self._unclaimed_ended_trials.clear()
+
+    async def close(self):
+        self._listeners = []
+        self._missed_events_listeners = []
+        for subscription in list(self._subscriptions):
+            self.unsubscribe(subscription)
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            await asyncio.gather(self._watch_task, return_exceptions=True)
+            self._watch_task = None
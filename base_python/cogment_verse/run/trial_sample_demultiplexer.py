@@ -0,0 +1,195 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import collections
+import logging
+import time
+
+from cogment_verse.run.sample_queue import SpillSegment
+from prometheus_client import Counter, Gauge, Summary
+
+log = logging.getLogger(__name__)
+
+TRIALLAUNCHER_TRIAL_BLOCKED_TIME = Summary(
+    "triallauncher_trial_blocked_seconds",
+    "Time during which a trial had more buffered samples than its sample producer could keep up with",
+    ["run_id"],
+)
+TRIALLAUNCHER_DEMUX_BACKLOG_LEN = Gauge(
+    "triallauncher_demux_backlog_len", "Number of samples held back for lagging sample producers", ["run_id"]
+)
+TRIALLAUNCHER_DEMUX_SPILLED_COUNTER = Counter(
+    "triallauncher_demux_spilled", "Counter of samples of lagging trials spilled to disk", ["run_id"]
+)
+
+
+class _TrialBacklog:
+    """
+    Samples of a lagging trial held back until its sample producer consumes the ones it was given.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.buffer_len = 0
+        self.samples = collections.deque()
+        self.spill = None
+        self.done = False
+        self.blocked_since = None
+        self.consumed = asyncio.Event()
+        self.pump_task = None
+
+    def __len__(self):
+        return len(self.samples) + (len(self.spill) if self.spill is not None else 0)
+
+    def is_pumping(self):
+        return self.pump_task is not None and not self.pump_task.done()
+
+    def popleft(self):
+        if self.samples:
+            return self.samples.popleft()
+        return self.spill.popleft()
+
+    def close(self):
+        if self.pump_task is not None:
+            self.pump_task.cancel()
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
+
+
+class TrialSampleDemultiplexer:
+    """
+    Route the samples of a shared stream to the sample producer session of their trial.
+
+    Each session is given at most `max_trial_buffer_len` unconsumed samples. The following samples of a lagging trial
+    are held back by the demultiplexer and handed over as the session consumes the previous ones, each trial
+    independently of the others. Dispatching never waits for a lagging trial, the shared stream is never paused by it.
+
+    Held back samples are kept in memory up to an equal share of `max_overflow_len` for each observed trial, above it
+    they are spilled to disk in `spill_dir` if it is defined, otherwise they are kept in memory as well.
+    """
+
+    def __init__(self, run_id, max_trial_buffer_len=10, max_overflow_len=1000, spill_dir=None):
+        self._run_id = run_id
+        self._max_trial_buffer_len = max_trial_buffer_len
+        self._max_overflow_len = max_overflow_len
+        self._spill_dir = spill_dir
+
+        # Sessions still receiving samples
+        self._sessions = {}
+        # Sessions until they are released
+        self._trials = {}
+        self._backlog_len = 0
+
+    def __contains__(self, trial_id):
+        return trial_id in self._sessions
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def add_session(self, session):
+        trial_id = session.trial_id
+        self._sessions[trial_id] = session
+        self._trials[trial_id] = _TrialBacklog(session)
+        session.set_on_sample_consumed(lambda: self._on_sample_consumed(trial_id))
+
+    def _get_trial_max_overflow_len(self):
+        return max(1, self._max_overflow_len // max(1, len(self._trials)))
+
+    def _update_backlog_len(self, delta):
+        self._backlog_len += delta
+        TRIALLAUNCHER_DEMUX_BACKLOG_LEN.labels(run_id=self._run_id).set(self._backlog_len)
+
+    def _hold_back(self, trial, sample):
+        if trial.blocked_since is None:
+            trial.blocked_since = time.time()
+
+        if self._spill_dir is not None and (
+            len(trial) > len(trial.samples) or len(trial.samples) >= self._get_trial_max_overflow_len()
+        ):
+            # The spilled samples come after the ones in memory
+            if trial.spill is None:
+                trial.spill = SpillSegment(self._spill_dir)
+            trial.spill.append(sample)
+            TRIALLAUNCHER_DEMUX_SPILLED_COUNTER.labels(run_id=self._run_id).inc()
+        else:
+            trial.samples.append(sample)
+        self._update_backlog_len(1)
+
+    async def _pump(self, trial):
+        while len(trial) > 0:
+            while trial.buffer_len >= self._max_trial_buffer_len:
+                trial.consumed.clear()
+                await trial.consumed.wait()
+            sample = trial.popleft()
+            self._update_backlog_len(-1)
+            trial.buffer_len += 1
+            await trial.session.on_trial_sample(sample)
+
+        if trial.blocked_since is not None:
+            TRIALLAUNCHER_TRIAL_BLOCKED_TIME.labels(run_id=self._run_id).observe(time.time() - trial.blocked_since)
+            trial.blocked_since = None
+        if trial.done:
+            await trial.session.on_trial_done()
+
+    async def remove_session(self, trial_id):
+        """
+        Notify the session of the given trial that its trial is done, once it was given every held back sample, and
+        stop routing samples to it.
+        """
+        self._sessions.pop(trial_id)
+        trial = self._trials[trial_id]
+        if trial.is_pumping():
+            trial.done = True
+            return
+        await trial.session.on_trial_done()
+
+    async def dispatch(self, sample):
+        trial_id = sample.trial_id
+        if trial_id not in self._sessions:
+            log.warning(f"[{self._run_id}] Ignoring a sample for unobserved trial [{trial_id}]")
+            return
+
+        trial = self._trials[trial_id]
+        if trial.buffer_len < self._max_trial_buffer_len and not trial.is_pumping():
+            trial.buffer_len += 1
+            await trial.session.on_trial_sample(sample)
+            return
+
+        self._hold_back(trial, sample)
+        if not trial.is_pumping():
+            trial.pump_task = asyncio.create_task(self._pump(trial))
+
+    def _on_sample_consumed(self, trial_id):
+        trial = self._trials.get(trial_id)
+        if trial is None:
+            # Already released
+            return
+        trial.buffer_len -= 1
+        trial.consumed.set()
+
+    def release_session(self, trial_id):
+        """
+        Forget about a session whose sample producer is terminated, dropping the samples it didn't consume.
+        """
+        self._sessions.pop(trial_id, None)
+        trial = self._trials.pop(trial_id, None)
+        if trial is None:
+            return
+        if len(trial) > 0:
+            self._update_backlog_len(-len(trial))
+        if trial.blocked_since is not None:
+            TRIALLAUNCHER_TRIAL_BLOCKED_TIME.labels(run_id=self._run_id).observe(time.time() - trial.blocked_since)
+        trial.close()
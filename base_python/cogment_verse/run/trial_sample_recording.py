@@ -0,0 +1,215 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import logging
+import os
+import time
+
+import numpy as np
+from cogment.api.common_pb2 import TrialParams
+from cogment.api.trial_datastore_pb2 import StoredTrialSample
+
+log = logging.getLogger(__name__)
+
+SEGMENT_DIR_PREFIX = "segment_"
+
+# Columns of a segment, each one stored as a `.npy` file in the segment directory
+SAMPLES_DATA_COLUMN = "samples_data"
+SAMPLES_OFFSETS_COLUMN = "samples_offsets"
+SAMPLES_TRIAL_IDX_COLUMN = "samples_trial_idx"
+SAMPLES_TICK_ID_COLUMN = "samples_tick_id"
+TRIALS_ID_COLUMN = "trials_id"
+TRIALS_PARAMS_DATA_COLUMN = "trials_params_data"
+TRIALS_PARAMS_OFFSETS_COLUMN = "trials_params_offsets"
+
+
+def _concat_buffers(buffers):
+    offsets = np.zeros(len(buffers) + 1, dtype=np.int64)
+    np.cumsum([len(buffer) for buffer in buffers], out=offsets[1:])
+    return np.frombuffer(b"".join(buffers), dtype=np.uint8), offsets
+
+
+def _write_segment(segment_dir, trial_ids, trial_params, samples_trial_idx, samples_tick_id, samples):
+    tmp_segment_dir = segment_dir + ".tmp"
+    os.makedirs(tmp_segment_dir)
+
+    samples_data, samples_offsets = _concat_buffers(samples)
+    trials_params_data, trials_params_offsets = _concat_buffers(trial_params)
+    columns = {
+        SAMPLES_DATA_COLUMN: samples_data,
+        SAMPLES_OFFSETS_COLUMN: samples_offsets,
+        SAMPLES_TRIAL_IDX_COLUMN: np.array(samples_trial_idx, dtype=np.int32),
+        SAMPLES_TICK_ID_COLUMN: np.array(samples_tick_id, dtype=np.int64),
+        TRIALS_ID_COLUMN: np.array(trial_ids, dtype=np.str_),
+        TRIALS_PARAMS_DATA_COLUMN: trials_params_data,
+        TRIALS_PARAMS_OFFSETS_COLUMN: trials_params_offsets,
+    }
+    for column_name, column in columns.items():
+        np.save(os.path.join(tmp_segment_dir, f"{column_name}.npy"), column, allow_pickle=False)
+
+    # A segment is only visible once complete
+    os.rename(tmp_segment_dir, segment_dir)
+
+
+class TrialSampleRecorder:
+    """
+    Record the samples of trials to columnar segments in a local directory.
+
+    Samples are buffered and written to a new segment every `max_segment_samples` samples, in a background thread.
+    Each segment holds the serialized samples, their trial and tick, as well as the params of the trials they belong to.
+    """
+
+    def __init__(self, record_dir, max_segment_samples=10000):
+        self._record_dir = record_dir
+        self._max_segment_samples = max_segment_samples
+        os.makedirs(record_dir, exist_ok=True)
+
+        self._trial_params = {}
+        self._segments_count = 0
+        self._write_tasks = []
+        self._reset_segment()
+
+    def _reset_segment(self):
+        self._segment_trial_idx = {}
+        self._segment_samples_trial_idx = []
+        self._segment_samples_tick_id = []
+        self._segment_samples = []
+
+    def add_trial(self, trial_id, trial_params):
+        self._trial_params[trial_id] = trial_params.SerializeToString()
+
+    def record(self, sample):
+        trial_idx = self._segment_trial_idx.setdefault(sample.trial_id, len(self._segment_trial_idx))
+        self._segment_samples_trial_idx.append(trial_idx)
+        self._segment_samples_tick_id.append(sample.tick_id)
+        self._segment_samples.append(sample.SerializeToString())
+
+        if len(self._segment_samples) >= self._max_segment_samples:
+            self._flush()
+
+    def _flush(self):
+        if len(self._segment_samples) == 0:
+            return
+
+        trial_ids = list(self._segment_trial_idx.keys())
+        segment_dir = os.path.join(
+            self._record_dir, f"{SEGMENT_DIR_PREFIX}{int(time.time() * 1000)}_{self._segments_count:06d}"
+        )
+        self._segments_count += 1
+        self._write_tasks.append(
+            asyncio.get_running_loop().run_in_executor(
+                None,
+                _write_segment,
+                segment_dir,
+                trial_ids,
+                [self._trial_params[trial_id] for trial_id in trial_ids],
+                self._segment_samples_trial_idx,
+                self._segment_samples_tick_id,
+                self._segment_samples,
+            )
+        )
+        self._write_tasks = [task for task in self._write_tasks if not task.done() or task.exception() is not None]
+        self._reset_segment()
+
+    async def close(self):
+        self._flush()
+        await asyncio.gather(*self._write_tasks)
+        self._write_tasks = []
+
+
+class RecordedTrial:
+    def __init__(self, trial_id, trial_params_data):
+        self.trial_id = trial_id
+        self._trial_params_data = trial_params_data
+        # (segment, sample_idx) of every sample of the trial
+        self._samples_locations = []
+
+    @property
+    def params(self):
+        trial_params = TrialParams()
+        trial_params.ParseFromString(self._trial_params_data)
+        return trial_params
+
+    def add_sample_location(self, segment, sample_idx):
+        self._samples_locations.append((segment, sample_idx))
+
+    def count_samples(self):
+        return len(self._samples_locations)
+
+    def get_samples(self):
+        for segment, sample_idx in self._samples_locations:
+            sample = StoredTrialSample()
+            sample.ParseFromString(segment.get_sample_data(sample_idx))
+            yield sample
+
+
+class _RecordedSegment:
+    def __init__(self, segment_dir):
+        self._columns = {
+            column_name: np.load(os.path.join(segment_dir, f"{column_name}.npy"), mmap_mode="r", allow_pickle=False)
+            for column_name in [
+                SAMPLES_DATA_COLUMN,
+                SAMPLES_OFFSETS_COLUMN,
+                SAMPLES_TRIAL_IDX_COLUMN,
+                SAMPLES_TICK_ID_COLUMN,
+                TRIALS_ID_COLUMN,
+                TRIALS_PARAMS_DATA_COLUMN,
+                TRIALS_PARAMS_OFFSETS_COLUMN,
+            ]
+        }
+
+    def __getitem__(self, column_name):
+        return self._columns[column_name]
+
+    def get_sample_data(self, sample_idx):
+        offsets = self._columns[SAMPLES_OFFSETS_COLUMN]
+        return self._columns[SAMPLES_DATA_COLUMN][offsets[sample_idx] : offsets[sample_idx + 1]].tobytes()
+
+    def get_trial_params_data(self, trial_idx):
+        offsets = self._columns[TRIALS_PARAMS_OFFSETS_COLUMN]
+        return self._columns[TRIALS_PARAMS_DATA_COLUMN][offsets[trial_idx] : offsets[trial_idx + 1]].tobytes()
+
+
+def read_recorded_trials(record_dir):
+    """
+    Read the trials recorded by a `TrialSampleRecorder` in the given directory
+
+    Segments are memory mapped, samples are only read and deserialized when iterated over.
+
+    Parameters:
+        record_dir (string): The directory where trials were recorded
+    Returns:
+        recorded_trials (list[RecordedTrial]): The recorded trials, in the order they were recorded
+    """
+    recorded_trials = {}
+    segment_dirs = sorted(
+        entry.path
+        for entry in os.scandir(record_dir)
+        if entry.is_dir() and entry.name.startswith(SEGMENT_DIR_PREFIX) and not entry.name.endswith(".tmp")
+    )
+    for segment_dir in segment_dirs:
+        segment = _RecordedSegment(segment_dir)
+        segment_trials = []
+        for trial_idx, trial_id in enumerate(segment[TRIALS_ID_COLUMN]):
+            trial_id = str(trial_id)
+            if trial_id not in recorded_trials:
+                recorded_trials[trial_id] = RecordedTrial(trial_id, segment.get_trial_params_data(trial_idx))
+            segment_trials.append(recorded_trials[trial_id])
+
+        for sample_idx, trial_idx in enumerate(segment[SAMPLES_TRIAL_IDX_COLUMN]):
+            segment_trials[trial_idx].add_sample_location(segment, sample_idx)
+
+    log.info(f"Read {len(recorded_trials)} recorded trials from [{record_dir}] ({len(segment_dirs)} segments)")
+    return list(recorded_trials.values())
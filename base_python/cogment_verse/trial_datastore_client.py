@@ -12,14 +12,169 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+import itertools
+import logging
+
 import grpc.aio
 from cogment.api.trial_datastore_pb2 import RetrieveSamplesRequest, RetrieveTrialsRequest
 from cogment.api.trial_datastore_pb2_grpc import TrialDatastoreSPStub
+from prometheus_client import Counter
+
+TRIAL_DATASTORE_RETRIES_COUNTER = Counter(
+    "trial_datastore_retries", "Counter of trial datastore requests retried after an error", ["request"]
+)
+TRIAL_DATASTORE_SAMPLE_STREAMS_COUNTER = Counter(
+    "trial_datastore_sample_streams", "Counter of sample streams opened with the trial datastore"
+)
+
+log = logging.getLogger(__name__)
+
+
+class TrialDatastoreSubscription:
+    """
+    Long-lived subscription to the samples of a dynamic set of trials.
+
+    Added trials are retrieved from the trial datastore in batches: all the trials added while a request is in flight
+    are retrieved together in the next one. Once known to the trial datastore, the samples of every retrieved batch
+    are streamed and routed to `on_sample`. Failed requests are retried with an exponential backoff, interrupted sample
+    streams are resumed where they stopped.
+    """
+
+    def __init__(
+        self,
+        client,
+        on_trials_started,
+        on_sample,
+        on_trials_ended,
+        retrieve_trials_timeout=5000,
+        max_retries=5,
+        initial_backoff_ms=100,
+        max_backoff_ms=5000,
+    ):
+        self._client = client
+        self._on_trials_started = on_trials_started
+        self._on_sample = on_sample
+        self._on_trials_ended = on_trials_ended
+        self._retrieve_trials_timeout = retrieve_trials_timeout
+        self._max_retries = max_retries
+        self._initial_backoff_ms = initial_backoff_ms
+        self._max_backoff_ms = max_backoff_ms
+
+        self._pending_trial_ids = set()
+        self._stream_tasks = set()
+        self._changed = asyncio.Event()
+        self._closed = False
+
+    def add_trials(self, trial_ids):
+        if self._closed:
+            raise RuntimeError("Unable to add trials to a closed subscription")
+        self._pending_trial_ids.update(trial_ids)
+        self._changed.set()
+
+    def close(self):
+        """
+        Signal that no more trials will be added, `run` returns once every added trial has been streamed.
+        """
+        self._closed = True
+        self._changed.set()
+
+    async def _retry(self, request_name, do_request):
+        backoff_ms = self._initial_backoff_ms
+        for attempt in itertools.count():
+            try:
+                return await do_request()
+            except grpc.aio.AioRpcError as error:
+                if attempt >= self._max_retries:
+                    raise
+                log.warning(
+                    f"{request_name} to the trial datastore failed with {error.code()}, retrying in {backoff_ms}ms"
+                )
+                TRIAL_DATASTORE_RETRIES_COUNTER.labels(request=request_name).inc()
+                await asyncio.sleep(backoff_ms / 1000.0)
+                backoff_ms = min(2 * backoff_ms, self._max_backoff_ms)
+        return None
+
+    async def _stream_samples(self, trial_ids):
+        last_tick_ids = {}
+
+        async def stream_samples():
+            TRIAL_DATASTORE_SAMPLE_STREAMS_COUNTER.inc()
+            sample_generator = await self._client.retrieve_samples(trial_ids)
+            async for sample in sample_generator():
+                if sample.tick_id <= last_tick_ids.get(sample.trial_id, -1):
+                    # Already routed before the stream got interrupted
+                    continue
+                last_tick_ids[sample.trial_id] = sample.tick_id
+                await self._on_sample(sample)
+
+        await self._retry("RetrieveSamples", stream_samples)
+        await self._on_trials_ended(trial_ids)
+
+    async def _retrieve_pending_trials(self):
+        trial_ids = list(self._pending_trial_ids)
+        trial_infos = await self._retry(
+            "RetrieveTrials", lambda: self._client.retrieve_trials(trial_ids, self._retrieve_trials_timeout)
+        )
+
+        known_trial_ids = [trial_info.trial_id for trial_info in trial_infos]
+        self._pending_trial_ids.difference_update(known_trial_ids)
+
+        unknown_trial_ids = set(trial_ids).intersection(self._pending_trial_ids)
+        if len(unknown_trial_ids) > 0:
+            log.info(
+                f"Trials [{', '.join(unknown_trial_ids)}] didn't start generating data under {self._retrieve_trials_timeout}ms, retrying"
+            )
+
+        if len(known_trial_ids) == 0:
+            return
+
+        self._on_trials_started(trial_infos)
+
+        stream_task = asyncio.create_task(self._stream_samples(known_trial_ids))
+        stream_task.add_done_callback(lambda _task: self._changed.set())
+        self._stream_tasks.add(stream_task)
+
+    def _check_stream_tasks(self):
+        done_stream_tasks = {t for t in self._stream_tasks if t.done()}
+        self._stream_tasks.difference_update(done_stream_tasks)
+        for done_stream_task in done_stream_tasks:
+            if done_stream_task.cancelled():
+                raise asyncio.CancelledError()
+            if done_stream_task.exception() is not None:
+                raise RuntimeError("An error occured while streaming samples") from done_stream_task.exception()
+
+    async def run(self):
+        try:
+            while True:
+                self._check_stream_tasks()
+
+                if len(self._pending_trial_ids) > 0:
+                    await self._retrieve_pending_trials()
+                    continue
+
+                if self._closed and len(self._stream_tasks) == 0:
+                    return
+
+                self._changed.clear()
+                await self._changed.wait()
+        finally:
+            # Cancelling subtasks
+            for stream_task in self._stream_tasks:
+                stream_task.cancel()
+            await asyncio.gather(*self._stream_tasks, return_exceptions=True)
 
 
 class TrialDatastoreClient:
-    def __init__(self, endpoint):
-        channel = grpc.aio.insecure_channel(endpoint)
+    def __init__(self, endpoint, channel=None):
+        """
+        Parameters:
+            endpoint (string): The endpoint of the trial datastore
+            channel (grpc.aio.Channel - optional): Channel to the trial datastore, e.g. from a `GrpcChannelPool`, by
+                default a new channel to `endpoint`
+        """
+        if channel is None:
+            channel = grpc.aio.insecure_channel(endpoint)
         self._stub = TrialDatastoreSPStub(channel)
 
     async def retrieve_trials(self, trial_ids, timeout=30000):
@@ -38,3 +193,17 @@ class TrialDatastoreClient:
                 yield rep_msg.trial_sample
 
         return sample_generator
+
+    def subscribe(self, on_trials_started, on_sample, on_trials_ended, **kwargs):
+        """
+        Create a subscription to the samples of a dynamic set of trials
+
+        Parameters:
+            on_trials_started (f(list[TrialInfo])): Called when trials become known to the trial datastore
+            on_sample (async f(TrialSample)): Called for every sample of the subscribed trials
+            on_trials_ended (async f(list[string])): Called when all the samples of trials have been streamed
+            kwargs: any number of key/values parameters, forwarded to `TrialDatastoreSubscription`
+        Returns:
+            subscription (TrialDatastoreSubscription): The subscription, samples are streamed while its `run` coroutine is running
+        """
+        return TrialDatastoreSubscription(self, on_trials_started, on_sample, on_trials_ended, **kwargs)
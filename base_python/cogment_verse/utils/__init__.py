@@ -12,7 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from cogment_verse.utils.cache import Cache
 from cogment_verse.utils.lru import LRU
+from cogment_verse.utils.single_flight import SingleFlight
 from cogment_verse.utils.sizeof_fmt import sizeof_fmt
 from cogment_verse.utils.throttle import throttle
 from cogment_verse.utils.get_full_class_name import get_full_class_name
+from cogment_verse.utils.estimate_size import estimate_size
@@ -0,0 +1,145 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+from collections import OrderedDict
+
+from cogment_verse.utils.estimate_size import estimate_size
+from prometheus_client import Counter, Gauge
+
+CACHE_HITS_COUNTER = Counter("cache_hits", "Counter of the cache lookups finding their key", ["cache"])
+CACHE_MISSES_COUNTER = Counter("cache_misses", "Counter of the cache lookups not finding their key", ["cache"])
+CACHE_EVICTIONS_COUNTER = Counter("cache_evictions", "Counter of the evicted cache entries", ["cache", "reason"])
+CACHE_BYTES = Gauge("cache_bytes", "Estimated size of the cached entries", ["cache"])
+CACHE_ITEMS = Gauge("cache_items", "Number of cached entries", ["cache"])
+
+_MISSING = object()
+
+
+class Cache:
+    """
+    Thread safe cache, evicting the least recently looked-up keys to stay under its budget.
+
+    The budget is expressed in bytes, estimated for each entry when it is set, and/or in number of entries. Entries can
+    also expire `ttl_sec` after being set.
+    """
+
+    def __init__(self, name, max_bytes=None, max_items=None, ttl_sec=None, estimate_item_size=estimate_size):
+        """
+        Parameters:
+            name (string): The name of the cache, labelling its metrics
+            max_bytes (int - optional): The maximum estimated size of the entries
+            max_items (int - optional): The maximum number of entries
+            ttl_sec (float - optional): The time to live of the entries
+            estimate_item_size (f(any) -> int - optional): Estimates the size of a value, in bytes
+        """
+        self.name = name
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self.ttl_sec = ttl_sec
+        self._estimate_item_size = estimate_item_size
+
+        # key => (value, size, expiration_time)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _remove(self, key, reason=None):
+        _value, size, _expiration_time = self._entries.pop(key)
+        self._bytes -= size
+        CACHE_BYTES.labels(cache=self.name).dec(size)
+        CACHE_ITEMS.labels(cache=self.name).dec()
+        if reason is not None:
+            CACHE_EVICTIONS_COUNTER.labels(cache=self.name, reason=reason).inc()
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        value, _size, expiration_time = entry
+        if expiration_time is not None and time.monotonic() >= expiration_time:
+            self._remove(key, reason="expired")
+            return _MISSING
+        return value
+
+    def get(self, key, default=None):
+        """
+        Look up a key, in a single operation
+
+        Parameters:
+            key (hashable): The key
+            default (any - optional): Returned when the key is not cached
+        Returns:
+            value (any): The cached value, or `default`
+        """
+        with self._lock:
+            value = self._lookup(key)
+            if value is _MISSING:
+                CACHE_MISSES_COUNTER.labels(cache=self.name).inc()
+                return default
+            self._entries.move_to_end(key)
+            CACHE_HITS_COUNTER.labels(cache=self.name).inc()
+            return value
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._lookup(key) is not _MISSING
+
+    def __setitem__(self, key, value):
+        size = self._estimate_item_size(value)
+        expiration_time = time.monotonic() + self.ttl_sec if self.ttl_sec is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expiration_time)
+            self._bytes += size
+            CACHE_BYTES.labels(cache=self.name).inc(size)
+            CACHE_ITEMS.labels(cache=self.name).inc()
+
+            # The new entry is kept even if it exceeds the budget on its own
+            while len(self._entries) > 1 and (
+                (self.max_bytes is not None and self._bytes > self.max_bytes)
+                or (self.max_items is not None and len(self._entries) > self.max_items)
+            ):
+                self._remove(next(iter(self._entries)), reason="budget")
+
+    def __delitem__(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            value = self._lookup(key)
+            if value is _MISSING:
+                return default
+            self._remove(key)
+            return value
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries.keys()):
+                self._remove(key)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def count_bytes(self):
+        return self._bytes
@@ -0,0 +1,51 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+
+from google.protobuf.message import Message
+
+
+def estimate_size(obj, max_depth=4):
+    """
+    Cheaply estimate the memory footprint of an object, in bytes.
+
+    Buffers (bytes, numpy arrays, torch tensors) and protobuf messages are measured precisely, containers, objects
+    with a `state_dict` (torch modules and optimizers) and the attributes of other objects are traversed up to
+    `max_depth` levels, anything else falls back to `sys.getsizeof`.
+    """
+    if isinstance(obj, (bytes, bytearray)):
+        return len(obj)
+    if isinstance(obj, memoryview):
+        return obj.nbytes
+    if isinstance(obj, Message):
+        return obj.ByteSize()
+    if hasattr(obj, "nbytes"):
+        # numpy arrays and alike
+        return int(obj.nbytes)
+    if hasattr(obj, "element_size") and hasattr(obj, "nelement"):
+        # torch tensors
+        return obj.element_size() * obj.nelement()
+    if max_depth > 0:
+        if isinstance(obj, (tuple, list, set, frozenset)):
+            return sys.getsizeof(obj) + sum(estimate_size(item, max_depth - 1) for item in obj)
+        if isinstance(obj, dict):
+            return sys.getsizeof(obj) + sum(
+                estimate_size(key, max_depth - 1) + estimate_size(value, max_depth - 1) for key, value in obj.items()
+            )
+        if callable(getattr(obj, "state_dict", None)):
+            return sys.getsizeof(obj) + estimate_size(obj.state_dict(), max_depth)
+        if hasattr(obj, "__dict__") and not isinstance(obj, type):
+            return sys.getsizeof(obj) + estimate_size(vars(obj), max_depth - 1)
+    return sys.getsizeof(obj)
@@ -0,0 +1,53 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+
+
+class SingleFlight:
+    "Coalesce concurrent calls sharing the same key into a single execution"
+
+    def __init__(self):
+        self._in_flight = {}
+
+    def is_in_flight(self, key):
+        return key in self._in_flight
+
+    async def run(self, key, create_coroutine):
+        """
+        Run the coroutine created by `create_coroutine`, unless one is already running for the same key
+
+        Parameters:
+            key (hashable): Identifies the execution
+            create_coroutine (f() -> coroutine): Creates the coroutine to execute
+        Returns:
+            result, coalesced (any, bool): The result of the execution and whether it was shared with another caller
+        """
+        future = self._in_flight.get(key)
+        coalesced = future is not None
+        if not coalesced:
+            future = asyncio.ensure_future(create_coroutine())
+            self._in_flight[key] = future
+
+            def on_done(done_future):
+                if self._in_flight.get(key) is done_future:
+                    del self._in_flight[key]
+                # Retrieving the exception avoids warnings when every caller was cancelled
+                if not done_future.cancelled():
+                    done_future.exception()
+
+            future.add_done_callback(on_done)
+
+        # Shielded so that a cancelled caller doesn't cancel the execution shared with the others
+        return await asyncio.shield(future), coalesced
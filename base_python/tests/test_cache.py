@@ -0,0 +1,57 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+import numpy as np
+import pytest
+from cogment_verse.utils import Cache
+
+
+def test_byte_budget():
+    cache = Cache("test_byte_budget", max_bytes=3000)
+    for key in ["a", "b", "c"]:
+        cache[key] = np.zeros(1000, dtype=np.uint8)
+    assert cache.count_bytes() == 3000
+
+    # Looking "a" up makes "b" the least recently used
+    assert cache.get("a") is not None
+    cache["d"] = np.zeros(1000, dtype=np.uint8)
+    assert "b" not in cache
+    assert "a" in cache and "c" in cache and "d" in cache
+
+    # An entry exceeding the budget on its own evicts all the others
+    cache["e"] = np.zeros(5000, dtype=np.uint8)
+    assert len(cache) == 1
+    assert cache.count_bytes() == 5000
+
+    with pytest.raises(KeyError):
+        _value = cache["a"]
+    assert cache.get("a", "default") == "default"
+
+
+def test_items_budget_and_ttl():
+    cache = Cache("test_items_budget_and_ttl", max_items=2, ttl_sec=0.05)
+    cache["a"] = 1
+    cache["b"] = 2
+    cache["a"] = 3
+    cache["c"] = 4
+    assert "b" not in cache
+    assert cache["a"] == 3
+
+    time.sleep(0.06)
+    assert cache.get("a") is None
+    assert "c" not in cache
+    assert len(cache) == 0
+    assert cache.count_bytes() == 0
@@ -0,0 +1,74 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from cogment_verse.run.endpoint_selector import (
+    EndpointSelector,
+    LeastOutstandingTrialsEndpointSelector,
+    PowerOfTwoChoicesEndpointSelector,
+)
+
+
+def test_least_outstanding_trials():
+    selector = LeastOutstandingTrialsEndpointSelector()
+    endpoints = ["env_a:9000", "env_b:9000", "env_c:9000"]
+
+    for trial_idx in range(6):
+        selector.on_trial_started(f"trial_{trial_idx}", [selector.select(endpoints)])
+    assert [selector.count_outstanding_trials(endpoint) for endpoint in endpoints] == [2, 2, 2]
+
+    selector.on_trial_started("trial_b", ["env_b:9000"])
+    selector.on_trial_started("trial_c", ["env_c:9000"])
+    assert selector.select(endpoints) == "env_a:9000"
+
+    selector.on_trial_ended("trial_c")
+    selector.on_trial_ended("trial_c")
+    selector.on_trial_ended("unknown_trial")
+    assert selector.count_outstanding_trials("env_c:9000") == 2
+    assert selector.select(endpoints) in ["env_a:9000", "env_c:9000"]
+
+
+def test_power_of_two_choices():
+    selector = PowerOfTwoChoicesEndpointSelector()
+    endpoints = ["actor_a:9000", "actor_b:9000"]
+
+    selector.on_trial_started("trial", ["actor_a:9000"])
+    # With two replicas, both are always compared
+    assert all(selector.select(endpoints) == "actor_b:9000" for _ in range(10))
+    assert selector.select(["actor_a:9000"]) == "actor_a:9000"
+
+
+def test_selections_counted_as_made():
+    selector = LeastOutstandingTrialsEndpointSelector()
+    endpoints = ["actor_a:9000", "actor_b:9000", "actor_c:9000"]
+
+    # The actors of a trial sharing an implementation are spread across its replicas
+    assert sorted(selector.select(endpoints, trial_id="trial") for _ in range(3)) == endpoints
+    selector.on_trial_started("trial")
+    assert [selector.count_outstanding_trials(endpoint) for endpoint in endpoints] == [1, 1, 1]
+
+    selector.on_trial_ended("trial")
+    assert [selector.count_outstanding_trials(endpoint) for endpoint in endpoints] == [0, 0, 0]
+
+
+def test_missed_trial_ends_expire():
+    selector = EndpointSelector(missed_end_ttl_sec=0)
+    selector.select(["env:9000"], trial_id="trial")
+    assert selector.count_outstanding_trials("env:9000") == 1
+
+    # Only the trials outstanding when the end events were missed are forgotten
+    selector.on_trial_ends_missed()
+    selector.select(["env:9000"], trial_id="later_trial")
+    assert selector.count_outstanding_trials("env:9000") == 1
+    selector.on_trial_ended("later_trial")
+    assert selector.count_outstanding_trials("env:9000") == 0
@@ -0,0 +1,57 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+
+import numpy as np
+from cogment_verse.flat_tensors import FLAT_TENSORS_ALIGNMENT, is_flat_tensors, load_flat_tensors, save_flat_tensors
+from cogment_verse.model_version_disk_cache import ModelVersionDiskCache
+
+
+def test_save_and_load():
+    tensors = {
+        "weight": np.arange(12, dtype=np.float32).reshape(3, 4),
+        "bias": np.array([1, 2, 3], dtype=np.int64),
+        "scalar": np.array(0.5, dtype=np.float64),
+        "empty": np.zeros((0, 2), dtype=np.float32),
+        "transposed": np.arange(6, dtype=np.float16).reshape(2, 3).T,
+    }
+    with io.BytesIO() as model_data_f:
+        save_flat_tensors(tensors, model_data_f, metadata={"hidden_size": 4})
+        data = model_data_f.getvalue()
+
+    model_data_f = io.BytesIO(data)
+    assert is_flat_tensors(model_data_f)
+    assert model_data_f.tell() == 0
+    assert not is_flat_tensors(io.BytesIO(b"not a container"))
+
+    loaded_tensors, metadata = load_flat_tensors(model_data_f)
+    assert metadata == {"hidden_size": 4}
+    assert list(loaded_tensors.keys()) == list(tensors.keys())
+    for name, tensor in tensors.items():
+        assert loaded_tensors[name].dtype == tensor.dtype
+        np.testing.assert_array_equal(loaded_tensors[name], tensor)
+
+
+def test_load_from_memory_map(tmp_path):
+    cache = ModelVersionDiskCache(str(tmp_path))
+    with io.BytesIO() as model_data_f:
+        save_flat_tensors({"a": np.ones(3, dtype=np.uint8), "b": np.full(5, 7, dtype=np.float32)}, model_data_f)
+        cache.put("hash/a", model_data_f.getvalue())
+
+    tensors, _ = load_flat_tensors(cache.get("hash/a"))
+    # The tensors are aligned read-only views on the memory map
+    assert not tensors["b"].flags.writeable
+    assert tensors["b"].ctypes.data % FLAT_TENSORS_ALIGNMENT == 0
+    np.testing.assert_array_equal(tensors["b"], np.full(5, 7, dtype=np.float32))
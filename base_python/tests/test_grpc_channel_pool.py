@@ -0,0 +1,32 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+
+from cogment_verse.grpc_channel_pool import GrpcChannelPool
+
+
+def test_share_channels_per_endpoint():
+    async def run():
+        pool = GrpcChannelPool(max_message_length=16 * 1024 * 1024)
+        channel = pool.get("localhost:9001")
+        assert pool.get("localhost:9001") is channel
+        assert pool.get("localhost:9002") is not channel
+
+        await pool.close()
+        # Channels are recreated after the pool is closed
+        assert pool.get("localhost:9001") is not channel
+        await pool.close()
+
+    asyncio.run(run())
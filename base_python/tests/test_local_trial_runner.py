@@ -0,0 +1,265 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+from types import SimpleNamespace
+
+import cogment
+import pytest
+from cogment.api.common_pb2 import TrialState
+from cogment_verse.run.local_trial_runner import LocalTrialRunner, get_trial_actors
+from cogment_verse.run.run_session import RunSession, RunSessionStatus
+from google.protobuf.wrappers_pb2 import Int32Value
+
+TRIAL_LENGTH = 3
+
+
+class FakeConfig:
+    def __init__(self, content):
+        self.content = content
+
+    def SerializeToString(self):  # pylint: disable=invalid-name
+        return self.content
+
+
+class FakeActorParams:
+    def __init__(self, name, implementation):
+        self.name = name
+        self.actor_class = "player"
+        self.implementation = implementation
+        self.player_config = FakeConfig(name.encode())
+
+    def WhichOneof(self, oneof):  # pylint: disable=invalid-name
+        assert oneof == "config_oneof"
+        return "player_config"
+
+
+def create_trial_config(actor_implementations=("counting_actor", "counting_actor")):
+    return SimpleNamespace(
+        environment=SimpleNamespace(
+            specs=SimpleNamespace(implementation="counting_environment"), config=FakeConfig(b"environment")
+        ),
+        actors=[
+            FakeActorParams(f"player_{actor_idx}", implementation)
+            for actor_idx, implementation in enumerate(actor_implementations)
+        ],
+        SerializeToString=lambda: b"trial_config",
+    )
+
+
+def unpack_messages(messages):
+    unpacked_messages = []
+    for message in messages:
+        payload = Int32Value()
+        message.payload.Unpack(payload)
+        unpacked_messages.append((message.sender_name, message.tick_id, payload.value))
+    return unpacked_messages
+
+
+class Implementations:
+    """
+    Environment observing the tick id, rewarding `player_1` with the sum of the actions, the actors act the observation
+    plus one. `player_0` sends its observation to the environment, which forwards the reward to `player_1`.
+    """
+
+    def __init__(self, trial_length=TRIAL_LENGTH):
+        self.trial_length = trial_length
+        self.environment_messages = []
+        self.actor_messages = []
+
+    async def counting_environment(self, environment_session):
+        environment_session.start([("*", Int32Value(value=0))])
+        async for event in environment_session.event_loop():
+            self.environment_messages.extend(unpack_messages(event.messages))
+            if not event.actions:
+                continue
+            tick_id = event.actions[0].tick_id
+            total = sum(action.action.value for action in event.actions)
+            environment_session.add_reward(value=total, confidence=1.0, to=["player_1"])
+            environment_session.send_message(Int32Value(value=total), to=["player_1"])
+            if tick_id + 1 >= self.trial_length:
+                environment_session.end([("*", Int32Value(value=tick_id + 1))])
+            else:
+                environment_session.produce_observations([("*", Int32Value(value=tick_id + 1))])
+
+    async def counting_actor(self, actor_session):
+        actor_session.start()
+        async for event in actor_session.event_loop():
+            if actor_session.name == "player_1":
+                self.actor_messages.extend(unpack_messages(event.messages))
+            if event.type != cogment.EventType.ACTIVE:
+                continue
+            observation = event.observation.snapshot.value
+            if actor_session.name == "player_0":
+                actor_session.send_message(Int32Value(value=observation), to=[], to_environment=True)
+            actor_session.do_action(Int32Value(value=observation + 1))
+
+
+def create_runner(implementations):
+    return LocalTrialRunner(
+        user_id="user",
+        environment_impls={"counting_environment": implementations.counting_environment},
+        actor_impls={"counting_actor": implementations.counting_actor},
+    )
+
+
+async def get_all_samples(trial):
+    samples = []
+    while True:
+        sample = await asyncio.wait_for(trial.get_sample(), timeout=1)
+        if sample is None:
+            return samples
+        samples.append(sample)
+
+
+def parse_payload(sample, payload_idx):
+    payload = Int32Value()
+    payload.ParseFromString(sample.payloads[payload_idx])
+    return payload.value
+
+
+def test_get_trial_actors():
+    actors = get_trial_actors(create_trial_config(actor_implementations=("counting_actor", "client")))
+
+    assert [(actor["name"], actor["actor_class"], actor["implementation"]) for actor in actors] == [
+        ("player_0", "player", "counting_actor"),
+        ("player_1", "player", ""),
+    ]
+    assert [actor["config"].content for actor in actors] == [b"player_0", b"player_1"]
+    assert [actor["config"].actor_index for actor in actors] == [0, 1]
+
+
+def test_trial_samples():
+    async def run():
+        implementations = Implementations()
+        runner = create_runner(implementations)
+        trial_id = await runner.start_trial(create_trial_config(), trial_id_requested="trial")
+        assert trial_id == "trial"
+
+        trial = runner.pop_trial(trial_id)
+        params = trial.get_info().params
+        assert params.trial_config.content == b"trial_config"
+        assert params.environment.implementation == "counting_environment"
+        assert [actor.name for actor in params.actors] == ["player_0", "player_1"]
+        assert [actor.config.content for actor in params.actors] == [b"player_0", b"player_1"]
+
+        samples = await get_all_samples(trial)
+        assert [sample.tick_id for sample in samples] == [0, 1, 2, 3]
+        assert [sample.state for sample in samples] == [TrialState.RUNNING] * TRIAL_LENGTH + [TrialState.ENDED]
+        assert all(sample.trial_id == "trial" and sample.user_id == "user" for sample in samples)
+
+        for tick_id, sample in enumerate(samples[:TRIAL_LENGTH]):
+            player_0, player_1 = sample.actor_samples
+            # The shared observation is serialized once
+            assert player_0.observation == player_1.observation
+            assert len(sample.payloads) == 3
+            assert parse_payload(sample, player_0.observation) == tick_id
+            assert parse_payload(sample, player_0.action) == tick_id + 1
+            assert parse_payload(sample, player_1.action) == tick_id + 1
+            assert player_0.reward is None
+            assert player_1.reward == 2 * (tick_id + 1)
+
+        # The last sample holds the final observation
+        player_0, player_1 = samples[-1].actor_samples
+        assert parse_payload(samples[-1], player_0.observation) == TRIAL_LENGTH
+        assert player_0.action is None and player_1.action is None
+        assert trial.state == TrialState.ENDED
+
+        # Messages are delivered with the next event of their recipient
+        assert implementations.environment_messages == [("player_0", tick_id, tick_id) for tick_id in range(3)]
+        assert implementations.actor_messages == [("env", tick_id, 2 * (tick_id + 1)) for tick_id in range(3)]
+
+        await runner.close()
+
+    asyncio.run(run())
+
+
+def test_trial_end():
+    async def run():
+        runner = create_runner(Implementations(trial_length=1000))
+        watched_trial_infos = {(): [], (cogment.TrialState.ENDED,): []}
+
+        async def watch(trial_state_filters):
+            async for trial_info in runner.watch_trials(trial_state_filters):
+                watched_trial_infos[trial_state_filters].append((trial_info.trial_id, trial_info.state))
+
+        watch_tasks = [asyncio.create_task(watch(trial_state_filters)) for trial_state_filters in watched_trial_infos]
+        await asyncio.sleep(0)
+
+        trial_id = await runner.start_trial(create_trial_config(), trial_id_requested="trial")
+        trial = runner.pop_trial(trial_id)
+        assert (await asyncio.wait_for(trial.get_sample(), timeout=1)).tick_id == 0
+
+        # The samples produced before the trial is terminated are retrieved
+        await runner.terminate_trial(trial_id)
+        samples = await get_all_samples(trial)
+        assert [sample.tick_id for sample in samples] == list(range(1, len(samples) + 1))
+        assert trial.state == TrialState.ENDED
+
+        assert watched_trial_infos == {
+            (): [("trial", TrialState.RUNNING), ("trial", TrialState.ENDED)],
+            (cogment.TrialState.ENDED,): [("trial", TrialState.ENDED)],
+        }
+
+        for task in watch_tasks:
+            task.cancel()
+        await asyncio.gather(*watch_tasks, return_exceptions=True)
+        await runner.close()
+
+    asyncio.run(run())
+
+
+def test_unsupported_trial_config():
+    async def run():
+        runner = create_runner(Implementations())
+        with pytest.raises(RuntimeError, match="Client actor \\[player_1\\]"):
+            await runner.start_trial(create_trial_config(actor_implementations=("counting_actor", "client")))
+        with pytest.raises(RuntimeError, match="Unknown actor implementation \\[unknown_actor\\]"):
+            await runner.start_trial(create_trial_config(actor_implementations=("counting_actor", "unknown_actor")))
+
+    asyncio.run(run())
+
+
+def test_run_session_closes_trials_runner():
+    async def run():
+        runner = create_runner(Implementations(trial_length=1000))
+        trial_started = asyncio.Event()
+
+        async def run_impl(_run_session):
+            await runner.start_trial(create_trial_config())
+            trial_started.set()
+            # Running until terminated, without consuming the samples of the trial
+            await asyncio.get_running_loop().create_future()
+
+        run_session = RunSession(
+            cog_settings=None,
+            controller=runner,
+            trial_datastore_client=runner,
+            config=None,
+            run_sample_producer_impl=None,
+            impl_name="impl",
+            run_impl=run_impl,
+            params_name="params",
+            trials_runner=runner,
+        )
+        run_session.exec()
+        await asyncio.wait_for(trial_started.wait(), timeout=1)
+        trial_tasks = list(runner._trial_tasks.values())  # pylint: disable=protected-access
+        assert len(trial_tasks) == 1
+
+        assert await run_session.terminate() == RunSessionStatus.TERMINATED
+        # The trials of the terminated run don't outlive it
+        assert all(task.done() for task in trial_tasks)
+
+    asyncio.run(run())
@@ -0,0 +1,65 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+from types import SimpleNamespace
+
+from cogment_verse import mlflow_experiment_tracker
+from cogment_verse.mlflow_experiment_tracker import MlflowExperimentTracker
+
+
+class FakeMlflowClient:
+    log_batches = []
+    terminated_runs = []
+
+    def get_experiment_by_name(self, _name):
+        return SimpleNamespace(experiment_id="experiment")
+
+    def create_run(self, _experiment_id, tags):
+        return SimpleNamespace(info=SimpleNamespace(run_id="run"))
+
+    def log_batch(self, run_id, metrics=(), params=()):
+        self.log_batches.append((run_id, list(metrics), list(params)))
+
+    def set_terminated(self, run_id, status):
+        self.terminated_runs.append((run_id, status))
+
+
+def test_aggregate_high_frequency_metrics(monkeypatch):
+    monkeypatch.setattr(mlflow_experiment_tracker, "MlflowClient", FakeMlflowClient)
+
+    xp_tracker = MlflowExperimentTracker("experiment", "run", flush_frequency=60, aggregated_metrics=["total_reward"])
+    for step_idx, reward in enumerate([1.0, 3.0, 2.0]):
+        xp_tracker.log_metrics(1000 + step_idx, step_idx, total_reward=reward)
+    xp_tracker.log_metrics(1002, 2, model_version_number=4)
+    # Params are uploaded right away, along with the pending metrics
+    xp_tracker.log_params(learning_rate=0.1)
+    # Terminating waits for the last upload
+    asyncio.run(xp_tracker.terminate_success())
+
+    assert FakeMlflowClient.terminated_runs == [("run", "FINISHED")]
+    params = [param for _run_id, _metrics, batch_params in FakeMlflowClient.log_batches for param in batch_params]
+    assert [(param.key, param.value) for param in params] == [("learning_rate", "0.1")]
+    metrics = {
+        metric.key: (metric.value, metric.timestamp, metric.step)
+        for _run_id, batch_metrics, _params in FakeMlflowClient.log_batches
+        for metric in batch_metrics
+    }
+    assert metrics == {
+        "total_reward": (2.0, 1002, 2),
+        "total_reward_min": (1.0, 1002, 2),
+        "total_reward_max": (3.0, 1002, 2),
+        "total_reward_count": (3, 1002, 2),
+        "model_version_number": (4, 1002, 2),
+    }
@@ -0,0 +1,114 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+from types import SimpleNamespace
+
+from cogment.api.model_registry_pb2 import ModelInfo, ModelVersionInfo
+from cogment_verse.model_registry_client import LatestModelVersions, ModelRegistryClient
+
+# pylint: disable=protected-access
+
+
+class FakeModelRegistryStub:
+    def __init__(self):
+        self.latest_version_number = 1
+        self.calls_count = 0
+
+    async def RetrieveModels(self, req):  # pylint: disable=invalid-name
+        self.calls_count += 1
+        return SimpleNamespace(model_infos=[ModelInfo(model_id=req.model_ids[0], user_data={"model_class": "bytes"})])
+
+    async def RetrieveVersionInfos(self, req):  # pylint: disable=invalid-name
+        self.calls_count += 1
+        version_number = req.version_numbers[0]
+        if version_number == -1:
+            version_number = self.latest_version_number
+        return SimpleNamespace(
+            version_infos=[
+                ModelVersionInfo(
+                    model_id=req.model_id,
+                    version_number=version_number,
+                    data_hash=f"hash_{version_number}",
+                    data_size=2,
+                    user_data={"version_class": "bytes"},
+                )
+            ]
+        )
+
+    async def RetrieveVersionData(self, req):  # pylint: disable=invalid-name
+        self.calls_count += 1
+        yield SimpleNamespace(data_chunk=f"v{req.version_number}".encode())
+
+
+def load_model(_model_id, _version_number, _model_user_data, _version_user_data, model_data_f):
+    return model_data_f.read()
+
+
+async def wait_for(predicate):
+    while not predicate():
+        await asyncio.sleep(0.01)
+
+
+def test_subscribed_latest_version_is_resolved_locally():
+    async def run():
+        latest_versions = LatestModelVersions(poll_period_sec=0.01)
+        client = ModelRegistryClient("localhost:9002", latest_versions=latest_versions)
+        stub = FakeModelRegistryStub()
+        client._stub = stub
+
+        client.subscribe_to_latest_version("model", load_model)
+        await asyncio.wait_for(wait_for(lambda: latest_versions.get("model") is not None), timeout=5)
+
+        # The latest version is retrieved without any request to the model registry
+        calls_count = stub.calls_count
+        model, _model_info, version_info = await client.retrieve_version("model", load_model, -1)
+        assert (model, version_info["version_number"]) == (b"v1", 1)
+        assert stub.calls_count == calls_count
+
+        # New versions are prefetched in the background
+        stub.latest_version_number = 2
+        await asyncio.wait_for(wait_for(lambda: latest_versions.get("model")["version_number"] == 2), timeout=5)
+        calls_count = stub.calls_count
+        model, _model_info, version_info = await client.retrieve_version("model", load_model, -1)
+        assert (model, version_info["version_number"]) == (b"v2", 2)
+        assert stub.calls_count == calls_count
+
+        # Versions are never rolled back
+        latest_versions.update("model", {"version_number": 1})
+        assert latest_versions.get("model")["version_number"] == 2
+
+        await latest_versions.close()
+        assert latest_versions.get("model") is None
+
+    asyncio.run(run())
+
+
+def test_unrequested_subscriptions_expire():
+    async def run():
+        latest_versions = LatestModelVersions(poll_period_sec=0.01, expiry_sec=0.05)
+
+        async def retrieve_latest_version():
+            return {"version_number": 1}
+
+        latest_versions.subscribe("model", retrieve_latest_version)
+        # Versions of models that are not subscribed to are not tracked
+        latest_versions.update("other_model", {"version_number": 1})
+        assert latest_versions.get("other_model") is None
+
+        await asyncio.wait_for(wait_for(lambda: latest_versions.get("model") is not None), timeout=5)
+        await asyncio.sleep(0.1)
+        assert latest_versions.get("model") is None
+
+    asyncio.run(run())
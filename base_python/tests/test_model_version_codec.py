@@ -0,0 +1,106 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import io
+import inspect
+
+import numpy as np
+from cogment_verse.agent_adapter import AgentAdapter
+from cogment_verse.model_version_codec import compress, decompress, delta_decode, delta_encode
+
+
+def test_delta_encoding():
+    base_data = np.arange(1000, dtype=np.float32).tobytes()
+    data = bytearray(base_data)
+    data[100:104] = b"abcd"
+    data.extend(b"tail")
+
+    delta = delta_encode(data, base_data)
+    assert len(delta) == len(data)
+    assert delta.count(0) == len(base_data) - 4
+    assert delta_decode(delta, base_data) == data
+    assert len(compress("zlib", delta)) < len(compress("zlib", data))
+    assert decompress("zlib", compress("zlib", delta)) == delta
+
+
+class InMemoryModelRegistryClient:
+    def __init__(self):
+        self.versions = []
+        self.archived = []
+
+    async def publish_version(self, model_id, model, save_model, archived=False, **kwargs):
+        model_data_f = io.BytesIO()
+        version_user_data = save_model(model, {}, model_data_f, **kwargs)
+        self.archived.append(archived)
+        self.versions.append((model_data_f.getvalue(), {key: str(value) for key, value in version_user_data.items()}))
+        return {"version_number": len(self.versions)}
+
+    async def retrieve_version_data(self, model_id, version_number=-1):
+        data, version_user_data = self.versions[version_number - 1]
+        return bytearray(data), {"version_number": version_number, "user_data": version_user_data}
+
+    async def retrieve_version(self, model_id, load_model, version_number=-1, **kwargs):
+        data, version_info = await self.retrieve_version_data(model_id, version_number)
+        model = load_model(model_id, version_number, {}, version_info["user_data"], io.BytesIO(data), **kwargs)
+        if inspect.isawaitable(model):
+            model = await model
+        return model, {}, version_info
+
+
+class ArrayAgentAdapter(AgentAdapter):
+    def _save(self, model, model_user_data, model_data_f, **kwargs):
+        model_data_f.write(model.tobytes())
+        return {}
+
+    def _load(self, model_id, version_number, model_user_data, version_user_data, model_data_f, **kwargs):
+        return np.frombuffer(model_data_f.read(), dtype=np.float32)
+
+    def _create_actor_implementations(self):
+        return {}
+
+    def _create_run_implementations(self):
+        return {}
+
+
+def test_delta_encoded_versions():
+    async def run():
+        adapter = ArrayAgentAdapter(version_codec="zlib", delta_keyframe_interval=2)
+        model_registry_client = InMemoryModelRegistryClient()
+        adapter.get_model_registry_client = lambda: model_registry_client
+
+        models = []
+        model = np.random.default_rng(0).random(10000, dtype=np.float32)
+        for _ in range(4):
+            model[:10] += 1.0
+            models.append(model.copy())
+            await adapter.publish_version("model", model)
+
+        delta_base_version_numbers = [
+            version_user_data.get(AgentAdapter.VERSION_USER_DATA_DELTA_BASE_VERSION_NUMBER_KEY)
+            for _data, version_user_data in model_registry_client.versions
+        ]
+        assert delta_base_version_numbers == [None, "1", "1", None]
+        # The keyframes are archived, not to be evicted while delta-encoded versions depend on them
+        assert model_registry_client.archived == [True, False, False, True]
+        assert len(model_registry_client.versions[1][0]) < len(model_registry_client.versions[0][0]) / 10
+
+        # Loading from a fresh adapter, the keyframes are retrieved from the registry
+        adapter = ArrayAgentAdapter()
+        adapter.get_model_registry_client = lambda: model_registry_client
+        for version_number, expected_model in enumerate(models, 1):
+            loaded_model, _model_info, _version_info = await adapter.retrieve_version("model", version_number)
+            np.testing.assert_array_equal(loaded_model, expected_model)
+
+    asyncio.run(run())
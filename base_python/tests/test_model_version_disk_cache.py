@@ -0,0 +1,64 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+
+from cogment_verse.model_version_disk_cache import ModelVersionDiskCache
+
+
+def test_disk_cache(tmp_path):
+    cache = ModelVersionDiskCache(str(tmp_path), max_bytes=2500)
+    assert cache.get("hash/a") is None
+
+    cache.put("hash/a", b"a" * 1000)
+    time.sleep(0.01)
+    cache.put("hash/b", b"b" * 1000)
+    time.sleep(0.01)
+
+    # Reading "a" makes "b" the least recently used
+    with cache.get("hash/a") as data:
+        assert data.read() == b"a" * 1000
+    time.sleep(0.01)
+    cache.put("hash/c", b"c" * 1000)
+
+    assert cache.get("hash/b") is None
+    assert cache.get("hash/a")[:] == b"a" * 1000
+    assert cache.get("hash/c")[:] == b"c" * 1000
+    assert len(os.listdir(tmp_path)) == 2
+
+    # Another cache using the same directory, e.g. after a restart, finds the versions
+    assert ModelVersionDiskCache(str(tmp_path)).get("hash/c")[:] == b"c" * 1000
+
+
+def test_stale_temp_files_removed(tmp_path):
+    cache = ModelVersionDiskCache(str(tmp_path), max_bytes=2500, stale_temp_file_age_sec=60)
+
+    # Left by crashed writers, only the recent one may still be written
+    stale_temp_path = tmp_path / "stale.tmp"
+    stale_temp_path.write_bytes(b"s" * 1000)
+    stale_time = time.time() - 120
+    os.utime(stale_temp_path, (stale_time, stale_time))
+    recent_temp_path = tmp_path / "recent.tmp"
+    recent_temp_path.write_bytes(b"r" * 1000)
+
+    cache.put("hash/a", b"a" * 1000)
+    time.sleep(0.01)
+    cache.put("hash/b", b"b" * 1000)
+
+    assert not stale_temp_path.exists()
+    assert recent_temp_path.exists()
+    # The temporary file being written counts in the size of the cache
+    assert cache.get("hash/a") is None
+    assert cache.get("hash/b")[:] == b"b" * 1000
@@ -0,0 +1,84 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from cogment_verse.run import parallel_trials_autoscaler
+from cogment_verse.run.parallel_trials_autoscaler import ParallelTrialsAutoscaler
+
+
+class FakeSampleQueue:
+    def __init__(self, length=0, paused=False):
+        self.length = length
+        self.paused = paused
+
+    def qsize(self):
+        return self.length
+
+    def is_paused(self):
+        return self.paused
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_increase_when_learner_starves(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(parallel_trials_autoscaler.time, "time", clock)
+
+    autoscaler = ParallelTrialsAutoscaler(initial_parallel_trials=4, max_parallel_trials=8, period_sec=1.0)
+    autoscaler.start("run")
+    for _ in range(4):
+        autoscaler.on_trial_started()
+
+    # Every slot is taken and the learner waited for samples half of the time
+    clock.now += 1.0
+    autoscaler.on_learner_idle(0.5)
+    assert autoscaler.update(FakeSampleQueue()) == 6
+
+    # Not increased again before the cooldown
+    clock.now += 1.0
+    autoscaler.on_trial_ended(trial_duration=10.0)
+    autoscaler.on_trial_started()
+    autoscaler.on_learner_idle(0.5)
+    assert autoscaler.update(FakeSampleQueue()) == 6
+
+    # Not increased when slots are available
+    clock.now += 10.0
+    autoscaler.on_learner_idle(5.0)
+    assert autoscaler.update(FakeSampleQueue()) == 6
+
+
+def test_decrease_under_backpressure(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(parallel_trials_autoscaler.time, "time", clock)
+
+    autoscaler = ParallelTrialsAutoscaler(initial_parallel_trials=8, min_parallel_trials=2, target_queue_len=100)
+    autoscaler.start("run")
+
+    clock.now += 1.0
+    assert autoscaler.update(FakeSampleQueue(length=200)) == 6
+    clock.now += 1.0
+    assert autoscaler.update(FakeSampleQueue(paused=True)) == 4
+    for _ in range(3):
+        clock.now += 1.0
+        autoscaler.update(FakeSampleQueue(paused=True))
+    assert autoscaler.max_parallel_trials == 2
+
+    # The learner is fed, the limit holds
+    clock.now += 1.0
+    assert autoscaler.update(FakeSampleQueue(length=10)) == 2
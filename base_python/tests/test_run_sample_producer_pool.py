@@ -0,0 +1,144 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+from cogment_verse.run.run_sample_producer_pool import RunSampleProducerPool
+
+# This module is imported by the spawned workers as their `cog_settings`
+actor_classes = {}
+trial = SimpleNamespace(config_type=None)
+
+CRASH_TICK_ID = -1
+TIMEOUT = 30
+
+
+async def doubling_sample_producer_impl(run_sample_producer_session):
+    async for sample in run_sample_producer_session.get_all_samples():
+        if sample.get_tick_id() == CRASH_TICK_ID:
+            os._exit(1)
+        run_sample_producer_session.produce_training_sample(sample.get_tick_id() * 2)
+
+
+class TrainingSamples:
+    def __init__(self):
+        self.samples = []
+        self.received = asyncio.Event()
+
+    def produce_training_sample(self, trial_id, tick_id, sample):
+        self.samples.append((trial_id, tick_id, sample))
+        self.received.set()
+
+    async def wait_for(self, count):
+        while len(self.samples) < count:
+            self.received.clear()
+            await asyncio.wait_for(self.received.wait(), timeout=TIMEOUT)
+
+
+def create_pool(workers_count, **kwargs):
+    return RunSampleProducerPool(
+        cog_settings=sys.modules[__name__],
+        run_id="run",
+        run_config={},
+        run_sample_producer_impl=doubling_sample_producer_impl,
+        workers_count=workers_count,
+        **kwargs,
+    )
+
+
+def test_sample_production_in_worker():
+    async def run():
+        pool = create_pool(workers_count=1)
+        pool.start()
+        try:
+            training_samples = TrainingSamples()
+            session = pool.create_session("trial", SimpleNamespace(actors=[]), training_samples.produce_training_sample)
+            consumed_count = 0
+
+            def on_sample_consumed():
+                nonlocal consumed_count
+                consumed_count += 1
+
+            session.set_on_sample_consumed(on_sample_consumed)
+            task = session.exec()
+
+            for tick_id in range(3):
+                await session.on_trial_sample(SimpleNamespace(tick_id=tick_id))
+            await session.on_trial_done()
+
+            await asyncio.wait_for(task, timeout=TIMEOUT)
+            assert training_samples.samples == [("trial", 0, 0), ("trial", 1, 2), ("trial", 2, 4)]
+            assert consumed_count == 3
+        finally:
+            await pool.stop()
+
+    asyncio.run(run())
+
+
+def test_worker_death_only_fails_its_sessions():
+    async def run():
+        pool = create_pool(workers_count=2, max_worker_restarts=1)
+        pool.start()
+        try:
+            training_samples = TrainingSamples()
+            crashing_session = pool.create_session(
+                "crashing", SimpleNamespace(actors=[]), training_samples.produce_training_sample
+            )
+            healthy_session = pool.create_session(
+                "healthy", SimpleNamespace(actors=[]), training_samples.produce_training_sample
+            )
+            assert crashing_session.worker_idx != healthy_session.worker_idx
+            crashing_task = crashing_session.exec()
+            healthy_task = healthy_session.exec()
+
+            await crashing_session.on_trial_sample(SimpleNamespace(tick_id=CRASH_TICK_ID))
+            with pytest.raises(RuntimeError, match="died"):
+                await asyncio.wait_for(crashing_task, timeout=TIMEOUT)
+
+            # The other worker keeps executing its sample producer
+            await healthy_session.on_trial_sample(SimpleNamespace(tick_id=1))
+            await training_samples.wait_for(1)
+
+            # The dead worker was restarted and executes new sample producers
+            restarted_session = pool.create_session(
+                "restarted", SimpleNamespace(actors=[]), training_samples.produce_training_sample
+            )
+            assert restarted_session.worker_idx == crashing_session.worker_idx
+            restarted_task = restarted_session.exec()
+            await restarted_session.on_trial_sample(SimpleNamespace(tick_id=2))
+            await training_samples.wait_for(2)
+            assert training_samples.samples == [("healthy", 1, 2), ("restarted", 2, 4)]
+
+            await healthy_session.on_trial_done()
+            await restarted_session.on_trial_done()
+            await asyncio.wait_for(asyncio.gather(healthy_task, restarted_task), timeout=TIMEOUT)
+
+            # Once the workers died too many times, no new session can be created
+            crashing_session = pool.create_session(
+                "crashing_again", SimpleNamespace(actors=[]), training_samples.produce_training_sample
+            )
+            crashing_task = crashing_session.exec()
+            await crashing_session.on_trial_sample(SimpleNamespace(tick_id=CRASH_TICK_ID))
+            with pytest.raises(RuntimeError, match="died"):
+                await asyncio.wait_for(crashing_task, timeout=TIMEOUT)
+            with pytest.raises(RuntimeError, match="died more than 1 times"):
+                pool.create_session("rejected", SimpleNamespace(actors=[]), training_samples.produce_training_sample)
+        finally:
+            await pool.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,56 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from types import SimpleNamespace
+
+from cogment_verse.run.run_sample_producer_session import TrialSample
+
+
+class CountingMessage:
+    parse_count = 0
+
+    def __init__(self):
+        self.payload = None
+
+    def ParseFromString(self, payload):  # pylint: disable=invalid-name
+        CountingMessage.parse_count += 1
+        self.payload = payload
+
+
+def test_payloads_are_parsed_once():
+    sample_pb = SimpleNamespace(
+        payloads=[b"shared_observation", b"action"],
+        actor_samples=[
+            SimpleNamespace(actor=0, observation=0, action=1),
+            SimpleNamespace(actor=1, observation=0, action=None),
+        ],
+    )
+    actor_class = SimpleNamespace(observation_space=CountingMessage, action_space=CountingMessage)
+    sample = TrialSample(sample_pb, [actor_class, actor_class])
+
+    observation = sample.get_actor_observation(0)
+    assert observation.payload == b"shared_observation"
+    # Both actors observe the same payload, it is parsed once and the message is shared
+    assert sample.get_actor_observation(0) is observation
+    assert sample.get_actor_observation(1) is observation
+    assert CountingMessage.parse_count == 1
+
+    assert sample.get_actor_action(0).payload == b"action"
+    assert sample.get_actor_action(1, default="no_action") == "no_action"
+    assert CountingMessage.parse_count == 2
+
+    raw_observation = sample.get_actor_observation(1, deserialize=False, as_memoryview=True)
+    assert isinstance(raw_observation, memoryview)
+    assert raw_observation == b"shared_observation"
+    assert sample.get_actor_observation(1, deserialize=False) == b"shared_observation"
@@ -0,0 +1,120 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from cogment_verse.run.run_session import RunSession
+
+FAILING_TRIAL_CONFIG = "failing"
+
+
+class FakeController:
+    def __init__(self):
+        self.started_trial_ids = []
+        self.ended_trial_ids = asyncio.Queue()
+        self.running_trial_ids = set()
+        self.max_running_trials_count = 0
+
+    async def start_trial(self, trial_config):
+        await asyncio.sleep(0)
+        if trial_config == FAILING_TRIAL_CONFIG:
+            raise RuntimeError("unable to start the trial")
+        trial_id = f"trial_{len(self.started_trial_ids)}"
+        self.started_trial_ids.append(trial_id)
+        self.running_trial_ids.add(trial_id)
+        self.max_running_trials_count = max(self.max_running_trials_count, len(self.running_trial_ids))
+        return trial_id
+
+    def end_trial(self, trial_id):
+        self.running_trial_ids.remove(trial_id)
+        self.ended_trial_ids.put_nowait(trial_id)
+
+    async def watch_trials(self, trial_state_filters):
+        while True:
+            yield SimpleNamespace(trial_id=await self.ended_trial_ids.get())
+
+
+def create_run_session(controller):
+    return RunSession(
+        cog_settings=None,
+        controller=controller,
+        trial_datastore_client=None,
+        config=None,
+        run_sample_producer_impl=None,
+        impl_name="impl",
+        run_impl=None,
+        params_name="params",
+    )
+
+
+def start_trials(run_session, trial_configs_queue, trial_ids_queue, max_parallel_trials):
+    return asyncio.create_task(
+        run_session._do_start_trials(  # pylint: disable=protected-access
+            trial_configs_queue,
+            trial_ids_queue,
+            SimpleNamespace(is_paused=lambda: False),
+            max_parallel_trials,
+            on_progress=lambda _launched_trials_count, _finished_trials_count: None,
+        )
+    )
+
+
+async def get_started_trial_ids(trial_ids_queue, count):
+    return [(await asyncio.wait_for(trial_ids_queue.get(), timeout=1))[0] for _ in range(count)]
+
+
+def test_max_parallel_trials():
+    async def run():
+        controller = FakeController()
+        trial_configs_queue = asyncio.Queue()
+        trial_ids_queue = asyncio.Queue()
+        for _ in range(5):
+            trial_configs_queue.put_nowait("config")
+        trial_configs_queue.put_nowait(None)
+
+        task = start_trials(create_run_session(controller), trial_configs_queue, trial_ids_queue, max_parallel_trials=2)
+        assert await get_started_trial_ids(trial_ids_queue, 2) == ["trial_0", "trial_1"]
+        await asyncio.sleep(0.1)
+        assert trial_ids_queue.empty()
+
+        # Each freed slot is refilled right away
+        for trial_idx in range(5):
+            controller.end_trial(f"trial_{trial_idx}")
+            if trial_idx + 2 < 5:
+                assert await get_started_trial_ids(trial_ids_queue, 1) == [f"trial_{trial_idx + 2}"]
+
+        assert await asyncio.wait_for(trial_ids_queue.get(), timeout=1) is None
+        await asyncio.wait_for(task, timeout=1)
+        assert controller.max_running_trials_count == 2
+
+    asyncio.run(run())
+
+
+def test_failing_start_trial():
+    async def run():
+        controller = FakeController()
+        trial_configs_queue = asyncio.Queue()
+        trial_ids_queue = asyncio.Queue()
+        trial_configs_queue.put_nowait("config")
+        trial_configs_queue.put_nowait(FAILING_TRIAL_CONFIG)
+
+        # The run fails while waiting for the next trial config
+        task = start_trials(create_run_session(controller), trial_configs_queue, trial_ids_queue, max_parallel_trials=4)
+        with pytest.raises(RuntimeError, match="starting a trial"):
+            await asyncio.wait_for(task, timeout=1)
+        assert controller.started_trial_ids == ["trial_0"]
+
+    asyncio.run(run())
@@ -0,0 +1,26 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+
+from cogment_verse.run.run_session_benchmark import run_benchmark
+
+
+def test_run_benchmark():
+    results = asyncio.run(run_benchmark(trials_count=3, trial_length=20, observation="atari", max_parallel_trials=2))
+
+    assert results["samples_count"] == 60
+    assert results["samples_per_sec"] > 0
+    assert results["queue_latency_ms"]["p50"] <= results["queue_latency_ms"]["p99"]
+    assert set(results["stages_cpu_sec"]) >= {"trials", "sample_producers", "learner", "run_session"}
@@ -0,0 +1,69 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+from cogment_verse.run.run_stepper import RunStepper
+
+
+def test_step():
+    stepper = RunStepper(initial_ticks_capacity=4)
+
+    steps = {}
+    for tick_id in range(3, 20):
+        for trial_id in ["trial_a", "trial_b"]:
+            steps[(trial_id, tick_id)] = stepper.step(trial_id, tick_id)
+
+    assert stepper.count_steps() == 34
+    assert stepper.count_live_trials() == 2
+    assert [step_id for step_id, _ in steps.values()] == list(range(1, 35))
+    for (trial_id, tick_id), step in steps.items():
+        assert stepper.get_step(trial_id, tick_id) == step
+
+
+def test_step_errors():
+    stepper = RunStepper(initial_ticks_capacity=4)
+
+    stepper.step("trial", 2)
+    with pytest.raises(Exception):
+        stepper.step("trial", 2)
+    with pytest.raises(Exception):
+        stepper.step("trial", 1)
+    with pytest.raises(Exception):
+        stepper.get_step("trial", 3)
+    with pytest.raises(Exception):
+        stepper.get_step("other_trial", 2)
+
+    # Ticks can be skipped
+    step = stepper.step("trial", 10)
+    assert stepper.get_step("trial", 10) == step
+    with pytest.raises(Exception):
+        stepper.get_step("trial", 5)
+
+
+def test_end_trial():
+    stepper = RunStepper(initial_ticks_capacity=4)
+
+    stepper.step("trial_a", 0)
+    stepper.step("trial_a", 1)
+    stepper.end_trial("trial_a")
+    assert stepper.count_live_trials() == 0
+    with pytest.raises(Exception):
+        stepper.get_step("trial_a", 0)
+
+    # The slot is recycled
+    step = stepper.step("trial_b", 5)
+    assert stepper.get_step("trial_b", 5) == step
+    with pytest.raises(Exception):
+        stepper.get_step("trial_b", 6)
+    assert stepper.count_steps() == 3
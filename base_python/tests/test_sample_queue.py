@@ -0,0 +1,83 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+
+from cogment_verse.run.sample_queue import SampleQueue
+
+
+def test_unbounded():
+    async def run():
+        queue = SampleQueue()
+        for i in range(100):
+            queue.put_nowait(i)
+        assert not queue.is_paused()
+        assert queue.qsize() == 100
+        assert [queue.get_nowait() for _ in range(100)] == list(range(100))
+
+    asyncio.run(run())
+
+
+def test_high_water_mark():
+    async def run():
+        queue = SampleQueue(max_len=3)
+        for i in range(3):
+            queue.put_nowait(i)
+        assert queue.is_paused()
+        assert queue.queued_bytes > 0
+
+        wait_for_capacity = asyncio.create_task(queue.wait_for_capacity())
+        await asyncio.sleep(0)
+        assert not wait_for_capacity.done()
+
+        assert await queue.get() == 0
+        await asyncio.wait_for(wait_for_capacity, timeout=1)
+        assert not queue.is_paused()
+
+    asyncio.run(run())
+
+
+def test_spill_to_disk(tmp_path):
+    async def run():
+        queue = SampleQueue(max_len=2, spill_dir=tmp_path, max_spilled_bytes=1024 * 1024)
+        items = [{"idx": i, "data": bytes(100)} for i in range(10)]
+        for item in items:
+            queue.put_nowait(item)
+
+        assert queue.qsize() == 10
+        assert queue.spilled_bytes > 0
+        assert not queue.is_paused()
+
+        assert [await queue.get() for _ in range(10)] == items
+        assert queue.empty()
+        assert queue.spilled_bytes == 0
+        queue.close()
+
+    asyncio.run(run())
+
+
+def test_spill_to_disk_limit(tmp_path):
+    async def run():
+        queue = SampleQueue(max_len=1, spill_dir=tmp_path, max_spilled_bytes=200)
+        queue.put_nowait(bytes(100))
+        queue.put_nowait(bytes(100))
+        assert not queue.is_paused()
+        queue.put_nowait(bytes(100))
+        assert queue.is_paused()
+
+        queue.get_nowait()
+        assert not queue.is_paused()
+        queue.close()
+
+    asyncio.run(run())
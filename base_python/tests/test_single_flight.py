@@ -0,0 +1,59 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+
+import pytest
+from cogment_verse.utils import SingleFlight
+
+
+def test_coalesce_concurrent_calls():
+    async def run():
+        single_flight = SingleFlight()
+        calls_count = 0
+
+        async def retrieve():
+            nonlocal calls_count
+            calls_count += 1
+            await asyncio.sleep(0.01)
+            return "model"
+
+        results = await asyncio.gather(*[single_flight.run("key", retrieve) for _ in range(5)])
+        assert calls_count == 1
+        assert [result for result, _coalesced in results] == ["model"] * 5
+        assert [coalesced for _result, coalesced in results] == [False, True, True, True, True]
+        assert not single_flight.is_in_flight("key")
+
+        # Once done, the next call executes again
+        assert await single_flight.run("key", retrieve) == ("model", False)
+        assert calls_count == 2
+
+    asyncio.run(run())
+
+
+def test_share_errors():
+    async def run():
+        single_flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("unavailable")
+
+        results = await asyncio.gather(*[single_flight.run("key", fail) for _ in range(2)], return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+        with pytest.raises(RuntimeError):
+            await single_flight.run("key", fail)
+
+    asyncio.run(run())
@@ -0,0 +1,37 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from cogment_verse.run.trial_config_template import TrialConfigTemplate
+from google.protobuf.descriptor_pb2 import FieldDescriptorProto, FieldOptions
+
+
+def test_generate():
+    template = TrialConfigTemplate(
+        FieldDescriptorProto(name="field", type_name="shared", options=FieldOptions(deprecated=True))
+    )
+
+    configs = template.generate(
+        3, lambda idx: FieldDescriptorProto(number=idx + 1, options=FieldOptions(lazy=idx % 2 == 0))
+    )
+    assert not isinstance(configs, list)
+    for idx, config in enumerate(configs):
+        assert config.name == "field"
+        assert config.type_name == "shared"
+        assert config.number == idx + 1
+        assert config.options.deprecated
+        assert config.options.lazy == (idx % 2 == 0)
+
+    assert template.create() == FieldDescriptorProto(
+        name="field", type_name="shared", options=FieldOptions(deprecated=True)
+    )
@@ -0,0 +1,140 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+from types import SimpleNamespace
+
+import grpc.aio
+import pytest
+from cogment_verse.trial_datastore_client import TrialDatastoreSubscription
+
+
+def unavailable_error():
+    return grpc.aio.AioRpcError(grpc.StatusCode.UNAVAILABLE, grpc.aio.Metadata(), grpc.aio.Metadata())
+
+
+class FakeTrialDatastoreClient:
+    """
+    Trial datastore whose trials each have `ticks_count` samples.
+
+    `retrieve_trials` returns the trials once they are `started`, `retrieve_samples` streams their samples. Errors can be
+    injected in both.
+    """
+
+    def __init__(self, ticks_count=3):
+        self.ticks_count = ticks_count
+        self.started_trial_ids = set()
+        self.retrieve_trials_errors = []
+        self.retrieve_samples_errors = []
+        self.retrieve_trials_calls = []
+
+    async def retrieve_trials(self, trial_ids, _timeout):
+        self.retrieve_trials_calls.append(sorted(trial_ids))
+        if self.retrieve_trials_errors:
+            raise self.retrieve_trials_errors.pop(0)
+        return [SimpleNamespace(trial_id=trial_id) for trial_id in trial_ids if trial_id in self.started_trial_ids]
+
+    async def retrieve_samples(self, trial_ids):
+        # Error injected after the first sample of the stream
+        error = self.retrieve_samples_errors.pop(0) if self.retrieve_samples_errors else None
+
+        async def sample_generator():
+            for tick_id in range(self.ticks_count):
+                for trial_id in trial_ids:
+                    yield SimpleNamespace(trial_id=trial_id, tick_id=tick_id)
+                    if error is not None:
+                        raise error
+
+        return sample_generator
+
+
+async def run_subscription(client, trial_ids, **kwargs):
+    started_trial_ids = []
+    samples = []
+    ended_trial_ids = []
+
+    async def on_sample(sample):
+        samples.append((sample.trial_id, sample.tick_id))
+
+    async def on_trials_ended(trial_ids):
+        ended_trial_ids.extend(trial_ids)
+
+    subscription = TrialDatastoreSubscription(
+        client,
+        on_trials_started=lambda trial_infos: started_trial_ids.extend(info.trial_id for info in trial_infos),
+        on_sample=on_sample,
+        on_trials_ended=on_trials_ended,
+        initial_backoff_ms=1,
+        **kwargs,
+    )
+    subscription.add_trials(trial_ids)
+    subscription.close()
+    await asyncio.wait_for(subscription.run(), timeout=5)
+    return started_trial_ids, samples, ended_trial_ids
+
+
+def test_retry_transient_retrieve_trials_failure():
+    client = FakeTrialDatastoreClient()
+    client.started_trial_ids = {"trial_a", "trial_b"}
+    client.retrieve_trials_errors = [unavailable_error()]
+
+    started_trial_ids, samples, ended_trial_ids = asyncio.run(run_subscription(client, ["trial_a", "trial_b"]))
+
+    # The pending trials are retrieved together, the failed request being retried
+    assert client.retrieve_trials_calls == [["trial_a", "trial_b"], ["trial_a", "trial_b"]]
+    assert sorted(started_trial_ids) == ["trial_a", "trial_b"]
+    assert sorted(samples) == [(trial_id, tick_id) for trial_id in ["trial_a", "trial_b"] for tick_id in range(3)]
+    assert sorted(ended_trial_ids) == ["trial_a", "trial_b"]
+
+
+def test_resume_interrupted_sample_stream():
+    client = FakeTrialDatastoreClient()
+    client.started_trial_ids = {"trial_a"}
+    client.retrieve_samples_errors = [unavailable_error()]
+
+    _started_trial_ids, samples, ended_trial_ids = asyncio.run(run_subscription(client, ["trial_a"]))
+
+    # The sample routed before the interruption is not routed again
+    assert samples == [("trial_a", 0), ("trial_a", 1), ("trial_a", 2)]
+    assert ended_trial_ids == ["trial_a"]
+
+
+def test_wait_for_unknown_trials():
+    client = FakeTrialDatastoreClient()
+    client.started_trial_ids = {"trial_a"}
+    original_retrieve_trials = client.retrieve_trials
+
+    async def retrieve_trials(trial_ids, timeout):
+        # "trial_b" becomes known to the trial datastore after the first request
+        trial_infos = await original_retrieve_trials(trial_ids, timeout)
+        client.started_trial_ids.add("trial_b")
+        return trial_infos
+
+    client.retrieve_trials = retrieve_trials
+
+    started_trial_ids, samples, ended_trial_ids = asyncio.run(run_subscription(client, ["trial_a", "trial_b"]))
+
+    assert client.retrieve_trials_calls == [["trial_a", "trial_b"], ["trial_b"]]
+    assert started_trial_ids == ["trial_a", "trial_b"]
+    assert len(samples) == 6
+    assert sorted(ended_trial_ids) == ["trial_a", "trial_b"]
+
+
+def test_propagate_persistent_stream_errors():
+    client = FakeTrialDatastoreClient()
+    client.started_trial_ids = {"trial_a"}
+    client.retrieve_samples_errors = [unavailable_error(), unavailable_error()]
+
+    with pytest.raises(RuntimeError, match="An error occured while streaming samples"):
+        asyncio.run(run_subscription(client, ["trial_a"], max_retries=1))
@@ -0,0 +1,102 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import types
+
+import pytest
+from cogment_verse.run import trial_end_dispatcher
+from cogment_verse.run.trial_end_dispatcher import TrialEndDispatcher
+
+
+class FakeController:
+    def __init__(self, failing_watch_count=0):
+        self.watch_count = 0
+        self.failing_watch_count = failing_watch_count
+        self.ended_trials = asyncio.Queue()
+
+    async def watch_trials(self, trial_state_filters):
+        self.watch_count += 1
+        if self.watch_count <= self.failing_watch_count:
+            raise RuntimeError("stream down")
+        while True:
+            yield types.SimpleNamespace(trial_id=await self.ended_trials.get())
+
+
+def test_dispatch_to_owners():
+    async def run():
+        controller = FakeController()
+        dispatcher = TrialEndDispatcher(lambda: controller)
+        listened_trial_ids = []
+        dispatcher.add_listener(lambda trial_info: listened_trial_ids.append(trial_info.trial_id))
+
+        subscription_a = dispatcher.subscribe()
+        subscription_b = dispatcher.subscribe()
+        subscription_a.add_trial("trial_a")
+        subscription_b.add_trial("trial_b")
+
+        for trial_id in ["other_trial", "trial_b", "trial_a", "trial_late"]:
+            controller.ended_trials.put_nowait(trial_id)
+        ended_trials_a = subscription_a.watch_ended_trials()
+        ended_trials_b = subscription_b.watch_ended_trials()
+        assert (await asyncio.wait_for(ended_trials_a.__anext__(), timeout=1)).trial_id == "trial_a"
+        assert (await asyncio.wait_for(ended_trials_b.__anext__(), timeout=1)).trial_id == "trial_b"
+
+        # Trials ending before being added are dispatched when added
+        subscription_b.add_trial("trial_late")
+        assert (await asyncio.wait_for(ended_trials_b.__anext__(), timeout=1)).trial_id == "trial_late"
+
+        assert listened_trial_ids == ["other_trial", "trial_b", "trial_a", "trial_late"]
+        assert controller.watch_count == 1
+
+        subscription_a.close()
+        subscription_b.close()
+        await dispatcher.close()
+
+    asyncio.run(run())
+
+
+def test_missed_events_after_watch_error(monkeypatch):
+    monkeypatch.setattr(trial_end_dispatcher, "WATCH_RETRY_DELAY_SEC", 0)
+
+    async def run():
+        controller = FakeController(failing_watch_count=1)
+        dispatcher = TrialEndDispatcher(lambda: controller)
+        listened_trial_ids = []
+        missed_events_count = 0
+
+        def on_events_missed():
+            nonlocal missed_events_count
+            missed_events_count += 1
+
+        dispatcher.add_listener(
+            lambda trial_info: listened_trial_ids.append(trial_info.trial_id), on_events_missed=on_events_missed
+        )
+        subscription = dispatcher.subscribe()
+        subscription.add_trial("trial")
+        ended_trials = subscription.watch_ended_trials()
+        with pytest.raises(RuntimeError, match="monitoring the trials"):
+            await asyncio.wait_for(ended_trials.__anext__(), timeout=1)
+        assert missed_events_count == 1
+
+        # The listeners keep receiving the end events once the stream is reopened
+        controller.ended_trials.put_nowait("other_trial")
+        while not listened_trial_ids:
+            await asyncio.sleep(0.01)
+        assert listened_trial_ids == ["other_trial"]
+        assert controller.watch_count == 2 and missed_events_count == 1
+
+        await dispatcher.close()
+
+    asyncio.run(run())
@@ -0,0 +1,150 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+from collections import namedtuple
+
+from cogment_verse.run.trial_sample_demultiplexer import TrialSampleDemultiplexer
+
+Sample = namedtuple("Sample", ["trial_id", "tick_id"])
+
+
+class FakeSession:
+    def __init__(self, trial_id):
+        self.trial_id = trial_id
+        self.samples = []
+        self.given_count = 0
+        self.done = False
+        self.given_count_when_done = None
+        self._on_sample_consumed = None
+
+    def set_on_sample_consumed(self, on_sample_consumed):
+        self._on_sample_consumed = on_sample_consumed
+
+    async def on_trial_sample(self, sample):
+        self.samples.append(sample)
+        self.given_count += 1
+
+    async def on_trial_done(self):
+        self.done = True
+        self.given_count_when_done = self.given_count
+
+    def consume(self):
+        sample = self.samples.pop(0)
+        self._on_sample_consumed()
+        return sample
+
+
+async def settle():
+    # Letting the held back samples be handed over
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_slow_trial_does_not_delay_fast_trial():
+    async def run():
+        demultiplexer = TrialSampleDemultiplexer("run", max_trial_buffer_len=2, max_overflow_len=4)
+        slow_session = FakeSession("slow")
+        fast_session = FakeSession("fast")
+        demultiplexer.add_session(slow_session)
+        demultiplexer.add_session(fast_session)
+
+        # The slow trial never consumes while the fast one keeps going, dispatching is never paused
+        for tick_id in range(20):
+            await asyncio.wait_for(demultiplexer.dispatch(Sample("slow", tick_id)), timeout=1)
+            await asyncio.wait_for(demultiplexer.dispatch(Sample("fast", tick_id)), timeout=1)
+            assert fast_session.consume().tick_id == tick_id
+
+        # The slow session was only given its own buffer, the rest is handed over as it consumes
+        assert [sample.tick_id for sample in slow_session.samples] == [0, 1]
+        consumed_tick_ids = []
+        while slow_session.samples:
+            consumed_tick_ids.append(slow_session.consume().tick_id)
+            await settle()
+            assert len(slow_session.samples) <= 2
+        assert consumed_tick_ids == list(range(20))
+
+        await demultiplexer.remove_session("slow")
+        assert slow_session.done
+
+    asyncio.run(run())
+
+
+def test_trial_done_after_held_back_samples():
+    async def run():
+        demultiplexer = TrialSampleDemultiplexer("run", max_trial_buffer_len=1, max_overflow_len=10)
+        session = FakeSession("trial")
+        demultiplexer.add_session(session)
+
+        for tick_id in range(3):
+            await demultiplexer.dispatch(Sample("trial", tick_id))
+        await demultiplexer.remove_session("trial")
+        assert "trial" not in demultiplexer
+        # Samples dispatched after the end of the trial are ignored
+        await demultiplexer.dispatch(Sample("trial", 3))
+
+        assert not session.done
+        consumed_tick_ids = []
+        while session.samples:
+            consumed_tick_ids.append(session.consume().tick_id)
+            await settle()
+        assert consumed_tick_ids == [0, 1, 2]
+        # The session was notified once every held back sample was handed over
+        assert session.given_count_when_done == 3
+
+    asyncio.run(run())
+
+
+def test_held_back_samples_spilled_above_share(tmp_path):
+    async def run():
+        demultiplexer = TrialSampleDemultiplexer(
+            "run", max_trial_buffer_len=1, max_overflow_len=4, spill_dir=str(tmp_path)
+        )
+        slow_session = FakeSession("slow")
+        other_session = FakeSession("other")
+        demultiplexer.add_session(slow_session)
+        demultiplexer.add_session(other_session)
+
+        # 1 sample given to the session, 2 held back in memory, the others spilled
+        for tick_id in range(10):
+            await demultiplexer.dispatch(Sample("slow", tick_id))
+        trial = demultiplexer._trials["slow"]  # pylint: disable=protected-access
+        assert len(trial.samples) == 2
+        assert len(trial.spill) == 7
+
+        consumed_tick_ids = []
+        while slow_session.samples:
+            consumed_tick_ids.append(slow_session.consume().tick_id)
+            await settle()
+        assert consumed_tick_ids == list(range(10))
+
+    asyncio.run(run())
+
+
+def test_released_trial_drops_held_back_samples():
+    async def run():
+        demultiplexer = TrialSampleDemultiplexer("run", max_trial_buffer_len=1, max_overflow_len=1)
+        session = FakeSession("trial")
+        demultiplexer.add_session(session)
+
+        for tick_id in range(3):
+            await demultiplexer.dispatch(Sample("trial", tick_id))
+        demultiplexer.release_session("trial")
+
+        session.consume()
+        await settle()
+        assert not session.samples
+        assert not session.done
+
+    asyncio.run(run())
@@ -0,0 +1,119 @@
+# Copyright 2021 AI Redefined Inc. <dev+cogment@ai-r.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from cogment.api.common_pb2 import TrialParams
+from cogment.api.trial_datastore_pb2 import StoredTrialSample
+from cogment_verse.run.trial_sample_recording import (
+    SAMPLES_DATA_COLUMN,
+    SEGMENT_DIR_PREFIX,
+    TrialSampleRecorder,
+    read_recorded_trials,
+)
+from cogment_verse.run.run_session import RunSession
+
+# pylint: disable=protected-access
+
+
+def test_record_and_replay(tmp_path):
+    trial_ids = ["trial_a", "trial_b", "trial_c"]
+    # Interleaved samples, trial "trial_a" spanning the three segments
+    samples = [
+        StoredTrialSample(
+            trial_id=trial_ids[sample_idx % 3], tick_id=sample_idx // 3, payloads=[f"{sample_idx}".encode()]
+        )
+        for sample_idx in range(10)
+    ]
+
+    async def record():
+        recorder = TrialSampleRecorder(str(tmp_path), max_segment_samples=4)
+        for trial_idx, trial_id in enumerate(trial_ids):
+            recorder.add_trial(trial_id, TrialParams(max_steps=trial_idx + 1))
+        for sample in samples:
+            recorder.record(sample)
+        await recorder.close()
+
+    asyncio.run(record())
+
+    segment_dirs = sorted(entry for entry in os.listdir(tmp_path))
+    assert len(segment_dirs) == 3
+    assert all(segment_dir.startswith(SEGMENT_DIR_PREFIX) for segment_dir in segment_dirs)
+
+    recorded_trials = read_recorded_trials(str(tmp_path))
+    assert [recorded_trial.trial_id for recorded_trial in recorded_trials] == trial_ids
+    assert [recorded_trial.params.max_steps for recorded_trial in recorded_trials] == [1, 2, 3]
+    assert [recorded_trial.count_samples() for recorded_trial in recorded_trials] == [4, 3, 3]
+    for trial_idx, recorded_trial in enumerate(recorded_trials):
+        assert list(recorded_trial.get_samples()) == samples[trial_idx::3]
+
+    # Segments are memory mapped
+    segment, _sample_idx = recorded_trials[0]._samples_locations[0]
+    assert isinstance(segment[SAMPLES_DATA_COLUMN], np.memmap)
+
+
+class FakeTrialsObserver:
+    def __init__(self):
+        self.started_trial_ids = []
+        self.closed = False
+
+    def on_trials_started(self, trial_infos):
+        self.started_trial_ids.extend(trial_info.trial_id for trial_info in trial_infos)
+
+    async def on_sample(self, sample):
+        pass
+
+    async def on_trials_ended(self, trial_ids):
+        pass
+
+    async def wait_for_sample_producers(self):
+        pass
+
+    async def close(self):
+        self.closed = True
+
+
+def test_failing_replay():
+    def get_corrupted_samples():
+        yield StoredTrialSample(trial_id="corrupted", tick_id=0)
+        raise ValueError("corrupted segment")
+
+    recorded_trials = [
+        SimpleNamespace(trial_id="corrupted", get_samples=get_corrupted_samples),
+        SimpleNamespace(trial_id="trial_b", get_samples=lambda: []),
+        SimpleNamespace(trial_id="trial_c", get_samples=lambda: []),
+    ]
+    trials_observer = FakeTrialsObserver()
+
+    async def replay():
+        # The failure is surfaced while waiting for a slot instead of hanging
+        await asyncio.wait_for(
+            RunSession._do_replay_trials(
+                None,
+                recorded_trials,
+                trials_observer,
+                max_parallel_trials=1,
+                on_progress=lambda _launched_trials_count, _finished_trials_count: None,
+            ),
+            timeout=1,
+        )
+
+    with pytest.raises(RuntimeError, match="replaying a trial"):
+        asyncio.run(replay())
+    assert trials_observer.started_trial_ids == ["corrupted"]
+    assert trials_observer.closed
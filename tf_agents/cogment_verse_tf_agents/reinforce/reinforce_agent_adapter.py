@@ -60,7 +60,7 @@ class ReinforceAgentAdapter(AgentAdapter):
 
             # Retrieve the latest version of the agent model (asynchronous so needs to be done after the start)
             model, _, version_info = await self.retrieve_version(
-                actor_session.config.model_id, actor_session.config.model_version
+                actor_session.config.model_id, actor_session.config.model_version, subscribe=True
             )
 
             version_number = version_info["version_number"]
@@ -27,7 +27,9 @@ def create_training_run(agent_adapter):
         run_id = run_session.run_id
         config = run_session.config
 
-        run_xp_tracker = MlflowExperimentTracker(run_session.params_name, run_id)
+        run_xp_tracker = MlflowExperimentTracker(
+            run_session.params_name, run_id, aggregated_metrics=["trial_total_reward"]
+        )
 
         try:
             # Initializing a model
@@ -130,10 +132,10 @@ def create_training_run(agent_adapter):
                         f" {trials_completed} trials completed"
                     )
 
-            run_xp_tracker.terminate_success()
+            await run_xp_tracker.terminate_success()
 
         except Exception:
-            run_xp_tracker.terminate_failure()
+            await run_xp_tracker.terminate_failure()
             raise
 
     return training_run
@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
 import logging
 
 import cogment
@@ -92,6 +93,18 @@ class HiveAgentAdapter(AgentAdapter):
         # pylint: disable=protected-access
         return {}
 
+    def _snapshot(self, model):
+        # pylint: disable=protected-access
+        # The replay buffer isn't saved, the snapshot gets an empty one like loaded models
+        replay_buffer = model._replay_buffer
+        model._replay_buffer = None
+        try:
+            snapshot = copy.deepcopy(model)
+        finally:
+            model._replay_buffer = replay_buffer
+        snapshot._create_replay_buffer()
+        return snapshot
+
     def _create_actor_implementations(self):
         def create_actor_impl(impl_name):
             async def impl(actor_session):
@@ -100,7 +113,7 @@ class HiveAgentAdapter(AgentAdapter):
 
                 # Retrieve the latest version of the agent model (asynchronous so needs to be done after the start)
                 model, _, version_info = await self.retrieve_version(
-                    actor_session.config.model_id, actor_session.config.model_version
+                    actor_session.config.model_id, actor_session.config.model_version, subscribe=True
                 )
 
                 version_number = version_info["version_number"]
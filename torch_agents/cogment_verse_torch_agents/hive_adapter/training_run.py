@@ -18,7 +18,7 @@ import time
 import numpy as np
 import torch
 
-from cogment_verse import MlflowExperimentTracker
+from cogment_verse import MlflowExperimentTracker, TrialConfigTemplate
 from cogment_verse.utils import sizeof_fmt, throttle
 from cogment_verse_torch_agents.third_party.hive.utils.schedule import (
     CosineSchedule,
@@ -67,7 +67,9 @@ def create_training_run(agent_adapter):
 
         config = run_session.config
 
-        run_xp_tracker = MlflowExperimentTracker(run_session.params_name, run_id)
+        run_xp_tracker = MlflowExperimentTracker(
+            run_session.params_name, run_id, aggregated_metrics=["trial_total_reward"]
+        )
 
         try:
             # Initializing a model
@@ -132,7 +134,8 @@ def create_training_run(agent_adapter):
             distinguished_actor = np.random.randint(0, config.environment.specs.num_players)
             player_actor_configs[distinguished_actor].agent_config.model_version = -1
 
-            self_play_trial_configs = [
+            # Trials configs are identical, they are lazily created when trials are started
+            self_play_trial_config_template = TrialConfigTemplate(
                 TrialConfig(
                     run_id=run_id,
                     environment=EnvironmentParams(
@@ -148,10 +151,10 @@ def create_training_run(agent_adapter):
                     actors=player_actor_configs,
                     distinguished_actor=distinguished_actor,
                 )
-                for _ in range(config.total_trial_count - config.demonstration_count)
-            ]
+            )
+            self_play_trial_count = config.total_trial_count - config.demonstration_count
 
-            demonstration_trial_configs = []
+            demonstration_trial_config_template = None
             if config.demonstration_count > 0:
                 # create the config for the teacher agent
                 teacher_actor_config = ActorParams(
@@ -164,7 +167,7 @@ def create_training_run(agent_adapter):
                         role=HumanRole.TEACHER,
                     ),
                 )
-                demonstration_trial_configs = [
+                demonstration_trial_config_template = TrialConfigTemplate(
                     TrialConfig(
                         run_id=run_id,
                         environment=EnvironmentParams(
@@ -180,8 +183,7 @@ def create_training_run(agent_adapter):
                         actors=[*player_actor_configs, teacher_actor_config],
                         distinguished_actor=distinguished_actor,
                     )
-                    for _ in range(config.demonstration_count)
-                ]
+                )
 
             def train_model():
                 training_batch = None
@@ -198,6 +200,16 @@ def create_training_run(agent_adapter):
                     break
                 return num_samples_seen
 
+            # Versions are published in the background, errors are raised at the next publication
+            publications = []
+
+            async def wait_for_publications(done_only):
+                for publication in list(publications):
+                    if done_only and not publication.done():
+                        continue
+                    publications.remove(publication)
+                    await publication
+
             async def archive_model(
                 model_archive_schedule,
                 model_publication_schedule,
@@ -210,29 +222,44 @@ def create_training_run(agent_adapter):
                 archive = model_archive_schedule.update()
                 publish = model_publication_schedule.update()
                 if archive or publish:
-                    version_info = await agent_adapter.publish_version(model_id, model, archived=archive)
-                    version_number = version_info["version_number"]
-                    version_data_size = int(version_info["data_size"])
-
-                    # Log metrics about the published model
-                    run_xp_tracker.log_metrics(
-                        step_timestamp,
-                        step_idx,
-                        info,
+                    await wait_for_publications(done_only=True)
+                    publication = await agent_adapter.publish_version_in_background(model_id, model, archived=archive)
+                    publications.append(publication)
+
+                    # Metrics are computed now and logged once the version is published
+                    metrics = dict(
                         epsilon=model._epsilon_schedule.get_value(),
                         replay_buffer_size=model.replay_buffer_size(),
                         batch_reward=training_batch["rewards"].mean(),
                         batch_done=training_batch["done"].mean(),
-                        model_published_version=version_number,
                         training_step=training_step,
                         training_samples_seen=samples_seen,
                         samples_generated=samples_generated,
                         episodes_per_sec=trials_completed / (time.time() - start_time),
                     )
-                    verb = "archived" if archive else "published"
-                    log.info(
-                        f"[{run_session.params_name}/{run_id}] {model_id}@v{version_number} {verb} after {run_session.count_steps()} steps ({sizeof_fmt(version_data_size)})"
-                    )
+                    steps_count = run_session.count_steps()
+
+                    def on_published(publication):
+                        if publication.cancelled() or publication.exception() is not None:
+                            return
+                        version_info = publication.result()
+                        version_number = version_info["version_number"]
+                        version_data_size = int(version_info["data_size"])
+
+                        # Log metrics about the published model
+                        run_xp_tracker.log_metrics(
+                            step_timestamp,
+                            step_idx,
+                            info,
+                            model_published_version=version_number,
+                            **metrics,
+                        )
+                        verb = "archived" if archive else "published"
+                        log.info(
+                            f"[{run_session.params_name}/{run_id}] {model_id}@v{version_number} {verb} after {steps_count} steps ({sizeof_fmt(version_data_size)})"
+                        )
+
+                    publication.add_done_callback(on_published)
 
             async def run_trials(trial_configs, max_parallel_trials):
                 nonlocal samples_generated
@@ -242,86 +269,86 @@ def create_training_run(agent_adapter):
                 nonlocal all_trials_reward
                 nonlocal start_time
 
-                async for (
-                    step_idx,
-                    step_timestamp,
-                    _trial_id,
-                    _tick_id,
-                    sample,
-                ) in run_session.start_trials_and_wait_for_termination(
+                async for batch in run_session.start_trials_and_wait_for_batches(
                     trial_configs=trial_configs,
                     max_parallel_trials=max_parallel_trials,
                     on_progress=create_progress_logger(run_session.params_name, run_id, config.total_trial_count),
                 ):
-                    if sample.trial_total_reward is not None:
-                        # This is a sample from a end of a trial
-
-                        trials_completed += 1
-                        all_trials_reward += sample.trial_total_reward
-
-                        run_xp_tracker.log_metrics(
-                            step_timestamp,
-                            step_idx,
-                            trial_total_reward=sample.trial_total_reward,
-                            trials_completed=trials_completed,
-                            mean_trial_reward=all_trials_reward / trials_completed,
-                        )
-
-                    samples_generated += 1
-
-                    with TRAINING_ADD_SAMPLE_TIME.time():
-                        model.consume_training_sample(sample.current_player_sample)
-
-                    TRAINING_REPLAY_BUFFER_SIZE.set(model.replay_buffer_size())
-
-                    if sample.current_player_sample[-1] and model.replay_buffer_size() > config.batch_size:
-                        info, training_batch = train_model()
-                        samples_seen += get_samples_seen(training_batch)
-                        training_step += 1
-                        model.reset_replay_buffer()
-
-                        await archive_model(
-                            model_archive_schedule,
-                            model_publication_schedule,
-                            step_timestamp,
-                            step_idx,
-                            training_batch,
-                            info,
-                        )
-
-                    elif (
-                        model.replay_buffer_size() > config.min_replay_buffer_size
-                        and model.replay_buffer_size() > config.batch_size
-                    ):
-                        info, training_batch = train_model()
-                        samples_seen += get_samples_seen(training_batch)
-                        training_step += 1
-
-                        await archive_model(
-                            model_archive_schedule,
-                            model_publication_schedule,
-                            step_timestamp,
-                            step_idx,
-                            training_batch,
-                            info,
-                        )
+                    for step_idx, step_timestamp, _trial_id, _tick_id, sample in batch:
+                        if sample.trial_total_reward is not None:
+                            # This is a sample from a end of a trial
+
+                            trials_completed += 1
+                            all_trials_reward += sample.trial_total_reward
+
+                            run_xp_tracker.log_metrics(
+                                step_timestamp,
+                                step_idx,
+                                trial_total_reward=sample.trial_total_reward,
+                                trials_completed=trials_completed,
+                                mean_trial_reward=all_trials_reward / trials_completed,
+                            )
+
+                        samples_generated += 1
+
+                        with TRAINING_ADD_SAMPLE_TIME.time():
+                            model.consume_training_sample(sample.current_player_sample)
+
+                        TRAINING_REPLAY_BUFFER_SIZE.set(model.replay_buffer_size())
+
+                        if sample.current_player_sample[-1] and model.replay_buffer_size() > config.batch_size:
+                            info, training_batch = train_model()
+                            samples_seen += get_samples_seen(training_batch)
+                            training_step += 1
+                            model.reset_replay_buffer()
+
+                            await archive_model(
+                                model_archive_schedule,
+                                model_publication_schedule,
+                                step_timestamp,
+                                step_idx,
+                                training_batch,
+                                info,
+                            )
+
+                        elif (
+                            model.replay_buffer_size() > config.min_replay_buffer_size
+                            and model.replay_buffer_size() > config.batch_size
+                        ):
+                            info, training_batch = train_model()
+                            samples_seen += get_samples_seen(training_batch)
+                            training_step += 1
+
+                            await archive_model(
+                                model_archive_schedule,
+                                model_publication_schedule,
+                                step_timestamp,
+                                step_idx,
+                                training_batch,
+                                info,
+                            )
 
                 log.info(
                     f"[{run_session.params_name}/{run_id}] done, {model.replay_buffer_size()} samples gathered over {run_session.count_steps()} steps"
                 )
 
-            if demonstration_trial_configs:
+            if demonstration_trial_config_template is not None:
                 await run_trials(
-                    demonstration_trial_configs,
+                    demonstration_trial_config_template.generate(config.demonstration_count),
                     max_parallel_trials=config.max_parallel_trials,
                 )
-            if self_play_trial_configs:
-                await run_trials(self_play_trial_configs, max_parallel_trials=config.max_parallel_trials)
+            if self_play_trial_count > 0:
+                await run_trials(
+                    self_play_trial_config_template.generate(self_play_trial_count),
+                    max_parallel_trials=config.max_parallel_trials,
+                )
+
+            await wait_for_publications(done_only=False)
 
-            run_xp_tracker.terminate_success()
+            await run_xp_tracker.terminate_success()
 
         except Exception:
-            run_xp_tracker.terminate_failure()
+            await run_xp_tracker.terminate_failure()
             raise
 
     return training_run
@@ -38,8 +38,7 @@ from data_pb2 import (
     AgentConfig,
 )
 
-from cogment_verse.utils import LRU
-from cogment_verse import AgentAdapter
+from cogment_verse import AgentAdapter, TrialConfigTemplate
 from cogment_verse import MlflowExperimentTracker
 from cogment_verse_torch_agents.muzero.agent import MuZeroAgent
 from cogment_verse_torch_agents.muzero.utils import RunningStats
@@ -52,7 +51,6 @@ from cogment_verse_torch_agents.muzero.replay_worker import ReplayBufferWorker
 from cogment_verse_torch_agents.muzero.trial_worker import AgentTrialWorker
 from cogment_verse_torch_agents.muzero.train_worker import TrainWorker
 
-
 # pylint: disable=arguments-differ
 
 log = logging.getLogger(__name__)
@@ -153,7 +151,6 @@ class MuZeroAgentAdapter(AgentAdapter):
 
     def __init__(self):
         super().__init__()
-        self._model_cache = LRU(2)  # memory issue?
         self._dtype = torch.float
 
     def _create(
@@ -197,7 +194,7 @@ class MuZeroAgentAdapter(AgentAdapter):
     def _create_actor_implementations(self):
         async def _single_agent_muzero_actor_implementation(actor_session):
             actor_session.start()
-            agent, _, _ = await self.retrieve_version(actor_session.config.model_id, -1)
+            agent, _, _ = await self.retrieve_version(actor_session.config.model_id, -1, subscribe=True)
             agent.set_device(actor_session.config.device)
 
             worker = AgentTrialWorker(agent, actor_session.config, mp)
@@ -265,7 +262,9 @@ class MuZeroAgentAdapter(AgentAdapter):
             assert action >= 0
 
     async def single_agent_muzero_run_implementation(self, run_session):
-        xp_tracker = MlflowExperimentTracker(run_session.params_name, run_session.run_id)
+        xp_tracker = MlflowExperimentTracker(
+            run_session.params_name, run_session.run_id, aggregated_metrics=["trial_total_reward"]
+        )
 
         # Initializing a model
         model_id = f"{run_session.run_id}_model"
@@ -388,12 +387,6 @@ class MuZeroAgentAdapter(AgentAdapter):
 
 
 def make_trial_configs(run_id, config, model_id, model_version_number):
-    def clone_config(config, render, seed):
-        config = copy.deepcopy(config)
-        config.render = render
-        config.seed = seed
-        return config
-
     actor_config = AgentConfig(
         run_id=run_id,
         model_id=model_id,
@@ -415,39 +408,35 @@ def make_trial_configs(run_id, config, model_id, model_version_number):
         implementation="client",
         agent_config=actor_config,  # todo: this needs to be modified to HumanConfig
     )
-    demonstration_configs = [
-        TrialConfig(
-            run_id=run_id,
-            environment=EnvironmentParams(
-                config=clone_config(
-                    config.environment.config,
-                    seed=config.environment.config.seed + i + config.demonstration_trials,
-                    render=True,
-                ),
-                specs=config.environment.specs,
-            ),
-            actors=[muzero_config, teacher_config],
+
+    def make_template(render, actors):
+        environment_config = EnvironmentConfig()
+        environment_config.CopyFrom(config.environment.config)
+        environment_config.render = render
+        # The seed is set for each trial
+        environment_config.seed = 0
+        return TrialConfigTemplate(
+            TrialConfig(
+                run_id=run_id,
+                environment=EnvironmentParams(config=environment_config, specs=config.environment.specs),
+                actors=actors,
+            )
         )
-        for i in range(config.demonstration_trials)
-    ]
 
-    trial_configs = [
-        TrialConfig(
-            run_id=run_id,
+    def make_seed_patch(trial_idx):
+        return TrialConfig(
             environment=EnvironmentParams(
-                config=clone_config(
-                    config.environment.config,
-                    seed=config.environment.config.seed + i + config.demonstration_trials,
-                    render=False,
-                ),
-                specs=config.environment.specs,
-            ),
-            actors=[muzero_config],
+                config=EnvironmentConfig(seed=config.environment.config.seed + trial_idx + config.demonstration_trials)
+            )
         )
-        for i in range(config.trial_count - config.demonstration_trials)
-    ]
 
-    return demonstration_configs + trial_configs
+    # Trial configs are lazily created when trials are started
+    yield from make_template(render=True, actors=[muzero_config, teacher_config]).generate(
+        config.demonstration_trials, make_seed_patch
+    )
+    yield from make_template(render=False, actors=[muzero_config]).generate(
+        config.trial_count - config.demonstration_trials, make_seed_patch
+    )
 
 
 def make_workers(manager, agent, model_id, config):
@@ -54,6 +54,7 @@ class SelfPlayAgentAdapter(AgentAdapter):
             model, _, _ = await self.retrieve_version(
                 actor_session.config.model_id,
                 actor_session.config.model_version,
+                subscribe=True,
                 environment_specs=actor_session.config.environment_specs,
             )
 
@@ -18,8 +18,7 @@ from data_pb2 import (
     ActorParams,
     TrialConfig,
 )
-from cogment_verse import MlflowExperimentTracker
-
+from cogment_verse import MlflowExperimentTracker, TrialConfigTemplate
 
 # pylint: disable=protected-access
 # pylint: disable=W0612
@@ -124,24 +123,22 @@ def create_training_run(agent_adapter):
             ]
 
             config.environment.config.mode = "train"
-            train_trial_configs = [
+            train_trial_config_template = TrialConfigTemplate(
                 TrialConfig(
                     run_id=run_id,
                     environment=config.environment,
                     actors=bob_configs + alice_configs,
                 )
-                for _ in range(config.rollout.epoch_train_trial_count)
-            ]
+            )
 
             config.environment.config.mode = "test"
-            test_trial_configs = [
+            test_trial_config_template = TrialConfigTemplate(
                 TrialConfig(
                     run_id=run_id,
                     environment=config.environment,
                     actors=bob_configs + alice_configs,
                 )
-                for _ in range(config.rollout.epoch_test_trial_count)
-            ]
+            )
 
             total_number_trials = 0
             alice_rewards = []
@@ -161,7 +158,7 @@ def create_training_run(agent_adapter):
                     _tick_id,
                     sample,
                 ) in run_session.start_trials_and_wait_for_termination(
-                    trial_configs=train_trial_configs,
+                    trial_configs=train_trial_config_template.generate(config.rollout.epoch_train_trial_count),
                     max_parallel_trials=config.rollout.max_parallel_trials,
                 ):
 
@@ -210,7 +207,7 @@ def create_training_run(agent_adapter):
                         _tick_id,
                         sample,
                     ) in run_session.start_trials_and_wait_for_termination(
-                        trial_configs=test_trial_configs,
+                        trial_configs=test_trial_config_template.generate(config.rollout.epoch_test_trial_count),
                         max_parallel_trials=config.rollout.max_parallel_trials,
                     ):
                         if sample.current_player == 0:  # bob' sample
@@ -225,11 +222,11 @@ def create_training_run(agent_adapter):
                                     bob_success=test_success[-1],
                                 )
 
-            run_xp_tracker.terminate_success()
+            await run_xp_tracker.terminate_success()
 
         except Exception as exception:
             logging.error(f"An exception occurred: {exception}")
-            run_xp_tracker.terminate_failure()
+            await run_xp_tracker.terminate_failure()
             raise
 
     return training_run
@@ -18,8 +18,21 @@ from collections import namedtuple
 import cogment
 import torch
 from cogment.api.common_pb2 import TrialState
-from cogment_verse import AgentAdapter, MlflowExperimentTracker
-from cogment_verse_torch_agents.utils.tensors import cog_action_from_tensor, tensor_from_cog_action, tensor_from_cog_obs
+from cogment_verse import (
+    AgentAdapter,
+    MlflowExperimentTracker,
+    TrialConfigTemplate,
+    is_flat_tensors,
+    load_flat_tensors,
+    save_flat_tensors,
+)
+from cogment_verse_torch_agents.utils.tensors import (
+    arrays_from_state_dict,
+    assign_arrays_to_module,
+    cog_action_from_tensor,
+    tensor_from_cog_action,
+    tensor_from_cog_obs,
+)
 from data_pb2 import (
     AgentConfig,
     ActorParams,
@@ -44,6 +57,15 @@ class SimpleA2CAgentAdapter(AgentAdapter):
         super().__init__()
         self._dtype = torch.float
 
+    def _create_network(self, num_input, hidden_size, num_output):
+        return torch.nn.Sequential(
+            torch.nn.Linear(num_input, hidden_size),
+            torch.nn.Tanh(),
+            torch.nn.Linear(hidden_size, hidden_size),
+            torch.nn.Tanh(),
+            torch.nn.Linear(hidden_size, num_output),
+        ).to(self._dtype)
+
     def _create(
         self,
         model_id,
@@ -55,20 +77,10 @@ class SimpleA2CAgentAdapter(AgentAdapter):
         model = SimpleA2CModel(
             model_id=model_id,
             version_number=1,
-            actor_network=torch.nn.Sequential(
-                torch.nn.Linear(environment_specs.num_input, actor_network_hidden_size),
-                torch.nn.Tanh(),
-                torch.nn.Linear(actor_network_hidden_size, actor_network_hidden_size),
-                torch.nn.Tanh(),
-                torch.nn.Linear(actor_network_hidden_size, environment_specs.num_action),
-            ).to(self._dtype),
-            critic_network=torch.nn.Sequential(
-                torch.nn.Linear(environment_specs.num_input, critic_network_hidden_size),
-                torch.nn.Tanh(),
-                torch.nn.Linear(critic_network_hidden_size, critic_network_hidden_size),
-                torch.nn.Tanh(),
-                torch.nn.Linear(critic_network_hidden_size, 1),
-            ).to(self._dtype),
+            actor_network=self._create_network(
+                environment_specs.num_input, actor_network_hidden_size, environment_specs.num_action
+            ),
+            critic_network=self._create_network(environment_specs.num_input, critic_network_hidden_size, 1),
         )
 
         model_user_data = {
@@ -89,8 +101,21 @@ class SimpleA2CAgentAdapter(AgentAdapter):
         environment_specs,
         **kwargs,
     ):
-        (actor_network, critic_network) = torch.load(model_data_f)
         assert model_user_data["environment_implementation"] == environment_specs.implementation
+        if is_flat_tensors(model_data_f):
+            # The networks weights are views on the version data, memory mapped when it is cached on disk
+            arrays, metadata = load_flat_tensors(model_data_f)
+            actor_network = self._create_network(
+                environment_specs.num_input, metadata["actor_network_hidden_size"], environment_specs.num_action
+            )
+            assign_arrays_to_module(actor_network, arrays, prefix="actor_network.")
+            critic_network = self._create_network(
+                environment_specs.num_input, metadata["critic_network_hidden_size"], 1
+            )
+            assign_arrays_to_module(critic_network, arrays, prefix="critic_network.")
+        else:
+            # Versions saved before the flat tensors format
+            (actor_network, critic_network) = torch.load(model_data_f)
         assert isinstance(actor_network, torch.nn.Sequential)
         assert isinstance(critic_network, torch.nn.Sequential)
         return SimpleA2CModel(
@@ -100,7 +125,17 @@ class SimpleA2CAgentAdapter(AgentAdapter):
     def _save(self, model, model_user_data, model_data_f, environment_specs, epoch_idx=-1, total_samples=0, **kwargs):
         assert model_user_data["environment_implementation"] == environment_specs.implementation
         assert isinstance(model, SimpleA2CModel)
-        torch.save((model.actor_network, model.critic_network), model_data_f)
+        save_flat_tensors(
+            {
+                **arrays_from_state_dict(model.actor_network.state_dict(), prefix="actor_network."),
+                **arrays_from_state_dict(model.critic_network.state_dict(), prefix="critic_network."),
+            },
+            model_data_f,
+            metadata={
+                "actor_network_hidden_size": model.actor_network[0].out_features,
+                "critic_network_hidden_size": model.critic_network[0].out_features,
+            },
+        )
         return {"epoch_idx": epoch_idx, "total_samples": total_samples}
 
     def _create_actor_implementations(self):
@@ -110,7 +145,7 @@ class SimpleA2CAgentAdapter(AgentAdapter):
             config = actor_session.config
 
             model, _, _ = await self.retrieve_version(
-                config.model_id, config.model_version, environment_specs=config.environment_specs
+                config.model_id, config.model_version, subscribe=True, environment_specs=config.environment_specs
             )
 
             async for event in actor_session.event_loop():
@@ -147,7 +182,9 @@ class SimpleA2CAgentAdapter(AgentAdapter):
             run_sample_producer_session.produce_training_sample((observation, action, reward, done))
 
         async def run_impl(run_session):
-            xp_tracker = MlflowExperimentTracker(run_session.params_name, run_session.run_id)
+            xp_tracker = MlflowExperimentTracker(
+                run_session.params_name, run_session.run_id, aggregated_metrics=["total_reward"]
+            )
 
             # Initializing a model
             model_id = f"{run_session.run_id}_model"
@@ -193,7 +230,7 @@ class SimpleA2CAgentAdapter(AgentAdapter):
                     _tick_id,
                     sample,
                 ) in run_session.start_trials_and_wait_for_termination(
-                    trial_configs=[
+                    trial_configs=TrialConfigTemplate(
                         TrialConfig(
                             run_id=run_session.run_id,
                             environment=config.environment,
@@ -211,8 +248,7 @@ class SimpleA2CAgentAdapter(AgentAdapter):
                                 )
                             ],
                         )
-                        for trial_idx in range(config.training.epoch_trial_count)
-                    ],
+                    ).generate(config.training.epoch_trial_count),
                     max_parallel_trials=config.training.max_parallel_trials,
                 ):
                     (trial_observation, trial_action, trial_reward, trial_done) = sample
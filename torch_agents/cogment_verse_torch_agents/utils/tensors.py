@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import warnings
+
 import numpy as np
 import torch
 from data_pb2 import AgentAction
@@ -31,3 +33,52 @@ def tensor_from_cog_action(cog_action, device=None, dtype=torch.long):
 def cog_action_from_tensor(tensor):
     # TODO also support continuous actions and merge with wrapper.cog_action_from_torch_action
     return AgentAction(discrete_action=tensor.item())
+
+
+def arrays_from_state_dict(state_dict, prefix=""):
+    """
+    Parameters:
+        state_dict (dict[str, torch.Tensor]): The state dict of a module
+        prefix (string - default is ""): Prefix added to the tensors names
+    Returns:
+        arrays (dict[str, numpy.ndarray]): The tensors of the state dict as numpy arrays, e.g. to be saved as flat tensors
+    """
+    return {f"{prefix}{name}": tensor.detach().cpu().numpy() for name, tensor in state_dict.items()}
+
+
+def assign_arrays_to_module(module, arrays, prefix=""):
+    """
+    Make the parameters and buffers of a module use numpy arrays as storage, without copying them
+
+    The arrays can be views on a memory map, shared by every process loading the same model version. Such arrays are
+    read-only, the assigned parameters are not trainable and the module should only be used for inference.
+
+    Parameters:
+        module (torch.nn.Module): The module, whose parameters and buffers are replaced
+        arrays (dict[str, numpy.ndarray]): The arrays, named like in the state dict of the module
+        prefix (string - default is ""): Only the arrays whose name start with this prefix are assigned
+    """
+    state_dict = module.state_dict()
+    for prefixed_name, array in arrays.items():
+        if not prefixed_name.startswith(prefix):
+            continue
+        name = prefixed_name[len(prefix) :]
+        if name not in state_dict:
+            raise KeyError(f"Unexpected tensor [{prefixed_name}]")
+        if tuple(state_dict[name].shape) != array.shape:
+            raise ValueError(
+                f"Unexpected shape {array.shape} for tensor [{prefixed_name}], expected {tuple(state_dict[name].shape)}"
+            )
+
+        with warnings.catch_warnings():
+            # Torch warns when a tensor views a read-only array
+            warnings.simplefilter("ignore", UserWarning)
+            tensor = torch.from_numpy(array)
+
+        submodule_name, _, tensor_name = name.rpartition(".")
+        submodule = module.get_submodule(submodule_name)
+        # pylint: disable=protected-access
+        if tensor_name in submodule._parameters:
+            submodule._parameters[tensor_name] = torch.nn.Parameter(tensor, requires_grad=False)
+        else:
+            submodule._buffers[tensor_name] = tensor
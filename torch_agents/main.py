@@ -41,6 +41,8 @@ MODEL_REGISTRY_ENDPOINT = os.getenv("COGMENT_VERSE_MODEL_REGISTRY_ENDPOINT")
 ORCHESTRATOR_ENDPOINT = os.getenv("COGMENT_VERSE_ORCHESTRATOR_ENDPOINT")
 ACTOR_ENDPOINTS = json.loads(os.getenv("COGMENT_VERSE_ACTOR_ENDPOINTS"))
 ENVIRONMENT_ENDPOINTS = json.loads(os.getenv("COGMENT_VERSE_ENVIRONMENT_ENDPOINTS"))
+MODEL_CACHE_DIR = os.getenv("COGMENT_VERSE_TORCH_AGENTS_MODEL_CACHE_DIR")
+MODEL_CACHE_MAX_BYTES = int(os.getenv("COGMENT_VERSE_TORCH_AGENTS_MODEL_CACHE_MAX_BYTES", str(10 * 1024**3)))
 
 
 logging.basicConfig(level=logging.INFO)
@@ -59,6 +61,8 @@ async def main():
             **ACTOR_ENDPOINTS,
             **ENVIRONMENT_ENDPOINTS,
         },
+        model_registry_disk_cache_dir=MODEL_CACHE_DIR,
+        model_registry_disk_cache_max_bytes=MODEL_CACHE_MAX_BYTES,
     )
 
     hive_adapter = HiveAgentAdapter()